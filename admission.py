@@ -0,0 +1,143 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from time import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being admitted"""
+    pass
+
+class AdmissionController:
+    """
+    Bounds concurrent price calculations and sheds load under pressure
+    
+    At most `max_in_flight` calculations run at once. Further requests wait in
+    a bounded queue and are rejected if the queue is full or their deadline
+    expires before a slot frees up. Above a configurable load or latency
+    threshold the controller reports degraded mode, in which quotes are served
+    without calling paid routing providers.
+    """
+    
+    def __init__(
+        self,
+        max_in_flight: int = 32,
+        max_queue: int = 128,
+        queue_timeout: float = 2.0,
+        degrade_load_ratio: float = 0.8,
+        degrade_latency_ms: float = 3000.0,
+        latency_window: int = 200
+    ):
+        """
+        Args:
+            max_in_flight: Maximum number of concurrent price calculations
+            max_queue: Maximum number of requests waiting for a slot
+            queue_timeout: Seconds a request may wait for a slot before being shed
+            degrade_load_ratio: In-flight ratio (0-1) above which degraded mode is used
+            degrade_latency_ms: Recent p95 latency above which degraded mode is used
+            latency_window: Number of recent calculations used for the p95 estimate
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.degrade_load_ratio = degrade_load_ratio
+        self.degrade_latency_ms = degrade_latency_ms
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.degraded_count = 0
+        self._semaphore = None
+        self._latencies = deque(maxlen=latency_window)
+    
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Create a controller configured from environment variables"""
+        return cls(
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "32")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "128")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0")),
+            degrade_load_ratio=float(os.getenv("DEGRADE_LOAD_RATIO", "0.8")),
+            degrade_latency_ms=float(os.getenv("DEGRADE_LATENCY_MS", "3000"))
+        )
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+    
+    def p95_latency_ms(self) -> float:
+        """Approximate p95 latency of recent calculations in milliseconds"""
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    
+    def is_degraded(self) -> bool:
+        """Whether new quotes should avoid paid routing providers"""
+        if self.queued > 0:
+            return True
+        if self.in_flight >= self.max_in_flight * self.degrade_load_ratio:
+            return True
+        return self.p95_latency_ms() > self.degrade_latency_ms
+    
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """
+        Acquire a calculation slot for the duration of the block
+        
+        Args:
+            deadline: Absolute time (time.time()) after which the request is no
+                longer worth serving; defaults to now + queue_timeout
+        
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passes while waiting
+        """
+        semaphore = self._get_semaphore()
+        
+        if semaphore.locked():
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Server busy: admission queue is full")
+            
+            timeout = (deadline if deadline is not None else time() + self.queue_timeout) - time()
+            if timeout <= 0:
+                self.rejected += 1
+                raise AdmissionRejected("Server busy: request deadline expired")
+            
+            self.queued += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise AdmissionRejected("Server busy: timed out waiting for a calculation slot")
+            finally:
+                self.queued -= 1
+        else:
+            await semaphore.acquire()
+        
+        self.in_flight += 1
+        start_time = time()
+        try:
+            yield
+        finally:
+            self._latencies.append((time() - start_time) * 1000)
+            self.in_flight -= 1
+            semaphore.release()
+    
+    def stats(self) -> dict:
+        """Current admission statistics"""
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "degraded_quotes": self.degraded_count,
+            "p95_latency_ms": round(self.p95_latency_ms(), 1),
+            "degraded": self.is_degraded()
+        }
@@ -0,0 +1,472 @@
+"""
+Offline benchmarks for the geo and pricing hot paths.
+
+Runs without network access: routing providers are replaced by a stub that
+serves recorded (or synthetic) polylines, and zones come from synthetic
+grids at country, province and municipality granularity and, if available,
+the real provinces GeoJSON.
+
+Usage:
+    python benchmarks/bench.py run --save benchmarks/baselines/baseline.json
+    python benchmarks/bench.py run --save current.json --filter zones
+    python benchmarks/bench.py compare benchmarks/baselines/baseline.json current.json --threshold 0.15
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+import polyline
+
+import geo_utils
+from geo_utils import (
+    load_geo_data,
+    haversine_distance,
+    determine_zones_crossed,
+    simplify_route_for_zones,
+    check_fixed_price,
+    evict_fixed_price_candidates,
+    decode_polyline_to_coordinates,
+    decode_polyline_to_array,
+    haversine_segments
+)
+
+# Bounding box of the synthetic province grid (roughly Italy)
+GRID_BOUNDS = (6.6, 36.6, 18.6, 47.1)
+
+# Time-based pricing as it would be configured in production, so quotes pay for the lookups
+BENCH_TIME_MULTIPLIERS = {
+    "night": 1.25,
+    "weekend": 1.15,
+    "holiday": 1.3,
+    "holiday_calendar": "IT",
+    "bands": [{"name": "rush", "days": [0, 1, 2, 3, 4], "hours": [7, 10], "multiplier": 1.1}],
+    "zones": {"RM": {"holidays": ["06-29"]}, "MI": {"night": 1.4, "holidays": ["12-07"]}}
+}
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def synthetic_zones_geojson(
+    cols: int = 10,
+    rows: int = 11,
+    edge_points: int = 150,
+    amplitude: float = 0.03,
+    level: str = "province",
+    bounds: Tuple[float, float, float, float] = GRID_BOUNDS,
+    prefix: str = "P"
+) -> Dict[str, Any]:
+    """
+    Build a grid of zones with wavy shared borders
+    
+    Border perturbations are a function of absolute coordinates and vanish at
+    grid nodes, so neighbouring cells share identical edges, like real
+    administrative boundaries.
+    
+    Args:
+        cols: Number of grid columns
+        rows: Number of grid rows
+        edge_points: Vertices per cell edge (controls polygon complexity)
+        amplitude: Border wiggle in degrees
+        level: Zone level, sets the feature properties ('country', 'province' or 'municipality')
+        bounds: (min_lng, min_lat, max_lng, max_lat) covered by the grid
+        prefix: Prefix of the zone codes
+    """
+    min_lng, min_lat, max_lng, max_lat = bounds
+    w = (max_lng - min_lng) / cols
+    h = (max_lat - min_lat) / rows
+    
+    def vertical_edge(x0, y_from, y_to):
+        ys = [y_from + (y_to - y_from) * k / edge_points for k in range(edge_points)]
+        return [[x0 + amplitude * math.sin(7 * math.pi * (y - min_lat) / h), y] for y in ys]
+    
+    def horizontal_edge(y0, x_from, x_to):
+        xs = [x_from + (x_to - x_from) * k / edge_points for k in range(edge_points)]
+        return [[x, y0 + amplitude * math.sin(7 * math.pi * (x - min_lng) / w)] for x in xs]
+    
+    features = []
+    for i in range(cols):
+        for j in range(rows):
+            x0, x1 = min_lng + i * w, min_lng + (i + 1) * w
+            y0, y1 = min_lat + j * h, min_lat + (j + 1) * h
+            ring = (
+                horizontal_edge(y0, x0, x1)
+                + vertical_edge(x1, y0, y1)
+                + horizontal_edge(y1, x1, x0)
+                + vertical_edge(x0, y1, y0)
+            )
+            ring.append(ring[0])
+            code = f"{prefix}{i:02d}{j:02d}"
+            if level == "country":
+                properties = {"iso_a3": code, "name": f"Country {code}"}
+            elif level == "municipality":
+                properties = {"pro_com_t": code, "comune": f"Municipality {code}"}
+            else:
+                properties = {"prov_istat": code, "prov_acr": code, "prov_name": f"Province {code}"}
+            features.append({
+                "type": "Feature",
+                "properties": properties,
+                "geometry": {"type": "Polygon", "coordinates": [ring]}
+            })
+    
+    return {"type": "FeatureCollection", "features": features}
+
+def synthetic_provinces_geojson(cols: int = 10, rows: int = 11, edge_points: int = 150, amplitude: float = 0.03) -> Dict[str, Any]:
+    """Build a grid of provinces with wavy shared borders (see synthetic_zones_geojson)"""
+    return synthetic_zones_geojson(cols, rows, edge_points, amplitude)
+
+def synthetic_route(start: Tuple[float, float], end: Tuple[float, float], step_km: float, rng: random.Random, wiggle: float = 0.002) -> List[Tuple[float, float]]:
+    """Road-like (lat, lng) polyline from start to end with roughly `step_km` between points"""
+    n = max(2, int(haversine_distance(start, end) / step_km))
+    points = []
+    for k in range(n + 1):
+        t = k / n
+        lat = start[0] + t * (end[0] - start[0])
+        lng = start[1] + t * (end[1] - start[1])
+        if 0 < k < n:
+            lat += rng.uniform(-wiggle, wiggle)
+            lng += rng.uniform(-wiggle, wiggle)
+        points.append((round(lat, 5), round(lng, 5)))
+    return points
+
+def border_heavy_route(rng: random.Random, length: int = 1500) -> List[Tuple[float, float]]:
+    """Route zigzagging across a province border many times"""
+    min_lng, min_lat, max_lng, max_lat = GRID_BOUNDS
+    border_lng = min_lng + 4 * (max_lng - min_lng) / 10
+    lat = 41.0
+    points = []
+    for k in range(length):
+        lat += 0.001
+        offset = 0.05 * (1 if (k // 10) % 2 == 0 else -1) + rng.uniform(-0.005, 0.005)
+        points.append((round(lat, 5), round(border_lng + offset, 5)))
+    return points
+
+def synthetic_fixed_routes(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """Many small fixed-price areas scattered over the grid"""
+    min_lng, min_lat, max_lng, max_lat = GRID_BOUNDS
+    
+    def square(lng, lat, size):
+        return {"type": "Polygon", "coordinates": [[[lng, lat], [lng + size, lat], [lng + size, lat + size], [lng, lat + size], [lng, lat]]]}
+    
+    routes = []
+    for k in range(count):
+        routes.append({
+            "name": f"Fixed route {k}",
+            "vehicle_category": "standard_sedan",
+            "pickup_area": square(rng.uniform(min_lng, max_lng), rng.uniform(min_lat, max_lat), 0.05),
+            "dropoff_area": square(rng.uniform(min_lng, max_lng), rng.uniform(min_lat, max_lat), 0.05),
+            "price": 50.0,
+            "bidirectional": True
+        })
+    return routes
+
+def load_polylines(path: Optional[str], rng: random.Random) -> Dict[str, str]:
+    """
+    Load recorded encoded polylines, or generate synthetic ones
+    
+    Args:
+        path: JSON file mapping name -> encoded polyline, or a provider recording
+            (.ndjson.gz, see provider_tape.py) whose shortest and longest routes are used
+        rng: Random generator for synthetic polylines
+    
+    Returns:
+        Mapping with at least 'short' and 'long' encoded polylines
+    """
+    polylines = {}
+    if path and path.endswith(".gz"):
+        from provider_tape import ProviderTape
+        recorded = []
+        for entry in ProviderTape(mode="replay", path=path).entries():
+            try:
+                route = json.loads(entry["body"])["routes"][0]
+                recorded.append(route["overview_polyline"]["points"] if "overview_polyline" in route else route["geometry"])
+            except (KeyError, IndexError, ValueError):
+                continue
+        if recorded:
+            recorded.sort(key=len)
+            polylines.update(short=recorded[0], long=recorded[-1])
+    elif path and os.path.exists(path):
+        with open(path, "r") as f:
+            polylines.update(json.load(f))
+    
+    # Fiumicino -> Rome centre (~30 km) and Rome -> Naples (~190 km)
+    polylines.setdefault("short", polyline.encode(synthetic_route((41.7999, 12.2462), (41.9028, 12.4964), 0.15, rng)))
+    polylines.setdefault("long", polyline.encode(synthetic_route((41.9028, 12.4964), (40.8518, 14.2681), 0.08, rng)))
+    return polylines
+
+# ---------------------------------------------------------------------------
+# Harness
+# ---------------------------------------------------------------------------
+
+def measure(fn: Callable[[], Any], min_time: float = 0.5, min_iterations: int = 5, max_iterations: int = 10000) -> Dict[str, float]:
+    """
+    Time a function repeatedly
+    
+    Returns:
+        Dictionary with iterations and min/median/p95/mean duration in milliseconds
+    """
+    fn()  # Warm up caches and lazy initialisation
+    
+    timings = []
+    start = perf_counter()
+    while len(timings) < max_iterations and (len(timings) < min_iterations or perf_counter() - start < min_time):
+        t0 = perf_counter()
+        fn()
+        timings.append((perf_counter() - t0) * 1000)
+    
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(timings), 4)
+    }
+
+class StubProvider:
+    """Routing provider stub serving a fixed encoded polyline (split into legs at the waypoints, if any)"""
+    
+    def __init__(self, encoded: str):
+        points = decode_polyline_to_coordinates(encoded)
+        self.points = np.asarray(points)
+        self.route = {
+            "distance": sum(haversine_distance(points[i], points[i + 1]) for i in range(len(points) - 1)),
+            "duration": 60.0,
+            "geometry": encoded,
+            "source": "google_maps"
+        }
+        self.calls = 0
+    
+    def __call__(self, pickup, dropoff, depart_at=None, api_key=None, waypoints=None):
+        self.calls += 1
+        route = dict(self.route)
+        if waypoints:
+            # Legs end at the route vertices nearest to the waypoints
+            splits = [0] + [int(np.argmin(((self.points - waypoint) ** 2).sum(axis=1))) for waypoint in waypoints] + [len(self.points) - 1]
+            along = np.concatenate(([0.0], np.cumsum(haversine_segments(self.points))))
+            route["legs"] = [
+                {"distance": float(along[end] - along[start]), "duration": 60.0 * (end - start) / (len(self.points) - 1)}
+                for start, end in zip(splits, splits[1:])
+            ]
+        return route
+
+def build_cases(args) -> Dict[str, Callable[[], Any]]:
+    """Create the benchmark cases, keyed by name"""
+    rng = random.Random(args.seed)
+    tmp_dir = tempfile.mkdtemp(prefix="pricing-bench-")
+    
+    def write_geojson(filename, data):
+        path = os.path.join(tmp_dir, filename)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return path
+    
+    def lazy_geo_data(build):
+        # Geo data is loaded on the first (warm-up) call of a case using it, so large
+        # sets are only held in memory by the cases that come after them
+        loaded = []
+        def get():
+            if not loaded:
+                loaded.append(build())
+            return loaded[0]
+        return get
+    
+    def country_grid():
+        # Country granularity: a few large, detailed zones as the only layer
+        return load_geo_data(write_geojson("synthetic_country_grid.geojson", synthetic_zones_geojson(3, 3, 1500)), layers={})
+    
+    def municipality_grid():
+        # Municipality granularity: countries > provinces > ~7000 municipalities, plus a
+        # neighbouring country without finer layers
+        countries = synthetic_zones_geojson(1, 1, 200, 0.0, "country", GRID_BOUNDS, "C")
+        countries["features"] += synthetic_zones_geojson(1, 1, 200, 0.0, "country", (2.6, 36.6, 6.6, 47.1), "F")["features"]
+        layers = {
+            "country": write_geojson("synthetic_countries.geojson", countries),
+            "municipality": write_geojson(
+                "synthetic_municipalities.geojson",
+                synthetic_zones_geojson(80, 88, 20, 0.004, "municipality", GRID_BOUNDS, "M")
+            )
+        }
+        return load_geo_data(synthetic_path, layers=layers)
+    
+    synthetic_path = write_geojson("synthetic_provinces.geojson", synthetic_provinces_geojson())
+    geo_sets = {
+        "synthetic_country": lazy_geo_data(country_grid),
+        "synthetic": lazy_geo_data(lambda: load_geo_data(synthetic_path, layers={}))
+    }
+    if args.geojson and os.path.exists(args.geojson):
+        geo_sets["real"] = lazy_geo_data(lambda: load_geo_data(args.geojson))
+    # Holding thousands of zones in memory slows allocation-heavy code in the same
+    # process, so the municipality set is measured last
+    geo_sets["synthetic_municipality"] = lazy_geo_data(municipality_grid)
+    
+    polylines = load_polylines(args.polylines, rng)
+    short_points = decode_polyline_to_coordinates(polylines["short"])
+    long_points = decode_polyline_to_coordinates(polylines["long"])
+    long_array = decode_polyline_to_array(polylines["long"])
+    border_points = border_heavy_route(rng)
+    fixed_routes = synthetic_fixed_routes(500, rng)
+    pairs = [((rng.uniform(36.6, 47.1), rng.uniform(6.6, 18.6)), (rng.uniform(36.6, 47.1), rng.uniform(6.6, 18.6))) for _ in range(1000)]
+    
+    from calendar_index import CalendarIndex
+    calendar = CalendarIndex(BENCH_TIME_MULTIPLIERS)
+    year_start = datetime(datetime.now().year, 1, 1)
+    pickup_times = [year_start + timedelta(minutes=rng.randrange(365 * 24 * 60)) for _ in range(1000)]
+    pickup_times_array = np.array(pickup_times, dtype="datetime64[m]")
+    
+    cases = {
+        "haversine_distance_x1000": lambda: [haversine_distance(a, b) for a, b in pairs],
+        "decode_polyline_long": lambda: decode_polyline_to_coordinates(polylines["long"]),
+        "decode_polyline_long_array": lambda: decode_polyline_to_array(polylines["long"]),
+        "haversine_segments_long": lambda: haversine_segments(long_array),
+        "check_fixed_price_500_routes_miss": lambda: check_fixed_price((41.8, 12.25), (41.9, 12.5), "standard_sedan", fixed_routes),
+        "check_fixed_price_500_routes_cold_pickup": lambda: (evict_fixed_price_candidates(1.0), check_fixed_price((41.8, 12.25), (41.9, 12.5), "standard_sedan", fixed_routes)),
+        "time_multiplier_lookup_x1000": lambda: [calendar.lookup(t, "RM") for t in pickup_times],
+        "time_multipliers_vectorized_x1000": lambda: calendar.multipliers(pickup_times_array, "RM"),
+    }
+    
+    def simplified_zones(points, geo_data):
+        zone_points, segment_lengths = simplify_route_for_zones(points, geo_data, tolerance_m=100)
+        return determine_zones_crossed(zone_points, geo_data, segment_lengths)
+    
+    # Full all-category quote against a stubbed provider
+    from config import Config
+    from pricing import calculate_price, calculate_itinerary_prices, estimate_route
+    
+    config = Config(config_dir=os.path.join(tmp_dir, "config"), use_supabase=False)
+    config.time_multipliers = BENCH_TIME_MULTIPLIERS
+    stub = StubProvider(polylines["long"])
+    geo_utils.ROUTING_PROVIDERS["google_maps"] = stub
+    geo_utils.quota_manager.acquire = lambda provider, priority="interactive": "bench-key"
+    pickup_time = datetime(2024, 5, 1, 10, 0)
+    
+    def full_quote(geo_data):
+        geo_utils.route_cache.clear()
+        return [
+            calculate_price(41.9028, 12.4964, 40.8518, 14.2681, category, pickup_time, config, geo_data, "1", ["google_maps"])
+            for category in config.vehicle_rates
+        ]
+    
+    # Four-stop itinerary along the long route, priced for all categories at once
+    long_route_points = decode_polyline_to_coordinates(polylines["long"])
+    itinerary_stops = [long_route_points[int(k * (len(long_route_points) - 1) / 3)] for k in range(4)]
+    
+    def itinerary_quote(geo_data):
+        geo_utils.route_cache.clear()
+        return calculate_itinerary_prices(itinerary_stops, list(config.vehicle_rates), pickup_time, config, geo_data, ["google_maps"])
+    
+    for name, g in geo_sets.items():
+        cases[f"zones_crossed_short_{name}"] = lambda g=g: determine_zones_crossed(short_points, g())
+        cases[f"zones_crossed_long_{name}"] = lambda g=g: determine_zones_crossed(long_points, g())
+        cases[f"zones_crossed_border_heavy_{name}"] = lambda g=g: determine_zones_crossed(border_points, g())
+        cases[f"zones_crossed_long_simplified_{name}"] = lambda g=g: simplified_zones(long_points, g())
+        cases[f"calculate_price_all_categories_{name}"] = lambda g=g: full_quote(g())
+        cases[f"itinerary_4_stops_all_categories_{name}"] = lambda g=g: itinerary_quote(g())
+        cases[f"estimate_route_{name}"] = lambda g=g: estimate_route((41.9028, 12.4964), (40.8518, 14.2681), g())
+    
+    return cases
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip() or None
+    except Exception:
+        return None
+
+def run(args) -> int:
+    logging.disable(logging.CRITICAL)
+    cases = build_cases(args)
+    
+    results = {}
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, min_time=args.min_time)
+        print(f"{name:50s} median {results[name]['median_ms']:10.3f} ms   p95 {results[name]['p95_ms']:10.3f} ms   ({results[name]['iterations']} runs)")
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed
+        },
+        "results": results
+    }
+    
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.save}")
+    return 0
+
+def compare(args) -> int:
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)["results"]
+    with open(args.current, "r") as f:
+        current = json.load(f)["results"]
+    
+    regressions = 0
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            print(f"{name:50s} {'only in ' + ('current' if name in current else 'baseline'):>30s}")
+            continue
+        
+        before = baseline[name][args.metric]
+        after = current[name][args.metric]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "improved"
+        print(f"{name:50s} {before:10.3f} -> {after:10.3f} ms  {change:+7.1%}  {flag}")
+    
+    if regressions:
+        print(f"{regressions} benchmark(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks for geo and pricing hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    run_parser = subparsers.add_parser("run", help="Run benchmarks")
+    run_parser.add_argument("--save", help="Write machine-readable results to this JSON file")
+    run_parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    run_parser.add_argument("--geojson", default=os.getenv("GEOJSON_PATH", os.path.join(REPO_ROOT, "data", "editedITprov.geojson")),
+                            help="Real provinces GeoJSON (skipped if missing)")
+    run_parser.add_argument("--polylines", help="JSON file of encoded polylines (name -> polyline) or a provider recording (.ndjson.gz)")
+    run_parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds to spend per benchmark")
+    run_parser.add_argument("--seed", type=int, default=42, help="Seed for synthetic data")
+    run_parser.set_defaults(func=run)
+    
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a baseline")
+    compare_parser.add_argument("baseline", help="Baseline results JSON")
+    compare_parser.add_argument("current", help="Current results JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown flagged as a regression")
+    compare_parser.add_argument("--metric", default="median_ms", choices=["min_ms", "median_ms", "p95_ms", "mean_ms"])
+    compare_parser.set_defaults(func=compare)
+    
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Compare two bulk pricing outputs of the same input, e.g. the same production
+traffic capture priced by two engine versions against replayed provider
+responses.
+
+Usage:
+    PROVIDER_TAPE_MODE=replay PROVIDER_REPLAY_LATENCY=zero \\
+        python bulk_pricing.py capture.ndjson -o new.ndjson --providers google_maps,mapbox
+    python benchmarks/compare_prices.py old.ndjson new.ndjson --tolerance 0.01
+
+Rows are matched by position. Reports rows whose prices differ (per category)
+and per-row timing percentiles of both runs. Exits non-zero if any price differs.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Any, List, Iterator, Optional
+
+def read_ndjson(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))], 3)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare prices and timings of two bulk pricing runs")
+    parser.add_argument("baseline", help="Bulk pricing output (NDJSON) of the reference engine")
+    parser.add_argument("candidate", help="Bulk pricing output (NDJSON) of the new engine")
+    parser.add_argument("--field", choices=["prices", "raw_prices"], default="prices", help="Prices to compare")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Absolute price difference ignored")
+    parser.add_argument("--show", type=int, default=10, help="Number of differing rows to print")
+    args = parser.parse_args(argv)
+    
+    rows = 0
+    differing_rows = 0
+    differences_by_category = {}
+    max_difference = 0.0
+    timings = {"baseline": [], "candidate": []}
+    shown = 0
+    
+    for index, (before, after) in enumerate(zip(read_ndjson(args.baseline), read_ndjson(args.candidate))):
+        rows += 1
+        for name, row in (("baseline", before), ("candidate", after)):
+            if "elapsed_ms" in row:
+                timings[name].append(row["elapsed_ms"])
+        
+        old_prices = before.get(args.field) or {}
+        new_prices = after.get(args.field) or {}
+        row_differs = bool(before.get("error")) != bool(after.get("error"))
+        
+        for category in sorted(set(old_prices) | set(new_prices)):
+            old_price = old_prices.get(category)
+            new_price = new_prices.get(category)
+            if old_price is None or new_price is None:
+                difference = float("inf")
+            else:
+                difference = abs(new_price - old_price)
+            if difference > args.tolerance:
+                row_differs = True
+                differences_by_category[category] = differences_by_category.get(category, 0) + 1
+                max_difference = max(max_difference, difference)
+        
+        if row_differs:
+            differing_rows += 1
+            if shown < args.show:
+                shown += 1
+                print(f"row {index}: {old_prices or before.get('error')} -> {new_prices or after.get('error')}")
+    
+    report = {
+        "rows": rows,
+        "differing_rows": differing_rows,
+        "differences_by_category": differences_by_category,
+        "max_difference": max_difference,
+        "timing_ms": {name: percentiles(values) for name, values in timings.items()}
+    }
+    print(json.dumps(report, indent=2))
+    return 1 if differing_rows else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+End-to-end load test of the pricing API against a local provider simulator.
+
+Starts the provider simulator and the FastAPI app (uvicorn, N workers), then
+replays a request mix at a target rate (open loop: requests are sent on
+schedule whether or not earlier ones have completed) and reports latency
+percentiles, status codes, provider calls and CPU/RSS per server process.
+
+Usage:
+    python benchmarks/load_test.py --mix airport --rps 50 --duration 30
+    python benchmarks/load_test.py --mix repeat --rps 200 --workers 4 --latency google_maps=250:0.5
+    python benchmarks/load_test.py --url http://127.0.0.1:8080 --mix batch --rps 20   # existing server
+    python benchmarks/load_test.py --mix airport --instances 3 --cluster   # 3 instances sharing routes
+
+Request mixes:
+    airport  transfers between the main airports and nearby city centres
+    repeat   a small pool of identical trips (exercises the quote and route caches)
+    batch    unique long-distance trips across Italy, as in partner rate sheets
+    mixed    60% airport, 30% repeat, 10% batch
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter, sleep, time
+from typing import Dict, Any, List, Optional, Callable
+
+import aiohttp
+
+REPO_ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from provider_simulator import ProviderSimulator, profiles_from_args, add_simulator_arguments
+
+AIRPORTS = {
+    "FCO": (41.7999, 12.2462),
+    "CIA": (41.7994, 12.5949),
+    "MXP": (45.6306, 8.7281),
+    "LIN": (45.4451, 9.2767),
+    "NAP": (40.8860, 14.2908),
+    "VCE": (45.5053, 12.3519),
+    "BLQ": (44.5354, 11.2887),
+    "FLR": (43.8100, 11.2051)
+}
+
+CITIES = {
+    "FCO": (41.9028, 12.4964),
+    "CIA": (41.9028, 12.4964),
+    "MXP": (45.4642, 9.1900),
+    "LIN": (45.4642, 9.1900),
+    "NAP": (40.8518, 14.2681),
+    "VCE": (45.4408, 12.3155),
+    "BLQ": (44.4949, 11.3426),
+    "FLR": (43.7696, 11.2558)
+}
+
+# ---------------------------------------------------------------------------
+# Request mixes
+# ---------------------------------------------------------------------------
+
+def _jitter(point, rng: random.Random, amount: float = 0.03):
+    return (round(point[0] + rng.uniform(-amount, amount), 6), round(point[1] + rng.uniform(-amount, amount), 6))
+
+def _pickup_time(rng: random.Random) -> str:
+    base = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return (base + timedelta(minutes=15 * rng.randrange(0, 4 * 24 * 14))).isoformat()
+
+def _payload(pickup, dropoff, pickup_time: str, trip_type: str = "1", vehicle_category: Optional[str] = None) -> Dict[str, Any]:
+    payload = {
+        "pickup_lat": pickup[0],
+        "pickup_lng": pickup[1],
+        "dropoff_lat": dropoff[0],
+        "dropoff_lng": dropoff[1],
+        "pickup_time": pickup_time,
+        "trip_type": trip_type
+    }
+    if vehicle_category:
+        payload["vehicle_category"] = vehicle_category
+    return payload
+
+def airport_request(rng: random.Random) -> Dict[str, Any]:
+    code = rng.choice(list(AIRPORTS))
+    airport = _jitter(AIRPORTS[code], rng, 0.002)
+    city = _jitter(CITIES[code], rng)
+    if rng.random() < 0.7:
+        return _payload(airport, city, _pickup_time(rng))
+    return _payload(city, airport, _pickup_time(rng), trip_type=rng.choice(["1", "2"]))
+
+def make_repeat_generator(seed: int, pool_size: int = 20) -> Callable[[random.Random], Dict[str, Any]]:
+    pool_rng = random.Random(seed)
+    pool = [airport_request(pool_rng) for _ in range(pool_size)]
+    return lambda rng: dict(rng.choice(pool))
+
+def batch_request(rng: random.Random) -> Dict[str, Any]:
+    origin, destination = rng.sample(list(CITIES.values()), 2)
+    return _payload(_jitter(origin, rng, 0.1), _jitter(destination, rng, 0.1), _pickup_time(rng),
+                    vehicle_category=rng.choice(["standard_sedan", "premium_sedan", "standard_minivan"]))
+
+def make_mix(name: str, seed: int) -> Callable[[random.Random], Dict[str, Any]]:
+    """Return a request generator for a named mix"""
+    repeat_request = make_repeat_generator(seed)
+    if name == "airport":
+        return airport_request
+    if name == "repeat":
+        return repeat_request
+    if name == "batch":
+        return batch_request
+    
+    def mixed(rng):
+        roll = rng.random()
+        if roll < 0.6:
+            return airport_request(rng)
+        if roll < 0.9:
+            return repeat_request(rng)
+        return batch_request(rng)
+    
+    return mixed
+
+# ---------------------------------------------------------------------------
+# Process accounting (Linux /proc)
+# ---------------------------------------------------------------------------
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def process_tree(root_pid: int) -> List[int]:
+    """The root process and all of its descendants"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, IndexError):
+            continue
+    
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+def process_sample(pid: int) -> Optional[Dict[str, Any]]:
+    """CPU seconds and memory of a process from /proc"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status", "r") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+    except OSError:
+        return None
+    
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS,
+        "rss_mb": int(status.get("VmRSS", "0 kB").split()[0]) / 1024,
+        "peak_rss_mb": int(status.get("VmHWM", "0 kB").split()[0]) / 1024,
+        "cmdline": cmdline[:80]
+    }
+
+def sample_processes(root_pid: Optional[int]) -> Dict[int, Dict[str, Any]]:
+    if root_pid is None or not os.path.exists("/proc"):
+        return {}
+    samples = {pid: process_sample(pid) for pid in process_tree(root_pid)}
+    return {pid: sample for pid, sample in samples.items() if sample}
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return round(sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))], 2)
+
+async def run_load(urls: List[str], generator, rps: float, duration: float, seed: int, timeout: float) -> Dict[str, Any]:
+    """
+    Send requests on an open-loop schedule and collect results
+    
+    Requests are spread round-robin over the servers, as a load balancer would.
+    
+    Returns:
+        Dictionary with latencies (ms) by status code and client-side errors
+    """
+    rng = random.Random(seed)
+    results = []
+    total = int(rps * duration)
+    
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        
+        async def send(url, payload):
+            start = perf_counter()
+            try:
+                async with session.post(f"{url}/check-price", json=payload) as response:
+                    body = await response.read()
+                    degraded = response.status == 200 and b'"degraded":true' in body
+                    results.append((response.status, (perf_counter() - start) * 1000, degraded))
+            except Exception as e:
+                results.append((type(e).__name__, (perf_counter() - start) * 1000, False))
+        
+        tasks = []
+        start = perf_counter()
+        for i in range(total):
+            delay = start + i / rps - perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(urls[i % len(urls)], generator(rng))))
+        send_window = perf_counter() - start
+        await asyncio.gather(*tasks)
+        elapsed = perf_counter() - start
+    
+    return {"results": results, "elapsed": elapsed, "send_window": send_window}
+
+def summarize(load: Dict[str, Any], provider_calls: Dict[str, Any], processes: Dict[str, Any], args) -> Dict[str, Any]:
+    results = load["results"]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    
+    all_latencies = sorted(latency for _, latency, _ in results)
+    ok_latencies = sorted(latency for status, latency, _ in results if status == 200)
+    errors = sum(count for status, count in statuses.items() if status not in ("200", "304"))
+    
+    return {
+        "mix": args.mix,
+        "instances": args.instances,
+        "cluster": args.cluster,
+        "target_rps": args.rps,
+        "achieved_rps": round(len(results) / load["send_window"], 1) if load["send_window"] else None,
+        "completed_rps": round(len(ok_latencies) / load["elapsed"], 1) if load["elapsed"] else None,
+        "requests": len(results),
+        "statuses": statuses,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "degraded_quotes": sum(1 for _, _, degraded in results if degraded),
+        "latency_ms": {
+            "p50": percentile(ok_latencies, 0.50),
+            "p95": percentile(ok_latencies, 0.95),
+            "p99": percentile(ok_latencies, 0.99),
+            "max": round(ok_latencies[-1], 2) if ok_latencies else None
+        },
+        "latency_all_ms": {
+            "p50": percentile(all_latencies, 0.50),
+            "p99": percentile(all_latencies, 0.99)
+        },
+        "provider_calls": provider_calls,
+        "processes": processes
+    }
+
+def wait_for_health(url: str, timeout: float = 120.0) -> None:
+    import requests
+    deadline = time() + timeout
+    while time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not become healthy within {timeout}s")
+
+def start_server(args, simulator_url: str, port: int, cluster_peers: Optional[List[str]] = None) -> subprocess.Popen:
+    """Start the API under uvicorn, pointed at the simulator for all providers, optionally as a cluster member"""
+    env = dict(os.environ)
+    env.update({
+        "GOOGLE_MAPS_BASE_URL": simulator_url,
+        "MAPBOX_BASE_URL": simulator_url,
+        "LOCAL_ROUTING_URL": simulator_url,
+        "GOOGLE_MAPS_API_KEY": env.get("LOAD_TEST_GOOGLE_KEYS", "sim-google-key"),
+        "MAPBOX_API_KEY": env.get("LOAD_TEST_MAPBOX_KEYS", "sim-mapbox-key"),
+        "SUPABASE_REFRESH_INTERVAL": "0"
+    })
+    if args.no_supabase:
+        env["SUPABASE_URL"] = ""
+        env["SUPABASE_SERVICE_KEY"] = ""
+    if cluster_peers:
+        env["CLUSTER_PEERS"] = ",".join(cluster_peers)
+        env["CLUSTER_SELF"] = f"http://127.0.0.1:{port}"
+        env.setdefault("CLUSTER_TOKEN", "load-test-cluster-token")
+    
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers),
+        "--log-level", "warning", "--no-access-log"
+    ]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL if args.quiet_server else None, stderr=subprocess.STDOUT if args.quiet_server else None)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the pricing API against a local provider simulator")
+    parser.add_argument("--mix", choices=["airport", "repeat", "batch", "mixed"], default="mixed", help="Request mix")
+    parser.add_argument("--rps", type=float, default=20.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send requests for")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of unrecorded warm-up traffic")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8089, help="Port for the API server (the first one with --instances)")
+    parser.add_argument("--instances", type=int, default=1, help="API servers on consecutive ports, each with its own caches")
+    parser.add_argument("--cluster", action="store_true", help="Run the instances in cluster mode, sharing routes by owner")
+    parser.add_argument("--url", help="Load test an already running server instead of starting one")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Client timeout per request in seconds")
+    parser.add_argument("--no-supabase", action="store_true", help="Start the server without Supabase credentials")
+    parser.add_argument("--quiet-server", action="store_true", help="Discard server output")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    add_simulator_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    simulator = None
+    servers = []
+    urls = [args.url] if args.url else []
+    
+    try:
+        if not urls:
+            simulator = ProviderSimulator(
+                profiles=profiles_from_args(args.latency, args.error_rate),
+                points_per_km=args.points_per_km,
+                seed=args.seed
+            ).start()
+            urls = [f"http://127.0.0.1:{args.port + k}" for k in range(args.instances)]
+            for k in range(args.instances):
+                servers.append(start_server(args, simulator.url, args.port + k, urls if args.cluster else None))
+        for url in urls:
+            wait_for_health(url)
+        
+        generator = make_mix(args.mix, args.seed)
+        if args.warmup > 0:
+            asyncio.run(run_load(urls, generator, args.rps, args.warmup, args.seed + 1, args.timeout))
+        
+        def sample_servers():
+            samples = {}
+            for server in servers:
+                samples.update(sample_processes(server.pid))
+            return samples
+        
+        calls_before = simulator.stats() if simulator else {}
+        processes_before = sample_servers()
+        
+        load = asyncio.run(run_load(urls, generator, args.rps, args.duration, args.seed, args.timeout))
+        
+        processes_after = sample_servers()
+        provider_calls = {}
+        if simulator:
+            for provider, counts in simulator.stats().items():
+                provider_calls[provider] = {
+                    outcome: count - calls_before.get(provider, {}).get(outcome, 0)
+                    for outcome, count in counts.items()
+                }
+        
+        processes = {}
+        for pid, after in processes_after.items():
+            before = processes_before.get(pid, {"cpu_seconds": 0.0})
+            processes[str(pid)] = {
+                "cmdline": after["cmdline"],
+                "cpu_percent": round((after["cpu_seconds"] - before["cpu_seconds"]) / load["elapsed"] * 100, 1),
+                "rss_mb": round(after["rss_mb"], 1),
+                "peak_rss_mb": round(after["peak_rss_mb"], 1)
+            }
+        
+        report = summarize(load, provider_calls, processes, args)
+    finally:
+        for server in servers:
+            server.send_signal(signal.SIGINT)
+        for server in servers:
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if simulator:
+            simulator.stop()
+    
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Local simulator for the routing providers used by geo_utils.
+
+Serves the Google Directions, Mapbox Directions and OSRM response formats
+with configurable latency, error rate and polyline density, so the service
+can be load tested without spending on paid APIs. Point the app at it with:
+
+    GOOGLE_MAPS_BASE_URL=http://127.0.0.1:9100
+    MAPBOX_BASE_URL=http://127.0.0.1:9100
+    LOCAL_ROUTING_URL=http://127.0.0.1:9100
+
+Usage:
+    python benchmarks/provider_simulator.py --port 9100 --latency google_maps=150:0.4 --error-rate mapbox=0.05
+
+Call counts per provider and outcome are available at GET /_stats.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Tuple, Optional
+from urllib.parse import urlsplit, parse_qs
+
+import polyline
+
+PROVIDERS = ["google_maps", "mapbox", "local"]
+
+# Two or more "lng,lat" coordinates separated by ';'
+_MAPBOX_PATH = re.compile(r"^/directions/v5/mapbox/driving/((?:[-\d.]+,[-\d.]+;)+[-\d.]+,[-\d.]+)$")
+_OSRM_PATH = re.compile(r"^/route/v1/driving/((?:[-\d.]+,[-\d.]+;)+[-\d.]+,[-\d.]+)$")
+
+class ProviderProfile:
+    """Latency and error behaviour of one simulated provider"""
+    
+    def __init__(self, median_ms: float = 100.0, sigma: float = 0.3, error_rate: float = 0.0):
+        """
+        Args:
+            median_ms: Median response latency in milliseconds
+            sigma: Log-normal shape parameter (0 = constant latency)
+            error_rate: Fraction of requests answered with an error
+        """
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+    
+    def sample_latency(self, rng: random.Random) -> float:
+        """Latency in seconds drawn from a log-normal distribution"""
+        return self.median_ms * math.exp(self.sigma * rng.gauss(0, 1)) / 1000
+
+class ProviderSimulator:
+    """HTTP server answering Google, Mapbox and OSRM routing requests"""
+    
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        profiles: Optional[Dict[str, ProviderProfile]] = None,
+        points_per_km: float = 5.0,
+        circuity: float = 1.3,
+        speed_kmh: float = 60.0,
+        seed: int = 0
+    ):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            profiles: Provider name -> latency/error profile
+            points_per_km: Polyline density of generated routes
+            circuity: Road distance divided by straight-line distance
+            speed_kmh: Average speed used for durations
+            seed: Random seed
+        """
+        self.profiles = {name: ProviderProfile() for name in PROVIDERS}
+        self.profiles.update(profiles or {})
+        self.points_per_km = points_per_km
+        self.circuity = circuity
+        self.speed_kmh = speed_kmh
+        self.counts = {name: {"success": 0, "error": 0} for name in PROVIDERS}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self) -> "ProviderSimulator":
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Calls per provider and outcome"""
+        with self._lock:
+            return {name: dict(counts) for name, counts in self.counts.items()}
+    
+    def build_route(self, pickup: Tuple[float, float], dropoff: Tuple[float, float]) -> Dict[str, Any]:
+        """
+        Generate a road-like route between two (lat, lng) points
+        
+        Returns:
+            Dictionary with distance (m), duration (s) and encoded polyline
+        """
+        distance_km, points = self._route_points(pickup, dropoff)
+        return {
+            "distance": round(distance_km * 1000),
+            "duration": round(distance_km / self.speed_kmh * 3600),
+            "geometry": polyline.encode(points)
+        }
+    
+    def build_multi_stop_route(self, stops: List[Tuple[float, float]]) -> Dict[str, Any]:
+        """
+        Generate a route through two or more (lat, lng) stops
+        
+        Returns:
+            Dictionary with total distance (m) and duration (s), per-leg distance
+            and duration, and the encoded polyline of the whole route
+        """
+        legs = []
+        points = []
+        for pickup, dropoff in zip(stops, stops[1:]):
+            distance_km, leg_points = self._route_points(pickup, dropoff)
+            legs.append({
+                "distance": round(distance_km * 1000),
+                "duration": round(distance_km / self.speed_kmh * 3600)
+            })
+            # Consecutive legs share their stop
+            points.extend(leg_points if not points else leg_points[1:])
+        
+        return {
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "legs": legs,
+            "geometry": polyline.encode(points)
+        }
+    
+    def _route_points(self, pickup: Tuple[float, float], dropoff: Tuple[float, float]) -> Tuple[float, List[Tuple[float, float]]]:
+        lat1, lng1, lat2, lng2 = map(math.radians, [pickup[0], pickup[1], dropoff[0], dropoff[1]])
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        straight_km = 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+        distance_km = max(straight_km * self.circuity, 0.05)
+        
+        n = max(2, int(distance_km * self.points_per_km))
+        with self._lock:
+            noise = [(self._rng.uniform(-0.002, 0.002), self._rng.uniform(-0.002, 0.002)) for _ in range(n + 1)]
+        
+        points = []
+        for k in range(n + 1):
+            t = k / n
+            lat = pickup[0] + t * (dropoff[0] - pickup[0])
+            lng = pickup[1] + t * (dropoff[1] - pickup[1])
+            if 0 < k < n:
+                lat += noise[k][0]
+                lng += noise[k][1]
+            points.append((lat, lng))
+        
+        return distance_km, points
+    
+    def _respond(self, provider: str, stops: List[Tuple[float, float]]) -> Tuple[int, Dict[str, Any]]:
+        profile = self.profiles[provider]
+        with self._lock:
+            latency = profile.sample_latency(self._rng)
+            failed = self._rng.random() < profile.error_rate
+            self.counts[provider]["error" if failed else "success"] += 1
+        time.sleep(latency)
+        
+        if failed:
+            if provider == "google_maps":
+                return 200, {"status": "OVER_QUERY_LIMIT", "routes": [], "error_message": "Simulated quota error"}
+            if provider == "mapbox":
+                return 429, {"message": "Too Many Requests"}
+            return 500, {"code": "Error", "message": "Simulated routing error"}
+        
+        route = self.build_multi_stop_route(stops)
+        
+        if provider == "google_maps":
+            return 200, {
+                "status": "OK",
+                "routes": [{
+                    "overview_polyline": {"points": route["geometry"]},
+                    "legs": [
+                        {"distance": {"value": leg["distance"]}, "duration": {"value": leg["duration"]}}
+                        for leg in route["legs"]
+                    ]
+                }]
+            }
+        if provider == "mapbox":
+            return 200, {"code": "Ok", "routes": [route]}
+        return 200, {"code": "Ok", "routes": [route]}
+    
+    def _make_handler(self):
+        simulator = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send(self, status: int, body: Dict[str, Any]):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def do_GET(self):
+                parsed = urlsplit(self.path)
+                
+                try:
+                    if parsed.path == "/_stats":
+                        return self._send(200, simulator.stats())
+                    
+                    if parsed.path == "/maps/api/directions/json":
+                        query = parse_qs(parsed.query)
+                        pickup = tuple(float(v) for v in query["origin"][0].split(","))
+                        dropoff = tuple(float(v) for v in query["destination"][0].split(","))
+                        waypoints = [
+                            tuple(float(v) for v in waypoint.split(","))
+                            for waypoint in query.get("waypoints", [""])[0].split("|") if waypoint
+                        ]
+                        return self._send(*simulator._respond("google_maps", [pickup, *waypoints, dropoff]))
+                    
+                    for provider, pattern in (("mapbox", _MAPBOX_PATH), ("local", _OSRM_PATH)):
+                        match = pattern.match(parsed.path)
+                        if match:
+                            stops = []
+                            for coordinate in match.group(1).split(";"):
+                                lng, lat = (float(v) for v in coordinate.split(","))
+                                stops.append((lat, lng))
+                            return self._send(*simulator._respond(provider, stops))
+                    
+                    self._send(404, {"error": f"Unknown path {parsed.path}"})
+                except Exception as e:
+                    self._send(400, {"error": str(e)})
+        
+        return Handler
+
+def parse_provider_values(values: List[str]) -> Dict[str, str]:
+    """Parse repeated provider=value options, e.g. ['google_maps=150:0.4']"""
+    result = {}
+    for item in values or []:
+        name, _, value = item.partition("=")
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown provider '{name}', expected one of {', '.join(PROVIDERS)}")
+        result[name] = value
+    return result
+
+def profiles_from_args(latencies: List[str], error_rates: List[str]) -> Dict[str, ProviderProfile]:
+    """
+    Build provider profiles from CLI options
+    
+    Args:
+        latencies: provider=median_ms[:sigma] entries
+        error_rates: provider=fraction entries
+    """
+    profiles = {name: ProviderProfile() for name in PROVIDERS}
+    for name, value in parse_provider_values(latencies).items():
+        median, _, sigma = value.partition(":")
+        profiles[name].median_ms = float(median)
+        if sigma:
+            profiles[name].sigma = float(sigma)
+    for name, value in parse_provider_values(error_rates).items():
+        profiles[name].error_rate = float(value)
+    return profiles
+
+def add_simulator_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shared by the simulator and the load test harness"""
+    parser.add_argument("--latency", action="append", default=[], metavar="PROVIDER=MEDIAN_MS[:SIGMA]",
+                        help="Log-normal latency per provider, e.g. google_maps=150:0.4 (default 100 ms, sigma 0.3)")
+    parser.add_argument("--error-rate", action="append", default=[], metavar="PROVIDER=FRACTION",
+                        help="Fraction of failed responses per provider, e.g. mapbox=0.05")
+    parser.add_argument("--points-per-km", type=float, default=5.0, help="Polyline density of simulated routes")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate Google, Mapbox and OSRM routing APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_simulator_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    simulator = ProviderSimulator(
+        host=args.host,
+        port=args.port,
+        profiles=profiles_from_args(args.latency, args.error_rate),
+        points_per_km=args.points_per_km,
+        seed=args.seed
+    )
+    print(f"Provider simulator listening on {simulator.url}")
+    try:
+        simulator._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Local stand-in for the Supabase services used by supabase_client.
+
+Serves the pricing tables over the subset of PostgREST the config sync uses
+(column selection and eq/in filters) and pushes row changes over a
+Realtime-compatible websocket, so incremental sync and subscribe mode can be
+run and tested without a Supabase project. Point the app at it with:
+    
+    SUPABASE_REST_URL=http://127.0.0.1:9200/rest/v1
+    SUPABASE_REALTIME_URL=ws://127.0.0.1:9200/realtime/v1/websocket
+    SUPABASE_SYNC_MODE=subscribe
+
+Rows are changed with PUT /_rows/<table> (a JSON row with an id) and
+DELETE /_rows/<table>/<id>; every change is pushed to the subscribers.
+Request counts per table are available at GET /_stats.
+
+Usage:
+    python benchmarks/supabase_simulator.py --port 9200 --rows rows.json
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web, WSMsgType
+
+REALTIME_TOPIC = "realtime:pricing-config"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _filter_values(value: str) -> List[str]:
+    """Values of an eq.x or in.(x,"y") PostgREST filter"""
+    operator, _, operand = value.partition(".")
+    if operator == "in":
+        return [item.strip().strip('"') for item in operand.strip("()").split(",") if item.strip()]
+    return [operand]
+
+class SupabaseSimulator:
+    """HTTP and websocket server standing in for PostgREST and Supabase Realtime"""
+    
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        rows: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        columns: Optional[Dict[str, List[str]]] = None
+    ):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free port)
+            rows: Initial rows by table name
+            columns: Columns by table name, for empty tables (default: those of the initial rows);
+                tables with an updated_at column keep it current on changes
+        """
+        self.host = host
+        self.port = port
+        self.tables = {table: {str(row["id"]): dict(row) for row in table_rows} for table, table_rows in (rows or {}).items()}
+        self.columns = {table: {column for row in table_rows for column in row} for table, table_rows in (rows or {}).items()}
+        for table, table_columns in (columns or {}).items():
+            self.tables.setdefault(table, {})
+            self.columns.setdefault(table, set()).update(table_columns)
+        # Tables answering 500, and seconds to delay the answers of others, to simulate outages
+        self.failing = set()
+        self.delays = {}
+        self.requests = {}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+    
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.port}/rest/v1"
+    
+    @property
+    def realtime_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/realtime/v1/websocket"
+    
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/rest/v1/{table}", self._select)
+        app.router.add_get("/realtime/v1/websocket", self._realtime)
+        app.router.add_put("/_rows/{table}", self._put_row)
+        app.router.add_delete("/_rows/{table}/{row_id}", self._delete_row)
+        app.router.add_get("/_stats", self._stats)
+        return app
+    
+    async def _select(self, request: web.Request) -> web.Response:
+        table = request.match_info["table"]
+        with self._lock:
+            self.requests[table] = self.requests.get(table, 0) + 1
+        if self.delays.get(table):
+            await asyncio.sleep(self.delays[table])
+        if table in self.failing or table not in self.tables:
+            return web.json_response({"message": f"relation \"{table}\" is unavailable"}, status=500)
+        
+        with self._lock:
+            rows = list(self.tables[table].values())
+        for column, value in request.query.items():
+            if column == "select":
+                continue
+            allowed = set(_filter_values(value))
+            rows = [row for row in rows if str(row.get(column)) in allowed]
+        
+        columns = [column.strip() for column in request.query.get("select", "*").split(",")]
+        if "*" not in columns:
+            for column in columns:
+                if column not in self.columns[table]:
+                    return web.json_response({"message": f"column {table}.{column} does not exist"}, status=400)
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return web.json_response(rows)
+    
+    async def _realtime(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            message = json.loads(msg.data)
+            if message.get("event") == "phx_join":
+                self._subscribers.add(ws)
+            await ws.send_json({
+                "topic": message.get("topic"),
+                "event": "phx_reply",
+                "payload": {"status": "ok", "response": {}},
+                "ref": message.get("ref")
+            })
+        self._subscribers.discard(ws)
+        return ws
+    
+    async def _broadcast(self, table: str, change_type: str, record: Dict[str, Any], old_record: Dict[str, Any]) -> None:
+        message = {
+            "topic": REALTIME_TOPIC,
+            "event": "postgres_changes",
+            "payload": {"data": {
+                "schema": "public",
+                "table": table,
+                "type": change_type,
+                "commit_timestamp": _now(),
+                "record": record,
+                "old_record": old_record
+            }},
+            "ref": None
+        }
+        for ws in list(self._subscribers):
+            await ws.send_json(message)
+    
+    async def _put_row(self, request: web.Request) -> web.Response:
+        row = json.loads(await request.text())
+        await self._upsert(request.match_info["table"], row)
+        return web.json_response(row)
+    
+    async def _delete_row(self, request: web.Request) -> web.Response:
+        await self._delete(request.match_info["table"], request.match_info["row_id"])
+        return web.json_response({"deleted": request.match_info["row_id"]})
+    
+    async def _stats(self, request: web.Request) -> web.Response:
+        with self._lock:
+            return web.json_response({"requests": dict(self.requests), "subscribers": len(self._subscribers)})
+    
+    async def _upsert(self, table: str, row: Dict[str, Any]) -> None:
+        row = dict(row)
+        with self._lock:
+            rows = self.tables.setdefault(table, {})
+            table_columns = self.columns.setdefault(table, set())
+            previous = rows.get(str(row["id"]))
+            if "updated_at" in table_columns:
+                row["updated_at"] = _now()
+            table_columns.update(row)
+            rows[str(row["id"])] = row
+        await self._broadcast(table, "UPDATE" if previous else "INSERT", row, {"id": row["id"]})
+    
+    async def _delete(self, table: str, row_id: str) -> None:
+        with self._lock:
+            removed = self.tables.get(table, {}).pop(str(row_id), None)
+        if removed is not None:
+            await self._broadcast(table, "DELETE", {}, {"id": removed["id"]})
+    
+    def upsert(self, table: str, row: Dict[str, Any]) -> None:
+        """Insert or update a row and push the change (from any thread)"""
+        asyncio.run_coroutine_threadsafe(self._upsert(table, row), self._loop).result()
+    
+    def delete(self, table: str, row_id: Any) -> None:
+        """Delete a row and push the change (from any thread)"""
+        asyncio.run_coroutine_threadsafe(self._delete(table, row_id), self._loop).result()
+    
+    async def _start(self) -> None:
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+    
+    def start(self) -> "SupabaseSimulator":
+        """Serve from a background thread"""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+        
+        self._thread = threading.Thread(target=run, name="supabase-simulator", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+    
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for Supabase PostgREST and Realtime")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=9200, help="Port to bind")
+    parser.add_argument("--rows", help="JSON file of initial rows by table name")
+    args = parser.parse_args(argv)
+    
+    rows = {}
+    if args.rows:
+        with open(args.rows, "r") as f:
+            rows = json.load(f)
+    
+    simulator = SupabaseSimulator(args.host, args.port, rows).start()
+    print(f"Serving PostgREST at {simulator.rest_url} and Realtime at {simulator.realtime_url}", flush=True)
+    try:
+        simulator._thread.join()
+    except KeyboardInterrupt:
+        simulator.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
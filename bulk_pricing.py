@@ -0,0 +1,298 @@
+"""
+Offline bulk pricing for historical bookings and partner rate sheets.
+
+Streams NDJSON or CSV rows through the pricing engine in-process, fanned out
+across a process pool, and writes results incrementally with bounded memory.
+
+Usage:
+    python bulk_pricing.py bookings.ndjson -o priced.ndjson
+    python bulk_pricing.py rates.csv -o priced.csv --workers 8 --providers local
+
+Each input row needs pickup_lat, pickup_lng, dropoff_lat, dropoff_lng and
+pickup_time, and may set trip_type (default "1") and vehicle_category (default:
+all categories). Other columns are passed through to the output unchanged.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from time import time, perf_counter
+from typing import Dict, Any, List, Iterator, Iterable, Optional
+
+logger = logging.getLogger("bulk_pricing")
+
+# Per-worker state, set up once by _init_worker
+_worker_config = None
+_worker_geo_data = None
+_worker_providers = None
+
+def _init_worker(config_dir: str, use_supabase: bool, geojson_path: str, providers: Optional[List[str]], log_level: int, workers: int):
+    """Load configuration and geo data once per worker process, and take this worker's share of the provider quotas"""
+    global _worker_config, _worker_geo_data, _worker_providers
+    
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # Forked workers inherit the parent's logging setup, so set the level explicitly
+    logging.getLogger().setLevel(log_level)
+    
+    from config import Config
+    from geo_utils import load_geo_data
+    from quota import quota_manager
+    
+    # Each worker tracks quotas in its own memory, so together they stay within the QUOTA_* limits
+    quota_manager.set_processes(workers)
+    _worker_config = Config(config_dir=config_dir, use_supabase=use_supabase)
+    _worker_geo_data = load_geo_data(geojson_path)
+    _worker_providers = providers
+
+def price_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Price a single input row for its vehicle category, or for all categories
+    
+    Args:
+        row: Input row with coordinates, pickup_time and optional trip_type/vehicle_category
+    
+    Returns:
+        The input row with 'prices' (category -> rounded price), 'raw_prices',
+        'currency' and 'elapsed_ms' added, or 'error' if the row could not be priced
+    """
+    from pricing import calculate_price, round_to_nearest_10, enforce_price_hierarchy
+    
+    result = dict(row)
+    start = perf_counter()
+    
+    try:
+        pickup_lat = float(row["pickup_lat"])
+        pickup_lng = float(row["pickup_lng"])
+        dropoff_lat = float(row["dropoff_lat"])
+        dropoff_lng = float(row["dropoff_lng"])
+        pickup_time = datetime.fromisoformat(str(row["pickup_time"]).replace('Z', '+00:00'))
+        trip_type = str(row.get("trip_type") or "1")
+        vehicle_category = (row.get("vehicle_category") or "").lower()
+        
+        if trip_type not in ("1", "2"):
+            raise ValueError("trip_type must be '1' (one-way) or '2' (round trip)")
+        
+        categories = [vehicle_category] if vehicle_category else list(_worker_config.vehicle_rates.keys())
+        prices_list = []
+        currency = _worker_config.currency
+        
+        for category in categories:
+            price, currency = calculate_price(
+                pickup_lat=pickup_lat,
+                pickup_lng=pickup_lng,
+                dropoff_lat=dropoff_lat,
+                dropoff_lng=dropoff_lng,
+                vehicle_category=category,
+                pickup_time=pickup_time,
+                config=_worker_config,
+                geo_data=_worker_geo_data,
+                trip_type=trip_type,
+                routing_providers=_worker_providers,
+                priority="batch"
+            )
+            prices_list.append({
+                "category": category,
+                "raw_price": price,
+                "price": round_to_nearest_10(price)
+            })
+        
+        enforce_price_hierarchy(prices_list)
+        
+        result["currency"] = currency
+        result["prices"] = {p["category"]: p["price"] for p in prices_list}
+        result["raw_prices"] = {p["category"]: p["raw_price"] for p in prices_list}
+    
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    
+    result["elapsed_ms"] = round((perf_counter() - start) * 1000, 3)
+    return result
+
+def price_chunk(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Price a chunk of rows in a worker process"""
+    return [price_row(row) for row in rows]
+
+def read_rows(path: str, input_format: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream rows from an NDJSON or CSV file (or stdin for '-')
+    
+    Args:
+        path: Input file path
+        input_format: 'ndjson' or 'csv'
+    
+    Yields:
+        One dictionary per input row
+    """
+    f = sys.stdin if path == "-" else open(path, "r", newline="")
+    
+    try:
+        if input_format == "csv":
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Group a stream of rows into lists of at most `size` rows"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def price_stream(
+    chunks: Iterable[List[Dict[str, Any]]],
+    executor: ProcessPoolExecutor,
+    max_pending: int
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Price chunks across the pool, keeping at most `max_pending` chunks in flight
+    
+    Results are yielded in input order. Bounding the number of pending chunks
+    keeps memory constant regardless of input size.
+    """
+    pending = deque()
+    
+    for chunk in chunks:
+        pending.append(executor.submit(price_chunk, chunk))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    
+    while pending:
+        yield pending.popleft().result()
+
+class ResultWriter:
+    """Incrementally write priced rows as NDJSON or CSV"""
+    
+    def __init__(self, path: str, output_format: str, categories: List[str]):
+        self.output_format = output_format
+        self.categories = categories
+        self._file = sys.stdout if path == "-" else open(path, "w", newline="")
+        self._csv_writer = None
+    
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if self.output_format == "ndjson":
+            self._file.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+            return
+        
+        for row in rows:
+            prices = row.pop("prices", {}) or {}
+            raw_prices = row.pop("raw_prices", {}) or {}
+            for category in self.categories:
+                row[f"price_{category}"] = prices.get(category, "")
+                row[f"raw_price_{category}"] = raw_prices.get(category, "")
+            row.setdefault("currency", "")
+            row.setdefault("error", "")
+            
+            if self._csv_writer is None:
+                self._csv_writer = csv.DictWriter(self._file, fieldnames=list(row.keys()), extrasaction="ignore")
+                self._csv_writer.writeheader()
+            self._csv_writer.writerow(row)
+    
+    def close(self) -> None:
+        self._file.flush()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+def _log_quota_budget(providers: List[str], workers: int) -> None:
+    """Report the paid provider budget of the run, split across the workers"""
+    from quota import QuotaManager, PAID_PROVIDERS
+    
+    quotas = QuotaManager.from_env()
+    for provider in providers:
+        if provider not in PAID_PROVIDERS:
+            continue
+        provider_keys = quotas.keys.get(provider, [])
+        if not provider_keys:
+            logger.warning(f"No {provider} API keys configured, {provider} will be skipped")
+            continue
+        rps = sum(pk.rps_limit for pk in provider_keys)
+        daily = sum(pk.daily_limit for pk in provider_keys)
+        logger.info(
+            f"{provider} budget for this run (batch priority, on top of the live service's): "
+            f"{rps:g} req/s and {daily or 'unlimited'} requests/day over {len(provider_keys)} key(s), "
+            f"split across {workers} workers ({rps / workers:g} req/s each)"
+        )
+
+def _detect_format(path: str, explicit: Optional[str]) -> str:
+    """Pick the file format from an explicit flag or the file extension"""
+    if explicit:
+        return explicit
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Price NDJSON/CSV files of transfers offline")
+    parser.add_argument("input", help="Input file (NDJSON or CSV), '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output file (NDJSON or CSV), '-' for stdout")
+    parser.add_argument("--input-format", choices=["ndjson", "csv"], help="Input format (default: from extension)")
+    parser.add_argument("--output-format", choices=["ndjson", "csv"], help="Output format (default: from extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Rows per task sent to a worker")
+    parser.add_argument("--providers", default="local",
+                        help="Comma-separated routing providers to try (default: local; e.g. google_maps,mapbox,local). "
+                             "Paid providers are used at batch priority, within the QUOTA_* limits split across the "
+                             "workers, and fall through to local routing when throttled")
+    parser.add_argument("--config-dir", default="config", help="Directory with JSON pricing configs")
+    parser.add_argument("--no-supabase", action="store_true", help="Use JSON configs only")
+    parser.add_argument("--geojson", default=os.getenv("GEOJSON_PATH", "data/editedITprov.geojson"), help="Zones GeoJSON")
+    parser.add_argument("--progress-every", type=int, default=10000, help="Report throughput every N rows")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log pricing engine details")
+    args = parser.parse_args(argv)
+    
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    input_format = _detect_format(args.input, args.input_format)
+    output_format = _detect_format(args.output, args.output_format)
+    providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+    _log_quota_budget(providers, args.workers)
+    
+    # CSV output needs a fixed set of price columns up front
+    from config import Config
+    categories = list(Config(config_dir=args.config_dir, use_supabase=not args.no_supabase).vehicle_rates.keys())
+    
+    writer = ResultWriter(args.output, output_format, categories)
+    start = time()
+    total = 0
+    errors = 0
+    next_report = args.progress_every
+    
+    try:
+        with ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(args.config_dir, not args.no_supabase, args.geojson, providers, log_level, args.workers)
+        ) as executor:
+            chunks = chunked(read_rows(args.input, input_format), args.chunk_size)
+            
+            for results in price_stream(chunks, executor, max_pending=args.workers * 2):
+                writer.write(results)
+                total += len(results)
+                errors += sum(1 for row in results if row.get("error"))
+                
+                if total >= next_report:
+                    elapsed = time() - start
+                    logger.info(f"Priced {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s, {errors} errors)")
+                    next_report += args.progress_every
+    finally:
+        writer.close()
+    
+    elapsed = max(time() - start, 1e-9)
+    logger.info(f"Done: {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s, {errors} errors)")
+    return 0 if total == 0 or errors < total else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Time-based pricing (night/weekend/holiday) compiled into lookup tables
+
+The rules in time_multipliers.json are compiled once per configuration into,
+for every zone calendar, an hour-of-week table of multipliers (168 entries),
+the same table for holidays, and a holiday flag per date over a window of
+years. Looking up a pickup time is then two array reads, and lookups for many
+times at once are vectorized with numpy:
+    
+    {
+        "night": 1.25, "night_hours": [22, 6],
+        "weekend": 1.15, "weekend_days": [5, 6],
+        "holiday": 1.3, "holiday_calendar": "IT", "holidays": ["2025-08-14"],
+        "bands": [{"name": "rush", "days": [0, 1, 2, 3, 4], "hours": [7, 10], "multiplier": 1.1}],
+        "zones": {"RM": {"holidays": ["06-29"]}, "MI": {"night": 1.3, "holidays": ["12-07"]}}
+    }
+
+Days are numbered from Monday (0) and hour ranges are [start, end), wrapping
+past midnight when start > end. Holidays are dates (YYYY-MM-DD) or recurring
+days (MM-DD), plus the national holidays of holiday_calendar. When several
+rules apply to the same hour the highest multiplier wins: surcharges do not
+stack. An entry in "zones" overrides the settings for that zone and the zones
+inside it, and adds its holidays to the default ones; times are the local
+wall-clock time of the pickup.
+    
+    python calendar_index.py show config/time_multipliers.json --zone RM --year 2025
+"""
+import sys
+import json
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from geo_utils import zone_lineage
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+DEFAULT_NIGHT_HOURS = (22, 6)
+DEFAULT_WEEKEND_DAYS = (5, 6)
+
+# Holiday flags are compiled for the years around the current one; other dates are checked on the fly
+CALENDAR_YEARS_BEFORE = 1
+CALENDAR_YEARS_AFTER = 3
+
+# Period name of hours no rule applies to
+NO_PERIOD = ""
+
+# Compiled indexes per time_multipliers dict, one per config (tenant) in use
+COMPILED_CALENDAR_SETS = 16
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def easter_sunday(year: int) -> date:
+    """Date of Easter Sunday (Gregorian calendar, anonymous algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def italian_holidays(year: int) -> List[date]:
+    """National public holidays of Italy"""
+    easter = easter_sunday(year)
+    fixed = [(1, 1), (1, 6), (4, 25), (5, 1), (6, 2), (8, 15), (11, 1), (12, 8), (12, 25), (12, 26)]
+    return [date(year, month, day) for month, day in fixed] + [easter, easter + timedelta(days=1)]
+
+# Built-in national holiday calendars by holiday_calendar code
+HOLIDAY_CALENDARS = {
+    "IT": italian_holidays
+}
+
+def _hour_range(hours: Any) -> List[int]:
+    """Hours of a [start, end) range, wrapping past midnight ([0, 24] is the whole day)"""
+    start, end = int(hours[0]) % 24, int(hours[1])
+    end = end if end == 24 else end % 24
+    if start <= end:
+        return list(range(start, end))
+    return list(range(start, 24)) + list(range(0, end))
+
+def _day_number(day: Any) -> int:
+    if isinstance(day, str):
+        return DAY_NAMES.index(day.strip().lower()[:3])
+    return int(day) % 7
+
+class ZoneCalendar:
+    """Compiled time multipliers of one zone (or the default calendar)"""
+    
+    def __init__(self, settings: Dict[str, Any], base_year: Optional[int] = None):
+        """
+        Args:
+            settings: Time multiplier settings (see the module docstring), without "zones"
+            base_year: Year the holiday window is centred on (default: the current year)
+        """
+        # Rules as (period, multiplier, set of hours of the week)
+        rules = []
+        night_hours = _hour_range(settings.get("night_hours", DEFAULT_NIGHT_HOURS))
+        if "night" in settings:
+            rules.append(("night", float(settings["night"]), {day * 24 + hour for day in range(7) for hour in night_hours}))
+        weekend_days = [_day_number(day) for day in settings.get("weekend_days", DEFAULT_WEEKEND_DAYS)]
+        if "weekend" in settings:
+            rules.append(("weekend", float(settings["weekend"]), {day * 24 + hour for day in weekend_days for hour in range(24)}))
+        for band in settings.get("bands", []):
+            days = [_day_number(day) for day in band.get("days", range(7))]
+            hours = _hour_range(band.get("hours", (0, 24)))
+            rules.append((band.get("name", "band"), float(band["multiplier"]), {day * 24 + hour for day in days for hour in hours}))
+        holiday_rule = ("holiday", float(settings["holiday"]), set(range(HOURS_PER_WEEK))) if "holiday" in settings else None
+        
+        self.periods = [NO_PERIOD] + [rule[0] for rule in rules] + (["holiday"] if holiday_rule else [])
+        self.week, self.week_periods = self._compile_week(rules)
+        self.holiday_week, self.holiday_periods = self._compile_week(rules + [holiday_rule] if holiday_rule else rules)
+        self.flat = bool(np.all(self.week == 1.0) and np.all(self.holiday_week == 1.0))
+        
+        # Holidays: exact dates, recurring (month, day) and national calendars
+        self.holiday_dates = set()
+        self.recurring = set()
+        for holiday in settings.get("holidays", []):
+            parts = [int(part) for part in str(holiday).split("-")]
+            if len(parts) == 3:
+                self.holiday_dates.add(date(*parts))
+            else:
+                self.recurring.add((parts[0], parts[1]))
+        self.national = HOLIDAY_CALENDARS.get(settings.get("holiday_calendar", ""))
+        if settings.get("holiday_calendar") and self.national is None:
+            logger.error(f"Unknown holiday calendar {settings['holiday_calendar']}, known: {', '.join(HOLIDAY_CALENDARS)}")
+        
+        base_year = base_year or date.today().year
+        self.first_day = date(base_year - CALENDAR_YEARS_BEFORE, 1, 1)
+        last_day = date(base_year + CALENDAR_YEARS_AFTER, 12, 31)
+        self.holidays = np.zeros((last_day - self.first_day).days + 1, dtype=bool)
+        for year in range(self.first_day.year, last_day.year + 1):
+            for day in self._holidays_of_year(year):
+                self.holidays[(day - self.first_day).days] = True
+        self._first_ordinal = self.first_day.toordinal()
+        # Days since 1970-01-01 of the first compiled day, for numpy datetime64 lookups
+        self._first_epoch_day = (self.first_day - date(1970, 1, 1)).days
+    
+    def _compile_week(self, rules: List[Tuple[str, float, set]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Multiplier and period index per hour of the week, the highest applicable multiplier winning"""
+        multipliers = np.ones(HOURS_PER_WEEK)
+        periods = np.zeros(HOURS_PER_WEEK, dtype=np.int8)
+        applied = np.zeros(HOURS_PER_WEEK, dtype=bool)
+        for name, multiplier, hours in rules:
+            for hour in hours:
+                if not applied[hour] or multiplier > multipliers[hour]:
+                    multipliers[hour] = multiplier
+                    periods[hour] = self.periods.index(name)
+                    applied[hour] = True
+        return multipliers, periods
+    
+    def _holidays_of_year(self, year: int) -> List[date]:
+        days = [day for day in self.holiday_dates if day.year == year]
+        for month, day in self.recurring:
+            try:
+                days.append(date(year, month, day))
+            except ValueError:
+                # 02-29 outside leap years
+                continue
+        if self.national:
+            days.extend(self.national(year))
+        return days
+    
+    def is_holiday(self, day: date) -> bool:
+        """Whether a date is a holiday"""
+        index = day.toordinal() - self._first_ordinal
+        if 0 <= index < len(self.holidays):
+            return bool(self.holidays[index])
+        return day in self._holidays_of_year(day.year)
+    
+    def lookup(self, when: datetime) -> Tuple[float, str]:
+        """
+        Multiplier for a pickup time
+        
+        Returns:
+            Tuple of (multiplier, period it comes from, "" if no rule applies)
+        """
+        hour = when.weekday() * 24 + when.hour
+        if self.is_holiday(when.date()):
+            return float(self.holiday_week[hour]), self.periods[self.holiday_periods[hour]]
+        return float(self.week[hour]), self.periods[self.week_periods[hour]]
+    
+    def multipliers(self, times: np.ndarray) -> np.ndarray:
+        """
+        Multipliers for many pickup times at once
+        
+        Args:
+            times: Array of numpy datetime64 values (local time)
+        
+        Returns:
+            Array of multipliers, one per time
+        """
+        minutes = np.asarray(times, dtype="datetime64[m]")
+        days = minutes.astype("datetime64[D]").astype(np.int64)
+        # 1970-01-01 was a Thursday, weekday 3
+        hours = ((days + 3) % 7) * 24 + (minutes.astype(np.int64) // 60 - days * 24)
+        index = days - self._first_epoch_day
+        inside = (index >= 0) & (index < len(self.holidays))
+        holiday = np.zeros(minutes.shape, dtype=bool)
+        holiday[inside] = self.holidays[index[inside]]
+        for position in np.flatnonzero(~inside):
+            holiday.flat[position] = self.is_holiday(minutes.flat[position].item().date())
+        return np.where(holiday, self.holiday_week[hours], self.week[hours])
+
+class CalendarIndex:
+    """Compiled time multipliers of the default calendar and every zone with its own settings"""
+    
+    def __init__(self, time_multipliers: Dict[str, Any], base_year: Optional[int] = None):
+        """
+        Args:
+            time_multipliers: Time multiplier settings (see the module docstring)
+            base_year: Year the holiday windows are centred on (default: the current year)
+        """
+        settings = {key: value for key, value in time_multipliers.items() if key != "zones"}
+        self.default = ZoneCalendar(settings, base_year)
+        self.zones = {}
+        for zone_code, overrides in (time_multipliers.get("zones") or {}).items():
+            zone_settings = {**settings, **overrides}
+            zone_settings["holidays"] = list(settings.get("holidays", [])) + list(overrides.get("holidays", []))
+            self.zones[zone_code] = ZoneCalendar(zone_settings, base_year)
+        self.flat = self.default.flat and all(calendar.flat for calendar in self.zones.values())
+        # Calendar of every zone looked up so far, for the geo data it was resolved with
+        self._zone_calendars = {}
+        self._zone_geo_data = None
+    
+    def calendar_for(self, zone_code: Optional[str], geo_data: Optional[Dict[str, Any]] = None) -> ZoneCalendar:
+        """Calendar of a zone, inherited from the zones containing it, or the default calendar"""
+        if not self.zones or zone_code is None:
+            return self.default
+        if geo_data is not self._zone_geo_data:
+            self._zone_calendars = {}
+            self._zone_geo_data = geo_data
+        calendar = self._zone_calendars.get(zone_code)
+        if calendar is None:
+            calendar = self.default
+            for code in zone_lineage(zone_code, geo_data or {}):
+                if code in self.zones:
+                    calendar = self.zones[code]
+                    break
+            self._zone_calendars[zone_code] = calendar
+        return calendar
+    
+    def lookup(self, when: datetime, zone_code: Optional[str] = None, geo_data: Optional[Dict[str, Any]] = None) -> Tuple[float, str]:
+        """Multiplier and period for a pickup time in a zone (see ZoneCalendar.lookup)"""
+        return self.calendar_for(zone_code, geo_data).lookup(when)
+    
+    def lookup_zones(self, when: datetime, zone_codes: Any, geo_data: Optional[Dict[str, Any]] = None) -> Dict[str, Tuple[float, str]]:
+        """Multiplier and period for a pickup time in each of several zones, looking up each calendar once"""
+        by_calendar = {}
+        result = {}
+        for zone_code in zone_codes:
+            calendar = self.calendar_for(zone_code, geo_data)
+            if calendar not in by_calendar:
+                by_calendar[calendar] = calendar.lookup(when)
+            result[zone_code] = by_calendar[calendar]
+        return result
+    
+    def multipliers(self, times: np.ndarray, zone_code: Optional[str] = None, geo_data: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Multipliers for many pickup times in a zone (see ZoneCalendar.multipliers)"""
+        return self.calendar_for(zone_code, geo_data).multipliers(times)
+
+    def period_key(self, when: datetime, exact: bool = False) -> str:
+        """
+        Part of a quote cache key covering the pickup time
+
+        Quotes priced at times with the same key get the same time multipliers
+        in every zone: the day if time-based pricing is off, else the day and
+        hour, since the tables change only on the hour (and holidays by date).
+
+        Args:
+            when: Pickup time
+            exact: Key on the minute instead of the hour, for itineraries whose
+                later legs are priced at the time they start
+        """
+        if self.flat:
+            return when.date().isoformat()
+        return when.strftime("%Y-%m-%dT%H:%M" if exact else "%Y-%m-%dT%H")
+
+def compiled_calendar(time_multipliers: Dict[str, Any]) -> CalendarIndex:
+    """
+    Compiled index of a time multiplier configuration
+    
+    Compiled once per time_multipliers dict, so tenants with their own settings
+    each keep theirs; a config refresh replaces the dict, so it is recompiled on
+    the next lookup.
+    """
+    key = id(time_multipliers)
+    with _compiled_lock:
+        cached = _compiled.get(key)
+        # The dict is held by the entry, so its id can't be reused while cached
+        if cached is not None and cached[0] is time_multipliers:
+            _compiled.move_to_end(key)
+            return cached[1]
+    
+    try:
+        calendar = CalendarIndex(time_multipliers)
+    except Exception as e:
+        logger.error(f"Invalid time multipliers, time-based pricing disabled: {str(e)}")
+        calendar = CalendarIndex({})
+    
+    with _compiled_lock:
+        _compiled[key] = (time_multipliers, calendar)
+        while len(_compiled) > COMPILED_CALENDAR_SETS:
+            _compiled.popitem(last=False)
+    return calendar
+
+def show(args) -> int:
+    with open(args.config) as f:
+        calendar = CalendarIndex(json.load(f), args.year).calendar_for(args.zone)
+    
+    for label, week, periods in (("week", calendar.week, calendar.week_periods), ("holiday", calendar.holiday_week, calendar.holiday_periods)):
+        print(f"{label}:")
+        for day in range(7):
+            cells = [f"{week[day * 24 + hour]:.2f}{calendar.periods[periods[day * 24 + hour]][:1] or ' '}" for hour in range(24)]
+            print(f"  {DAY_NAMES[day]} " + " ".join(cells))
+    
+    year = args.year or date.today().year
+    days = [date(year, 1, 1) + timedelta(days=n) for n in range((date(year, 12, 31) - date(year, 1, 1)).days + 1)]
+    print(f"holidays {year}: " + ", ".join(day.isoformat() for day in days if calendar.is_holiday(day)))
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect compiled time-based pricing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    show_parser = commands.add_parser("show", help="Print the hour-of-week multipliers and holidays of a calendar")
+    show_parser.add_argument("config", help="time_multipliers.json")
+    show_parser.add_argument("--zone", help="Zone code with its own settings (default: the default calendar)")
+    show_parser.add_argument("--year", type=int, help="Year to list holidays for (default: the current year)")
+    show_parser.set_defaults(func=show)
+    
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import os
+import hmac
+import bisect
+import hashlib
+import logging
+import threading
+from time import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from metrics import CLUSTER_ROUTE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+def _hash(value: str) -> int:
+    """Position on the ring; stable across processes, unlike hash()"""
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hash ring of instances
+    
+    Each instance is placed at several virtual points, and a key belongs to
+    the first point at or after its own hash. Adding or removing an instance
+    only moves the keys of the points it gains or loses, about 1/N of them.
+    """
+    
+    def __init__(self, nodes: List[str], vnodes: int = 128):
+        """
+        Args:
+            nodes: Instance identifiers (base URLs)
+            vnodes: Virtual points per instance; more points spread keys more evenly
+        """
+        self.vnodes = vnodes
+        self.set_nodes(nodes)
+    
+    def set_nodes(self, nodes: List[str]) -> None:
+        """Replace the instances on the ring"""
+        points = sorted((_hash(f"{node}#{k}"), node) for node in set(nodes) for k in range(self.vnodes))
+        # Swap in one step so concurrent lookups see either the old or the new ring
+        self._ring = ([point for point, _ in points], [node for _, node in points])
+        self.nodes = sorted(set(nodes))
+    
+    def node_for(self, key: str) -> Optional[str]:
+        """Instance owning a key, or None if the ring is empty"""
+        hashes, nodes = self._ring
+        if not hashes:
+            return None
+        return nodes[bisect.bisect_left(hashes, _hash(key)) % len(hashes)]
+
+class RouteCluster:
+    """
+    Route-affinity sharding of the route cache across instances
+    
+    Every provider route (by its route cache key) is owned by one instance,
+    chosen by consistent hashing over the cluster members. Other instances
+    forward route lookups to the owner (POST /internal/route), so each route
+    is fetched from the paid providers and cached by one instance, and keep
+    a local copy of the answer. A peer that cannot be reached is left out of
+    the ring for a cooldown, moving only its keys, and lookups it owned are
+    routed locally meanwhile.
+    """
+    
+    def __init__(
+        self,
+        self_url: Optional[str] = None,
+        peers: Optional[List[str]] = None,
+        token: Optional[str] = None,
+        timeout: float = 5.0,
+        vnodes: int = 128,
+        cooldown: float = 30.0
+    ):
+        """
+        Args:
+            self_url: Base URL of this instance as its peers reach it
+            peers: Base URLs of all cluster members (this one included or not), empty to disable
+            token: Shared secret sent with and required on forwarded lookups (X-Cluster-Token);
+                cluster mode stays off without one
+            timeout: Seconds to wait for the owner of a route before routing locally
+            vnodes: Virtual points per instance on the hash ring
+            cooldown: Seconds an unreachable peer is left out of the ring
+        """
+        self.self_url = self_url.rstrip("/") if self_url else None
+        self.token = token
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.ring = HashRing([], vnodes)
+        self.members = []
+        self._down = {}
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self.set_members(peers or [])
+    
+    @classmethod
+    def from_env(cls) -> "RouteCluster":
+        """Create the cluster membership from environment variables"""
+        peers = [peer.strip() for peer in os.getenv("CLUSTER_PEERS", "").split(",") if peer.strip()]
+        return cls(
+            self_url=os.getenv("CLUSTER_SELF") or None,
+            peers=peers,
+            token=os.getenv("CLUSTER_TOKEN") or None,
+            timeout=float(os.getenv("CLUSTER_TIMEOUT", "5")),
+            vnodes=int(os.getenv("CLUSTER_VNODES", "128")),
+            cooldown=float(os.getenv("CLUSTER_PEER_COOLDOWN", "30"))
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        # Without a token anyone reaching the port could spend provider quota through /internal/route
+        return self.self_url is not None and bool(self.token) and len(self.members) > 1
+    
+    def set_members(self, peers: List[str]) -> None:
+        """Replace the cluster members (this instance is always one of them)"""
+        members = {peer.rstrip("/") for peer in peers}
+        if self.self_url and members:
+            members.add(self.self_url)
+        with self._lock:
+            self.members = sorted(members)
+            self._down = {peer: until for peer, until in self._down.items() if peer in members}
+            self._rebuild()
+        if self.members and not self.token:
+            logger.error("CLUSTER_TOKEN is not set, cluster mode disabled")
+        elif self.members:
+            logger.info(f"Cluster members: {', '.join(self.members)} (this instance: {self.self_url})")
+    
+    def _rebuild(self) -> None:
+        """Place the members that are not cooling down on the ring (caller holds the lock)"""
+        self.ring.set_nodes([peer for peer in self.members if peer not in self._down])
+    
+    def _expire_down(self) -> None:
+        if not self._down:
+            return
+        now = time()
+        with self._lock:
+            expired = [peer for peer, until in self._down.items() if until <= now]
+            for peer in expired:
+                del self._down[peer]
+                logger.info(f"Cluster peer {peer} back on the ring")
+            if expired:
+                self._rebuild()
+    
+    def mark_down(self, peer: str) -> None:
+        """Leave an unreachable peer out of the ring for the cooldown"""
+        with self._lock:
+            if peer in self._down:
+                return
+            self._down[peer] = time() + self.cooldown
+            self._rebuild()
+        logger.warning(f"Cluster peer {peer} unreachable, routing its keys elsewhere for {self.cooldown:.0f}s")
+    
+    @staticmethod
+    def key_string(cache_key: Tuple) -> str:
+        """Ring key of a route cache key (snapped coordinates and departure time bucket)"""
+        return "|".join(str(part) for part in cache_key)
+    
+    def owner_of(self, cache_key: Tuple) -> Optional[str]:
+        """Instance owning a route, or None if clustering is disabled"""
+        if not self.enabled:
+            return None
+        self._expire_down()
+        return self.ring.node_for(self.key_string(cache_key))
+    
+    def is_authorized(self, token: Optional[str]) -> bool:
+        """Whether a forwarded lookup carries the cluster token (never, if none is set)"""
+        if not self.token or not token:
+            return False
+        return hmac.compare_digest(self.token.encode(), token.encode())
+    
+    def fetch_route(
+        self,
+        owner: str,
+        pickup: Tuple[float, float],
+        dropoff: Tuple[float, float],
+        depart_at: Optional[str],
+        providers: List[str],
+        priority: str,
+        waypoints: Optional[List[Tuple[float, float]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Look up a route on the instance owning it
+        
+        Returns:
+            The owner's route (possibly a haversine fallback), or None if the owner
+            could not be reached and the route should be looked up locally
+        """
+        payload = {
+            "pickup": list(pickup),
+            "dropoff": list(dropoff),
+            "depart_at": depart_at,
+            "providers": providers,
+            "priority": priority,
+            "waypoints": [list(point) for point in waypoints] if waypoints else None
+        }
+        headers = {"X-Cluster-Token": self.token}
+        try:
+            response = self._session.post(f"{owner}/internal/route", json=payload, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.error(f"Error forwarding route lookup to {owner}: {str(e)}")
+            CLUSTER_ROUTE_LOOKUPS.labels(outcome="unreachable").inc()
+            self.mark_down(owner)
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"Route lookup forwarded to {owner} failed: {response.status_code} - {response.text[:200]}")
+            CLUSTER_ROUTE_LOOKUPS.labels(outcome="failed").inc()
+            return None
+        
+        CLUSTER_ROUTE_LOOKUPS.labels(outcome="forwarded").inc()
+        return response.json()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Membership and ring state"""
+        with self._lock:
+            down = {peer: round(until - time(), 1) for peer, until in self._down.items()}
+        return {
+            "enabled": self.enabled,
+            "self": self.self_url,
+            "members": self.members,
+            "on_ring": self.ring.nodes,
+            "cooling_down": down,
+            "vnodes": self.ring.vnodes
+        }
+
+# Shared cluster membership used by geo_utils
+route_cluster = RouteCluster.from_env()
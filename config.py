@@ -9,6 +9,16 @@ from supabase_client import SupabaseManager
 
 logger = logging.getLogger(__name__)
 
+# Pricing settings a tenant can override, by attribute and file name
+TENANT_CONFIG_FILES = {
+    "vehicle_rates": "vehicle_rates.json",
+    "zone_multipliers": "zone_multipliers.json",
+    "time_multipliers": "time_multipliers.json",
+    "fixed_prices": "fixed_prices.json",
+    "min_fares": "min_fares.json",
+    "distance_based_min_fares": "distance_based_min_fares.json"
+}
+
 class Config:
     def __init__(self, config_dir: str = "config", use_supabase: bool = True):
         """
@@ -36,8 +46,13 @@ class Config:
         # Validate configurations
         self.validate_config()
     
-    def _load_all_configs(self):
-        """Load all configurations from Supabase and fallback to JSON files"""
+    def _load_all_configs(self, sync_supabase: bool = True):
+        """
+        Load all configurations from Supabase and fallback to JSON files
+        
+        Args:
+            sync_supabase: Whether to sync with Supabase first or reuse the last synced rows
+        """
         # First, try to load from Supabase if enabled
         supabase_vehicle_rates = {}
         supabase_zone_multipliers = {}
@@ -45,21 +60,59 @@ class Config:
         
         if self.use_supabase and self.supabase and self.supabase.client:
             try:
-                supabase_vehicle_rates = self.supabase.get_vehicle_base_prices()
-                supabase_zone_multipliers = self.supabase.get_zone_multipliers()
-                supabase_fixed_prices = self.supabase.get_fixed_routes()
+                # Tables are fetched concurrently and only changed rows are pulled
+                if sync_supabase:
+                    self.supabase.sync()
+                synced = self.supabase.get_synced_configs()
+                supabase_vehicle_rates = synced.get('vehicle_rates', {})
+                supabase_zone_multipliers = dict(synced.get('zone_multipliers', {}))
+                supabase_fixed_prices = synced.get('fixed_prices', [])
                 logger.info("Successfully loaded configurations from Supabase")
             except Exception as e:
                 logger.error(f"Error loading from Supabase: {e}. Falling back to JSON configs.")
         
         # Load configs with fallback to JSON files
-        self.vehicle_rates = supabase_vehicle_rates if supabase_vehicle_rates else self._load_or_create_config('vehicle_rates.json', self._default_vehicle_rates())
+        self.vehicle_rates = dict(supabase_vehicle_rates) if supabase_vehicle_rates else self._load_or_create_config('vehicle_rates.json', self._default_vehicle_rates())
         self.zone_multipliers = supabase_zone_multipliers if supabase_zone_multipliers else self._load_or_create_config('zone_multipliers.json', self._default_zone_multipliers())
         self.time_multipliers = self._load_or_create_config('time_multipliers.json', self._default_time_multipliers())
         self.fixed_prices = supabase_fixed_prices if supabase_fixed_prices else self._load_or_create_config('fixed_prices.json', self._default_fixed_prices())
         self.min_fares = self._load_or_create_config('min_fares.json', self._default_min_fares())
         self.distance_based_min_fares = self._load_or_create_config('distance_based_min_fares.json', self._default_distance_based_min_fares())
     
+    def refresh(self, sync_supabase: bool = True) -> None:
+        """
+        Reload the configuration in place (only changed Supabase rows are fetched)
+        
+        Args:
+            sync_supabase: Whether to sync with Supabase first or reuse the last synced rows
+        """
+        self._load_all_configs(sync_supabase)
+        self.validate_config()
+    
+    def start_background_refresh(self) -> bool:
+        """
+        Keep the configuration in sync with Supabase in the background
+        
+        With SUPABASE_SYNC_MODE=subscribe changes are pushed over Supabase
+        Realtime; otherwise the tables are polled periodically.
+        
+        Returns:
+            True if the background refresher was started
+        """
+        if not (self.use_supabase and self.supabase):
+            return False
+        
+        def on_change(changed):
+            logger.info(f"Supabase config changed ({', '.join(sorted(changed))}), refreshing")
+            self.refresh(sync_supabase=False)
+        
+        if os.getenv("SUPABASE_SYNC_MODE", "poll").lower() == "subscribe":
+            if self.supabase.start_change_subscription(on_change):
+                return True
+            logger.warning("Config change subscription unavailable, falling back to polling")
+        
+        return self.supabase.start_background_sync(on_change)
+    
     def _load_or_create_config(self, filename: str, default_config: Any) -> Any:
         """
         Load a config file or create it with default values if it doesn't exist
@@ -273,4 +326,136 @@ class Config:
             logger.critical("No zone multipliers configuration available. Using emergency defaults.")
             self.zone_multipliers = self._default_zone_multipliers()
         
-        logger.info("Configuration validation completed successfully")
\ No newline at end of file
+        logger.info("Configuration validation completed successfully")
+
+class TenantConfig(Config):
+    """
+    Pricing configuration of one tenant
+    
+    Only the settings with a file in the tenant's directory (see
+    TENANT_CONFIG_FILES) are loaded; every other setting is read from the
+    default configuration, so a tenant holds no copies of it and follows its
+    refreshes.
+    """
+    
+    def __init__(self, tenant_id: str, config_dir: str, base: Config):
+        """
+        Args:
+            tenant_id: Tenant identifier
+            config_dir: Directory with the tenant's config files
+            base: Default configuration for the settings the tenant does not override
+        """
+        self.tenant_id = tenant_id
+        self.base = base
+        self.config_dir = config_dir
+        self.use_supabase = False
+        self.supabase = None
+        self.overrides = []
+        
+        self._load_all_configs()
+        self.validate_config()
+    
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes the tenant does not set itself
+        if name == "base":
+            raise AttributeError(name)
+        return getattr(self.base, name)
+    
+    def _load_all_configs(self, sync_supabase: bool = True):
+        """Load the tenant's config files; settings without a file fall through to the default configuration"""
+        overrides = []
+        for name, filename in TENANT_CONFIG_FILES.items():
+            file_path = os.path.join(self.config_dir, filename)
+            if not os.path.exists(file_path):
+                self.__dict__.pop(name, None)
+                continue
+            try:
+                with open(file_path, 'r') as f:
+                    setattr(self, name, json.load(f))
+                overrides.append(name)
+            except Exception as e:
+                logger.error(f"Error loading {filename} of tenant {self.tenant_id}: {e}. Using the default configuration.")
+                self.__dict__.pop(name, None)
+        self.overrides = overrides
+    
+    def validate_config(self) -> None:
+        """Validate the tenant's own settings (the default configuration validates the rest)"""
+        for category, rate in self.__dict__.get("vehicle_rates", {}).items():
+            if float(rate) <= 0:
+                logger.error(f"Rate for {category} of tenant {self.tenant_id} must be positive, got {rate}. Using default.")
+                self.vehicle_rates[category] = self.base.vehicle_rates.get(category, 1.0)
+        
+        for zone, multiplier in self.__dict__.get("zone_multipliers", {}).items():
+            if float(multiplier) <= 0:
+                logger.error(f"Multiplier for zone {zone} of tenant {self.tenant_id} must be positive, got {multiplier}. Using default.")
+                self.zone_multipliers[zone] = self.base.zone_multipliers.get(zone, 1.0)
+        
+        for category, min_fare in self.__dict__.get("min_fares", {}).items():
+            if float(min_fare) <= 0:
+                logger.error(f"Minimum fare for {category} of tenant {self.tenant_id} must be positive, got {min_fare}. Using default.")
+                self.min_fares[category] = self.base.min_fares.get(category, 10.0)
+        
+        for name in ("vehicle_rates", "zone_multipliers"):
+            if name in self.__dict__ and not self.__dict__[name]:
+                logger.critical(f"Tenant {self.tenant_id} has an empty {name}, using the default configuration")
+                del self.__dict__[name]
+                self.overrides.remove(name)
+    
+    def start_background_refresh(self) -> bool:
+        # Tenant files are reloaded by TenantConfigs.refresh
+        return False
+    
+    def memory_stats(self) -> Dict[str, int]:
+        """Approximate size of the tenant's own settings (as JSON)"""
+        return {"entries": len(self.overrides), "bytes": sum(len(json.dumps(self.__dict__[name])) for name in self.overrides)}
+
+class TenantConfigs:
+    """
+    The default configuration and the configurations of white-label tenants
+    
+    Each subdirectory of the tenants directory is a tenant, named after it,
+    holding the config files it overrides (see TenantConfig).
+    """
+    
+    def __init__(self, default: Config, tenants_dir: str = "config/tenants"):
+        """
+        Args:
+            default: Default configuration, used when no tenant is given
+            tenants_dir: Directory with one subdirectory per tenant
+        """
+        self.default = default
+        self.tenants_dir = tenants_dir
+        self.tenants = {}
+        self.load_tenants()
+    
+    def load_tenants(self) -> None:
+        """(Re)load every tenant directory"""
+        tenants = {}
+        if os.path.isdir(self.tenants_dir):
+            for tenant_id in sorted(os.listdir(self.tenants_dir)):
+                tenant_dir = os.path.join(self.tenants_dir, tenant_id)
+                if os.path.isdir(tenant_dir):
+                    tenants[tenant_id] = TenantConfig(tenant_id, tenant_dir, self.default)
+                    logger.info(f"Loaded tenant {tenant_id} overriding {', '.join(tenants[tenant_id].overrides) or 'nothing'}")
+        # Swap in one step so concurrent lookups see either the old or the new tenants
+        self.tenants = tenants
+    
+    def get(self, tenant_id: Optional[str] = None) -> Config:
+        """
+        Return the configuration of a tenant, or the default one if none is given
+        
+        Raises:
+            KeyError: If the tenant is unknown
+        """
+        if not tenant_id:
+            return self.default
+        return self.tenants[tenant_id]
+    
+    def refresh(self, sync_supabase: bool = True) -> None:
+        """Refresh the default configuration in place and reload the tenants"""
+        self.default.refresh(sync_supabase)
+        self.load_tenants()
+    
+    def memory_stats(self) -> Dict[str, int]:
+        stats = [tenant.memory_stats() for tenant in self.tenants.values()]
+        return {"entries": len(stats), "bytes": sum(s["bytes"] for s in stats)}
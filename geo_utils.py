@@ -1,24 +1,348 @@
 import math
+import re
+import gzip
 import json
 import logging
 import os
-import requests
-import polyline
+import sys
+import threading
+from collections import OrderedDict
+from time import time
+import numpy as np
+import shapely
 from rtree import index
 from shapely.geometry import LineString, Point, shape, mapping
-from typing import Dict, Tuple, List, Any, Optional
+from typing import Dict, Tuple, List, Any, Optional, Iterator
+
+from quota import quota_manager, PAID_PROVIDERS, PRIORITY_INTERACTIVE
+from profiling import count, profile_counters
+from provider_tape import ProviderTape
+from memory import memory_accountant
+from log_pipeline import log_sampler
+from cluster import route_cluster
+from metrics import (
+    PROVIDER_LATENCY,
+    PROVIDER_REQUESTS,
+    PROVIDER_IN_FLIGHT,
+    HAVERSINE_FALLBACKS,
+    CACHE_REQUESTS,
+    CACHE_ENTRIES,
+    CLUSTER_ROUTE_LOOKUPS
+)
 
 logger = logging.getLogger(__name__)
 
-def load_geo_data(geojson_path: str = "data/editedITprov.geojson") -> Dict[str, Any]:
+# Routing providers tried by get_route_with_fallbacks, in order
+DEFAULT_ROUTING_PROVIDERS = ["google_maps", "mapbox", "local"]
+
+class RouteCache:
+    """Thread-safe LRU cache of provider routes (or results derived from them) with a time-to-live"""
+    
+    def __init__(self, max_size: int = 10000, ttl: float = 86400, time_bucket_min: int = 60):
+        """
+        Args:
+            max_size: Maximum number of routes to keep
+            ttl: Seconds before a cached route expires
+            time_bucket_min: Departure times within the same bucket of this many minutes share
+                a cached route, 0 to key on the exact departure time
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.time_bucket_min = time_bucket_min
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _entry_size(key: Tuple, route: Dict[str, Any]) -> int:
+        """Approximate memory held by a cache entry in bytes"""
+        return sys.getsizeof(key) + sys.getsizeof(route) + sum(sys.getsizeof(v) for v in route.values()) + 100
+    
+    def time_bucket(self, depart_at: Optional[str]) -> Optional[str]:
+        """
+        Round a departure time down to the start of its time bucket
+        
+        Args:
+            depart_at: Departure time as formatted for the routing providers (YYYY-MM-DDTHH:MM)
+        
+        Returns:
+            Start of the bucket in the same format, or depart_at unchanged if not in that format
+        """
+        if not depart_at or not self.time_bucket_min or len(depart_at) < 16 or depart_at[10] != 'T' or depart_at[13] != ':':
+            return depart_at
+        try:
+            minutes = int(depart_at[11:13]) * 60 + int(depart_at[14:16])
+        except ValueError:
+            return depart_at
+        minutes -= minutes % self.time_bucket_min
+        return f"{depart_at[:10]}T{minutes // 60:02d}:{minutes % 60:02d}"
+    
+    def make_key(
+        self,
+        pickup: Tuple[float, float],
+        dropoff: Tuple[float, float],
+        depart_at: str = None,
+        waypoints: Optional[List[Tuple[float, float]]] = None
+    ) -> Tuple:
+        """Build a cache key from coordinates rounded to ~1 m and the departure time bucket"""
+        key = (round(pickup[0], 5), round(pickup[1], 5), round(dropoff[0], 5), round(dropoff[1], 5), self.time_bucket(depart_at))
+        if waypoints:
+            key += tuple((round(lat, 5), round(lng, 5)) for lat, lng in waypoints)
+        return key
+    
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Return the cached route for a key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time() - entry[0] >= self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                    self.bytes -= entry[2]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: Tuple, route: Dict[str, Any]) -> None:
+        """Store a route, evicting the least recently used entries if full"""
+        size = self._entry_size(key, route)
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (time(), route, size)
+            self.bytes += size
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self.bytes -= self._entries.popitem(last=False)[1][2]
+    
+    def evict(self, fraction: float) -> int:
+        """Remove the least recently used fraction of entries, returning the number removed"""
+        with self._lock:
+            count = min(len(self._entries), max(1, int(len(self._entries) * fraction)))
+            for _ in range(count):
+                self.bytes -= self._entries.popitem(last=False)[1][2]
+            return count
+    
+    def clear(self) -> None:
+        """Remove all cached routes"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+    
+    def memory_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.bytes}
+    
+    def items(self) -> List[Tuple[Tuple, Dict[str, Any]]]:
+        """Return a snapshot of the unexpired (key, route) entries, without counting lookups"""
+        now = time()
+        with self._lock:
+            return [(key, entry[1]) for key, entry in self._entries.items() if now - entry[0] < self.ttl]
+    
+    def __contains__(self, key: Tuple) -> bool:
+        """Whether an unexpired route is cached, without counting a lookup or refreshing its position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time() - entry[0] < self.ttl
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Shared cache of provider routes (haversine fallbacks are never cached). Quotes are
+# priced at the exact pickup time, but routes are shared within a departure time bucket
+route_cache = RouteCache(
+    max_size=int(os.getenv("ROUTE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ROUTE_CACHE_TTL", "86400")),
+    time_bucket_min=int(os.getenv("ROUTE_CACHE_TIME_BUCKET_MIN", "60"))
+)
+CACHE_ENTRIES.labels(cache="route").set_function(lambda: len(route_cache))
+memory_accountant.register("route", route_cache.memory_stats, route_cache.evict)
+_route_cache_hits = CACHE_REQUESTS.labels(cache="route", result="hit")
+_route_cache_misses = CACHE_REQUESTS.labels(cache="route", result="miss")
+_cluster_local_lookups = CLUSTER_ROUTE_LOOKUPS.labels(outcome="local")
+
+# Zones crossed by cached provider routes, keyed like the route cache. Zone attribution
+# depends only on the route and the zone geometries, so every vehicle category and
+# tenant quoting a route shares one result
+zones_cache = RouteCache(
+    max_size=int(os.getenv("ZONES_CACHE_SIZE", "10000")),
+    ttl=route_cache.ttl,
+    time_bucket_min=route_cache.time_bucket_min
+)
+CACHE_ENTRIES.labels(cache="zones").set_function(lambda: len(zones_cache))
+memory_accountant.register("zones", zones_cache.memory_stats, zones_cache.evict)
+
+# Zone traversal for route polylines: 'sticky' follows the current province and only
+# searches for zones at boundary crossings, 'index' queries the R-tree for every segment
+ZONE_TRAVERSAL = os.getenv("ZONE_TRAVERSAL", "sticky").lower()
+# Douglas-Peucker tolerance (meters) used to collapse route vertices inside a single province, 0 to disable
+ROUTE_SIMPLIFY_TOLERANCE_M = float(os.getenv("ROUTE_SIMPLIFY_TOLERANCE_M", "0"))
+# Spans of fewer segments aren't worth checking, a province lookup costs about as much as attributing them
+_MIN_SIMPLIFY_SPAN = 4
+# Segments tested at once against the current province; the block doubles while the route stays inside it
+_STICKY_BLOCK_MIN = 8
+_STICKY_BLOCK_MAX = 512
+
+# Zone levels from coarsest to finest; provinces are the base layer (GEOJSON_PATH)
+ZONE_LEVELS = ("country", "province", "municipality")
+# Feature properties holding the code and name of zones at each level, first match wins
+ZONE_LEVEL_PROPERTIES = {
+    "country": {"code": ("iso_a3", "ISO_A3", "ADM0_A3", "code"), "name": ("name", "NAME", "ADMIN")},
+    "province": {"code": ("prov_acr",), "name": ("prov_name",)},
+    "municipality": {"code": ("pro_com_t", "PRO_COM_T", "com_istat", "PRO_COM", "code"), "name": ("comune", "COMUNE", "com_name", "name")}
+}
+_FEATURES_ARRAY = re.compile(r'"features"\s*:\s*\[')
+
+# Fixed-price routes per pickup point (see fixed_price_candidates)
+FIXED_CANDIDATE_CACHE_SIZE = int(os.getenv("FIXED_CANDIDATE_CACHE_SIZE", "4096"))
+_fixed_candidates = OrderedDict()
+_fixed_candidates_lock = threading.Lock()
+# id(fixed price list) -> (fixed price list, prepared polygons), one per config (tenant) in use
+FIXED_ROUTE_SHAPE_SETS = 64
+_fixed_route_shape_cache = OrderedDict()
+memory_accountant.register(
+    "fixed_candidates",
+    lambda: {"entries": len(_fixed_candidates), "bytes": len(_fixed_candidates) * 300},
+    lambda fraction: evict_fixed_price_candidates(fraction)
+)
+
+# Record/replay of provider HTTP responses (PROVIDER_TAPE_MODE=record|replay)
+provider_tape = ProviderTape.from_env()
+memory_accountant.register("provider_tape", provider_tape.memory_stats)
+
+def zone_layers_from_env() -> Dict[str, str]:
+    """
+    Parse the extra zone layers from ZONE_LAYERS
+    
+    Example: ZONE_LAYERS="country=data/countries.geojson;municipality=data/comuni.geojson.gz"
+    
+    Returns:
+        Dictionary mapping zone level to GeoJSON path
+    """
+    layers = {}
+    for entry in os.getenv("ZONE_LAYERS", "").split(";"):
+        if not entry.strip():
+            continue
+        level, _, path = entry.partition("=")
+        level = level.strip().lower()
+        if level not in ZONE_LEVELS or level == "province" or not path.strip():
+            logger.error(f"Ignoring invalid ZONE_LAYERS entry '{entry}', expected country=<path> or municipality=<path>")
+            continue
+        layers[level] = path.strip()
+    return layers
+
+def iter_geojson_features(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the features of a GeoJSON file one at a time
+    
+    Only one feature is decoded at a time, so peak memory is bounded by the
+    largest feature instead of the file size. Supports FeatureCollections and
+    newline-delimited GeoJSON (.geojsonl, .geojsons, .ndjson); files ending in
+    .gz are decompressed on the fly.
+    
+    Args:
+        path: Path to the GeoJSON file
+        chunk_size: Characters read at a time
+    
+    Yields:
+        GeoJSON feature dictionaries
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    base = path[:-3] if path.endswith(".gz") else path
+    
+    with opener(path, "rt", encoding="utf-8") as f:
+        if base.endswith((".geojsonl", ".geojsons", ".ndjson")):
+            for line in f:
+                # GeoJSON text sequences prefix every record with a record separator
+                line = line.strip().lstrip("\x1e")
+                if line:
+                    yield json.loads(line)
+            return
+        
+        # Find the start of the features array
+        buffer = f.read(chunk_size)
+        match = _FEATURES_ARRAY.search(buffer)
+        while match is None:
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError(f"No features array found in {path}")
+            buffer = buffer[-64:] + more
+            match = _FEATURES_ARRAY.search(buffer)
+        
+        decoder = json.JSONDecoder()
+        position = match.end()
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                buffer = f.read(chunk_size)
+                position = 0
+                if not buffer:
+                    raise ValueError(f"Unexpected end of file in {path}")
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The feature continues past the buffer; read at least as much again
+                more = f.read(max(chunk_size, len(buffer) - position))
+                if not more:
+                    raise
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield feature
+            position = end
+
+def _zone_from_feature(feature: Dict[str, Any], level: str, i: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Build a zone from a GeoJSON feature, returning (zone ID, zone) or None if it has no code"""
+    properties = feature.get('properties') or {}
+    
+    if level == "province":
+        # Extract province data including province code (prov_acr)
+        zone_id = str(properties.get('prov_istat', f"PROV_{i}"))
+        code = str(properties.get('prov_acr', "DEFAULT"))
+        name = properties.get('prov_name', f"Province {i}")
+    else:
+        spec = ZONE_LEVEL_PROPERTIES[level]
+        code = next((str(properties[key]) for key in spec['code'] if properties.get(key) not in (None, "")), None)
+        if code is None:
+            return None
+        zone_id = f"{level}:{code}"
+        name = next((properties[key] for key in spec['name'] if properties.get(key)), code)
+    
+    return zone_id, {
+        'name': name,
+        'geometry': shape(feature['geometry']),
+        'properties': properties,
+        'code': code,  # Zone code used for multiplier lookup
+        'level': level,
+        'parent': None
+    }
+
+def load_geo_data(geojson_path: str = "data/editedITprov.geojson", layers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     """
-    Load GeoJSON data of Italian provinces and build an R-tree spatial index
+    Load zone polygons and build an R-tree spatial index
+    
+    The provinces GeoJSON is the base layer; country and municipality layers can
+    be added (ZONE_LAYERS). Each zone is linked to the zone of the next coarser
+    layer containing it, and route distance is attributed to the finest zones,
+    those without children: e.g. municipalities where they are loaded, provinces
+    elsewhere in Italy and whole countries abroad. A finer layer should cover its
+    parent zones completely, as parents are not used for attribution.
     
     Args:
-        geojson_path: Path to the GeoJSON file
+        geojson_path: Path to the provinces GeoJSON file
+        layers: Extra layers by level ('country', 'municipality'), defaults to ZONE_LAYERS
         
     Returns:
-        Dictionary containing loaded geo data including R-tree index
+        Dictionary containing loaded geo data: the zones used for attribution
+        ('provinces', by ID), the hierarchy of all zones ('zones', by code),
+        R-tree index and adjacency graph
     """
     try:
         # Check if the GeoJSON file exists
@@ -26,53 +350,126 @@ def load_geo_data(geojson_path: str = "data/editedITprov.geojson") -> Dict[str,
             logger.error(f"GeoJSON file not found at {geojson_path}")
             return create_emergency_geo_data()
         
-        # Load the GeoJSON data
-        with open(geojson_path, 'r') as f:
-            geojson_data = json.load(f)
-        
-        # Build R-tree index
-        idx = index.Index()
-        provinces = {}
-        province_codes = {}
+        layer_paths = dict(zone_layers_from_env() if layers is None else layers)
+        layer_paths["province"] = geojson_path
         
-        for i, feature in enumerate(geojson_data['features']):
-            try:
-                # Extract province data including province code (prov_acr)
-                province_id = str(feature['properties'].get('prov_istat', f"PROV_{i}"))
-                prov_acr = str(feature['properties'].get('prov_acr', f"DEFAULT"))
-                
-                # Store the province data
-                provinces[province_id] = {
-                    'name': feature['properties'].get('prov_name', f"Province {i}"),
-                    'geometry': shape(feature['geometry']),
-                    'properties': feature['properties'],
-                    'code': prov_acr  # Store the province code for lookup
-                }
-                
-                # Store province ID by code for reverse lookup
-                province_codes[prov_acr] = province_id
-                
-                # Add to R-tree index
-                bounds = provinces[province_id]['geometry'].bounds
-                idx.insert(i, bounds, obj=province_id)
-                
-            except Exception as e:
-                logger.error(f"Error processing feature {i}: {str(e)}")
+        zones = {}
+        parent_ids = None
+        for level in ZONE_LEVELS:
+            if level not in layer_paths:
                 continue
         
-        logger.info(f"Loaded {len(provinces)} provinces from GeoJSON")
+            level_ids = []
+            for i, feature in enumerate(iter_geojson_features(layer_paths[level])):
+                try:
+                    built = _zone_from_feature(feature, level, i)
+                    if built is None:
+                        logger.error(f"Skipping {level} feature {i}: no code property")
+                        continue
+                    zones[built[0]] = built[1]
+                    level_ids.append(built[0])
+                except Exception as e:
+                    logger.error(f"Error processing {level} feature {i}: {str(e)}")
+                    continue
+            
+            if parent_ids:
+                _link_parent_zones(zones, level_ids, parent_ids)
+            parent_ids = level_ids
+            logger.info(f"Loaded {len(level_ids)} {level} zones from {layer_paths[level]}")
+        
+        # Zones with children are only needed to build the hierarchy
+        has_children = {zone['parent_id'] for zone in zones.values() if zone.get('parent_id')}
+        provinces = {zone_id: zone for zone_id, zone in zones.items() if zone_id not in has_children}
+        hierarchy = {
+            zone['code']: {'name': zone['name'], 'level': zone['level'], 'parent': zone['parent']}
+            for zone in zones.values()
+        }
+        for zone in zones.values():
+            zone.pop('parent_id', None)
+        del zones
+
+        if not provinces:
+            logger.error(f"No zones could be loaded from {geojson_path}")
+            return create_emergency_geo_data()
+
+        # Store zone ID by code for reverse lookup
+        province_codes = {zone['code']: zone_id for zone_id, zone in provinces.items()}
+        
+        # Build R-tree index (bulk loading is much faster than inserting one by one)
+        idx = index.Index(
+            (i, zone['geometry'].bounds, zone_id) for i, (zone_id, zone) in enumerate(provinces.items())
+        )
+        
+        logger.info(f"Using {len(provinces)} zones for attribution")
+        
+        adjacency, overlaps = build_zone_adjacency(provinces, idx)
         
         return {
             'provinces': provinces,
             'province_codes': province_codes,
+            'zones': hierarchy,
             'rtree': idx,
-            'geojson': geojson_data
+            'adjacency': adjacency,
+            'overlaps': overlaps
         }
     except Exception as e:
         logger.error(f"Error loading GeoJSON data: {str(e)}")
         # Create and return minimal geo data for fallback
         return create_emergency_geo_data()
 
+def _link_parent_zones(zones: Dict[str, Dict[str, Any]], child_ids: List[str], parent_ids: List[str]) -> None:
+    """Link each child zone to the parent-layer zone containing its representative point"""
+    parent_idx = index.Index((i, zones[zone_id]['geometry'].bounds, zone_id) for i, zone_id in enumerate(parent_ids))
+    orphans = 0
+    
+    for child_id in child_ids:
+        point = zones[child_id]['geometry'].representative_point()
+        for parent_id in parent_idx.intersection((point.x, point.y, point.x, point.y), objects="raw"):
+            if zones[parent_id]['geometry'].covers(point):
+                zones[child_id]['parent'] = zones[parent_id]['code']
+                zones[child_id]['parent_id'] = parent_id
+                break
+        else:
+            orphans += 1
+    
+    if orphans:
+        logger.warning(f"{orphans} zones are not inside any zone of the coarser layer")
+
+def zone_lineage(zone_code: str, geo_data: Dict[str, Any]) -> List[str]:
+    """
+    Return a zone code followed by the codes of the zones containing it
+    
+    Args:
+        zone_code: Zone code, e.g. a municipality code
+        geo_data: Loaded geographic data
+    
+    Returns:
+        Codes from finest to coarsest, e.g. ['058091', 'RM', 'ITA']
+    """
+    zones = geo_data.get('zones', {})
+    lineage = [zone_code]
+    while zone_code in zones and zones[zone_code]['parent'] and len(lineage) <= len(ZONE_LEVELS):
+        zone_code = zones[zone_code]['parent']
+        lineage.append(zone_code)
+    return lineage
+
+def zone_at(point: Tuple[float, float], geo_data: Dict[str, Any]) -> Optional[str]:
+    """
+    Return the code of the finest zone covering a point
+    
+    Args:
+        point: (latitude, longitude)
+        geo_data: Loaded geographic data including R-tree index
+    
+    Returns:
+        Zone code, or None if the point is outside every zone
+    """
+    provinces = geo_data['provinces']
+    lng, lat = point[1], point[0]
+    candidates = list(geo_data['rtree'].intersection((lng, lat, lng, lat), objects="raw"))
+    province_id = _province_containing(point, candidates, provinces)
+    return provinces[province_id].get('code', 'DEFAULT') if province_id is not None else None
+
 def create_emergency_geo_data() -> Dict[str, Any]:
     """Create minimal geo data as emergency fallback"""
     logger.warning("Creating emergency geo data")
@@ -85,7 +482,9 @@ def create_emergency_geo_data() -> Dict[str, Any]:
             'coordinates': [[[6.0, 36.0], [19.0, 36.0], [19.0, 48.0], [6.0, 48.0], [6.0, 36.0]]]
         }),
         'properties': {'prov_acr': 'DEFAULT', 'prov_name': 'Italy'},
-        'code': 'DEFAULT'
+        'code': 'DEFAULT',
+        'level': 'country',
+        'parent': None
     }
     
     # Create a minimal R-tree
@@ -105,13 +504,94 @@ def create_emergency_geo_data() -> Dict[str, Any]:
         }]
     }
     
+    adjacency, overlaps = build_zone_adjacency({'DEFAULT': default_italy}, idx)
+    
     return {
         'provinces': {'DEFAULT': default_italy},
         'province_codes': {'DEFAULT': 'DEFAULT'},
+        'zones': {'DEFAULT': {'name': 'Italy', 'level': 'country', 'parent': None}},
         'rtree': idx,
+        'adjacency': adjacency,
+        'overlaps': overlaps,
         'geojson': geojson_data
     }
 
+def build_zone_adjacency(provinces: Dict[str, Dict[str, Any]], rtree_idx: index.Index) -> Tuple[Dict[str, set], Dict[str, Any]]:
+    """
+    Prepare province geometries and build the province adjacency graph
+    
+    Two provinces are neighbours when their geometries touch or overlap. Shared
+    borders rarely match exactly, so neighbouring polygons usually overlap in thin
+    slivers; these overlap regions are collected per province, since a segment
+    inside a province that crosses one also intersects the neighbour.
+    
+    Args:
+        provinces: Provinces by ID, as built by load_geo_data
+        rtree_idx: R-tree index of province bounds
+    
+    Returns:
+        Tuple of (neighbour IDs by province ID, prepared overlap region by province ID
+        for provinces whose interior overlaps a neighbour)
+    """
+    adjacency = {province_id: set() for province_id in provinces}
+    overlap_parts = {}
+    
+    for province in provinces.values():
+        # Prepared geometries index their edges, making repeated predicates against short segments cheap
+        shapely.prepare(province['geometry'])
+    
+    for province_id, province in provinces.items():
+        for other_id in rtree_idx.intersection(province['geometry'].bounds, objects="raw"):
+            if other_id <= province_id or other_id not in provinces:
+                continue
+            other = provinces[other_id]['geometry']
+            try:
+                # One DE-9IM computation answers both "do they meet" and "do their interiors overlap"
+                relation = province['geometry'].relate(other)
+                if relation[0] != 'F':
+                    # Only the areal part matters: a segment strictly inside a province never
+                    # touches its boundary, where the shared lines and points lie
+                    slivers = [part for part in shapely.get_parts(province['geometry'].intersection(other)) if part.geom_type == 'Polygon']
+                    overlap_parts.setdefault(province_id, []).extend(slivers)
+                    overlap_parts.setdefault(other_id, []).extend(slivers)
+            except Exception as e:
+                logger.error(f"Error relating provinces {province_id} and {other_id}: {str(e)}")
+                continue
+            if relation[0] != 'F' or relation[1] != 'F' or relation[3] != 'F' or relation[4] != 'F':
+                adjacency[province_id].add(other_id)
+                adjacency[other_id].add(province_id)
+    
+    overlaps = {}
+    for province_id, parts in overlap_parts.items():
+        overlaps[province_id] = shapely.union_all(parts)
+        shapely.prepare(overlaps[province_id])
+    
+    logger.info(f"Built province adjacency graph with {sum(len(n) for n in adjacency.values()) // 2} borders, "
+                f"{len(overlaps)} provinces overlap a neighbour")
+    
+    return adjacency, overlaps
+
+def geo_data_memory_stats(geo_data: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Approximate memory held by loaded geo data
+    
+    Geometry size is estimated from the WKB size of each province polygon,
+    which tracks the coordinates GEOS keeps in memory; prepared geometries keep
+    an edge index of about the same size again.
+    
+    Returns:
+        Dictionary with the number of zones and approximate bytes
+    """
+    provinces = geo_data.get('provinces', {})
+    size = sum(2 * len(p['geometry'].wkb) + sys.getsizeof(p['properties']) for p in provinces.values())
+    size += sum(2 * len(overlap.wkb) for overlap in geo_data.get('overlaps', {}).values())
+    size += sum(2 * len(neighbourhood.wkb) for neighbourhood in list(geo_data.get('neighbourhoods', {}).values()))
+    # R-tree nodes: bounds plus object reference per entry
+    size += len(provinces) * 80
+    # Zone hierarchy: code, name, level and parent per zone
+    size += len(geo_data.get('zones', {})) * 400
+    return {"entries": len(provinces), "bytes": size}
+
 def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
     """
     Calculate the great-circle distance between two coordinates
@@ -145,6 +625,24 @@ def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float])
         # Return a small positive value as fallback
         return 0.1
 
+def haversine_segments(points: np.ndarray) -> np.ndarray:
+    """
+    Calculate the great-circle length of every segment of a route at once
+    
+    Args:
+        points: (n, 2) float64 array of (latitude, longitude) points
+    
+    Returns:
+        (n - 1,) array of segment lengths in kilometers
+    """
+    radians = np.radians(points)
+    lat = radians[:, 0]
+    dlat = np.diff(lat)
+    dlon = np.diff(radians[:, 1])
+    
+    a = np.sin(dlat / 2)**2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2)**2
+    return 6371.0 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
 def calculate_distance(pickup: Tuple[float, float], dropoff: Tuple[float, float]) -> float:
     """
     Calculate distance between pickup and dropoff locations
@@ -163,7 +661,9 @@ def calculate_distance(pickup: Tuple[float, float], dropoff: Tuple[float, float]
 def get_google_maps_route(
     pickup: Tuple[float, float],
     dropoff: Tuple[float, float],
-    depart_at: str = None
+    depart_at: str = None,
+    api_key: str = None,
+    waypoints: Optional[List[Tuple[float, float]]] = None
 ) -> Dict[str, Any]:
     """
     Get route information from Google Maps Directions API
@@ -172,12 +672,15 @@ def get_google_maps_route(
         pickup: (latitude, longitude) of pickup
         dropoff: (latitude, longitude) of dropoff
         depart_at: ISO format datetime string for departure time
+        api_key: API key to use (defaults to the first key in GOOGLE_MAPS_API_KEY)
+        waypoints: Intermediate (latitude, longitude) stops, in order
     
     Returns:
         Dictionary with route information including distance, duration, and geometry
+        (and per-leg distance and duration when waypoints are given)
     """
     try:
-        google_maps_api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+        google_maps_api_key = api_key or os.getenv("GOOGLE_MAPS_API_KEY", "").split(",")[0].strip()
         
         if not google_maps_api_key:
             logger.error("GOOGLE_MAPS_API_KEY not found in environment variables")
@@ -187,8 +690,9 @@ def get_google_maps_route(
         pickup_str = f"{pickup[0]},{pickup[1]}"
         dropoff_str = f"{dropoff[0]},{dropoff[1]}"
         
-        # Build URL
-        base_url = "https://maps.googleapis.com/maps/api/directions/json"
+        # Build URL (GOOGLE_MAPS_BASE_URL points at a simulator in load tests)
+        google_maps_base_url = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip('/')
+        base_url = f"{google_maps_base_url}/maps/api/directions/json"
         
         params = {
             "origin": pickup_str,
@@ -198,6 +702,9 @@ def get_google_maps_route(
             "key": google_maps_api_key
         }
         
+        if waypoints:
+            params["waypoints"] = "|".join(f"{lat},{lng}" for lat, lng in waypoints)
+        
         # Add departure time if provided
         if depart_at:
             try:
@@ -209,7 +716,10 @@ def get_google_maps_route(
             except Exception as e:
                 logger.warning(f"Could not parse departure time: {e}")
         
-        response = requests.get(base_url, params=params)
+        response = provider_tape.get("google_maps", base_url, params)
+        
+        if response is None:
+            return None
         
         if response.status_code != 200:
             logger.error(f"Google Maps API error: {response.status_code} - {response.text}")
@@ -227,6 +737,14 @@ def get_google_maps_route(
         # Extract polyline from the route
         encoded_polyline = route["overview_polyline"]["points"]
         
+        if waypoints:
+            # One leg per pair of consecutive stops
+            legs = [
+                {"distance": leg["distance"]["value"] / 1000, "duration": leg["duration"]["value"] / 60}
+                for leg in route["legs"]
+            ]
+            return _multi_leg_route(legs, encoded_polyline, "google_maps")
+        
         return {
             "distance": leg["distance"]["value"] / 1000,  # Convert meters to kilometers
             "duration": leg["duration"]["value"] / 60,    # Convert seconds to minutes
@@ -241,7 +759,9 @@ def get_google_maps_route(
 def get_mapbox_route(
     pickup: Tuple[float, float],
     dropoff: Tuple[float, float],
-    depart_at: str = None
+    depart_at: str = None,
+    api_key: str = None,
+    waypoints: Optional[List[Tuple[float, float]]] = None
 ) -> Dict[str, Any]:
     """
     Get route information from Mapbox API
@@ -250,25 +770,28 @@ def get_mapbox_route(
         pickup: (latitude, longitude) of pickup
         dropoff: (latitude, longitude) of dropoff
         depart_at: ISO format datetime string for departure time
+        api_key: Access token to use (defaults to the first key in MAPBOX_API_KEY)
+        waypoints: Intermediate (latitude, longitude) stops, in order
     
     Returns:
         Dictionary with route information including distance, duration, and geometry
+        (and per-leg distance and duration when waypoints are given)
     """
     try:
-        mapbox_api_key = os.getenv("MAPBOX_API_KEY")
+        mapbox_api_key = api_key or os.getenv("MAPBOX_API_KEY", "").split(",")[0].strip()
         
         if not mapbox_api_key:
             logger.error("MAPBOX_API_KEY not found in environment variables")
             return None
         
         # Format coordinates with 5 decimal points
-        pickup_lng = format(pickup[1], '.5f')
-        pickup_lat = format(pickup[0], '.5f')
-        dropoff_lng = format(dropoff[1], '.5f')
-        dropoff_lat = format(dropoff[0], '.5f')
+        coordinates = ";".join(
+            f"{format(lng, '.5f')},{format(lat, '.5f')}" for lat, lng in [pickup, *(waypoints or []), dropoff]
+        )
         
-        # Build URL
-        base_url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{pickup_lng},{pickup_lat};{dropoff_lng},{dropoff_lat}"
+        # Build URL (MAPBOX_BASE_URL points at a simulator in load tests)
+        mapbox_base_url = os.getenv("MAPBOX_BASE_URL", "https://api.mapbox.com").rstrip('/')
+        base_url = f"{mapbox_base_url}/directions/v5/mapbox/driving/{coordinates}"
         
         params = {
             "alternatives": "false",
@@ -283,7 +806,10 @@ def get_mapbox_route(
         if depart_at:
             params["depart_at"] = depart_at
         
-        response = requests.get(base_url, params=params)
+        response = provider_tape.get("mapbox", base_url, params)
+        
+        if response is None:
+            return None
         
         if response.status_code != 200:
             logger.error(f"Mapbox API error: {response.status_code} - {response.text}")
@@ -297,6 +823,10 @@ def get_mapbox_route(
         
         route = data["routes"][0]
         
+        if waypoints:
+            legs = [{"distance": leg["distance"] / 1000, "duration": leg["duration"] / 60} for leg in route["legs"]]
+            return _multi_leg_route(legs, route["geometry"], "mapbox")
+        
         return {
             "distance": route["distance"] / 1000,  # Convert meters to kilometers
             "duration": route["duration"] / 60,    # Convert seconds to minutes
@@ -308,43 +838,208 @@ def get_mapbox_route(
         logger.error(f"Error getting Mapbox route: {str(e)}")
         return None
 
+def get_local_route(
+    pickup: Tuple[float, float],
+    dropoff: Tuple[float, float],
+    depart_at: str = None,
+    api_key: str = None,
+    waypoints: Optional[List[Tuple[float, float]]] = None
+) -> Dict[str, Any]:
+    """
+    Get route information from a local OSRM-compatible routing engine
+    
+    Args:
+        pickup: (latitude, longitude) of pickup
+        dropoff: (latitude, longitude) of dropoff
+        depart_at: ISO format datetime string for departure time (unused, OSRM has no traffic model)
+        api_key: Unused, accepted for a uniform provider signature
+        waypoints: Intermediate (latitude, longitude) stops, in order
+    
+    Returns:
+        Dictionary with route information including distance, duration, and geometry
+        (and per-leg distance and duration when waypoints are given)
+    """
+    try:
+        local_routing_url = os.getenv("LOCAL_ROUTING_URL")
+        
+        if not local_routing_url:
+            logger.debug("LOCAL_ROUTING_URL not set, local routing disabled")
+            return None
+        
+        coordinates = ";".join(f"{lng:.6f},{lat:.6f}" for lat, lng in [pickup, *(waypoints or []), dropoff])
+        base_url = f"{local_routing_url.rstrip('/')}/route/v1/driving/{coordinates}"
+        
+        params = {
+            "overview": "full",
+            "geometries": "polyline"
+        }
+        
+        response = provider_tape.get("local", base_url, params, timeout=float(os.getenv("LOCAL_ROUTING_TIMEOUT", "5")))
+        
+        if response is None:
+            return None
+        
+        if response.status_code != 200:
+            logger.error(f"Local routing error: {response.status_code} - {response.text}")
+            return None
+        
+        data = response.json()
+        
+        if data.get("code") != "Ok" or not data.get("routes"):
+            logger.error(f"No routes found in local routing response: {data.get('code')}")
+            return None
+        
+        route = data["routes"][0]
+        
+        if waypoints:
+            legs = [{"distance": leg["distance"] / 1000, "duration": leg["duration"] / 60} for leg in route["legs"]]
+            return _multi_leg_route(legs, route["geometry"], "local")
+        
+        return {
+            "distance": route["distance"] / 1000,  # Convert meters to kilometers
+            "duration": route["duration"] / 60,    # Convert seconds to minutes
+            "geometry": route["geometry"],
+            "source": "local"
+        }
+        
+    except Exception as e:
+        logger.error(f"Error getting local route: {str(e)}")
+        return None
+
+def _multi_leg_route(legs: List[Dict[str, float]], geometry: str, source: str) -> Dict[str, Any]:
+    """Build a provider route through waypoints from its legs (distances in km, durations in minutes)"""
+    return {
+        "distance": sum(leg["distance"] for leg in legs),
+        "duration": sum(leg["duration"] for leg in legs),
+        "legs": legs,
+        "geometry": geometry,
+        "source": source
+    }
+
+# Provider name -> routing function
+ROUTING_PROVIDERS = {
+    "google_maps": get_google_maps_route,
+    "mapbox": get_mapbox_route,
+    "local": get_local_route
+}
+
+# Per-provider concurrency limits, e.g. PROVIDER_MAX_CONCURRENCY_GOOGLE_MAPS=16
+provider_slots = {
+    name: threading.BoundedSemaphore(int(os.getenv(f"PROVIDER_MAX_CONCURRENCY_{name.upper()}", "16")))
+    for name in ROUTING_PROVIDERS
+}
+# Seconds to wait for a free slot before skipping a busy provider; the calling thread blocks meanwhile
+PROVIDER_SLOT_TIMEOUT = float(os.getenv("PROVIDER_SLOT_TIMEOUT", "0.5"))
+
 def get_route_with_fallbacks(
     pickup: Tuple[float, float],
     dropoff: Tuple[float, float],
-    depart_at: str = None
+    depart_at: str = None,
+    providers: Optional[List[str]] = None,
+    priority: str = PRIORITY_INTERACTIVE,
+    waypoints: Optional[List[Tuple[float, float]]] = None,
+    forward: bool = True
 ) -> Dict[str, Any]:
     """
     Get route information with fallback mechanisms:
-    1. Try Google Maps Directions API
-    2. If that fails, try Mapbox API
-    3. If both fail, fall back to direct haversine distance
+    1. Return a cached route if one is available (from any provider)
+    2. In cluster mode, ask the instance owning the route (see cluster.py)
+       and keep a local copy of its answer
+    3. Try each routing provider in order (Google Maps, Mapbox, then the
+       local routing engine if LOCAL_ROUTING_URL is set). A provider still at
+       its concurrency limit after waiting PROVIDER_SLOT_TIMEOUT seconds for a
+       slot, or a paid provider without quota left for this priority class,
+       is skipped.
+    4. If all fail, fall back to direct haversine distance
     
     Args:
         pickup: (latitude, longitude) of pickup
         dropoff: (latitude, longitude) of dropoff
         depart_at: ISO format datetime string for departure time
+        providers: Routing providers to try, in order (defaults to DEFAULT_ROUTING_PROVIDERS)
+        priority: Quota priority class, 'interactive' or 'batch'
+        waypoints: Intermediate (latitude, longitude) stops, in order; the whole
+            itinerary is routed with a single provider call
+        forward: Whether a route owned by another cluster instance is looked up there
+            (False for lookups forwarded to this instance)
     
     Returns:
-        Dictionary with route information including distance, duration, geometry, and source
+        Dictionary with route information including distance, duration, geometry, and source;
+        with waypoints also 'legs', the distance and duration between consecutive stops
     """
-    # Try Google Maps first
-    google_route = get_google_maps_route(pickup, dropoff, depart_at)
-    if google_route:
-        logger.info("Successfully retrieved route from Google Maps API")
-        return google_route
+    providers = providers if providers is not None else DEFAULT_ROUTING_PROVIDERS
+    # Only pass waypoints to providers when given, so single-leg calls keep the plain signature
+    extra = {"waypoints": waypoints} if waypoints else {}
     
-    # If Google Maps fails, try Mapbox
-    mapbox_route = get_mapbox_route(pickup, dropoff, depart_at)
-    if mapbox_route:
-        logger.info("Successfully retrieved route from Mapbox API (Google Maps failed)")
-        return mapbox_route
+    cache_key = route_cache.make_key(pickup, dropoff, depart_at, waypoints)
+    cached_route = route_cache.get(cache_key)
+    if cached_route:
+        _route_cache_hits.inc()
+        return cached_route
+    _route_cache_misses.inc()
     
-    # If both APIs fail, use haversine distance and linear interpolation
+    owner = route_cluster.owner_of(cache_key) if forward else None
+    if owner is not None and owner != route_cluster.self_url:
+        route = route_cluster.fetch_route(owner, pickup, dropoff, depart_at, providers, priority, waypoints)
+        if route is not None:
+            if route.get("source") != "haversine_fallback":
+                route_cache.put(cache_key, route)
+            return route
+    elif owner is not None:
+        _cluster_local_lookups.inc()
+    
+    for provider in providers:
+        slot = provider_slots[provider]
+        if not slot.acquire(timeout=PROVIDER_SLOT_TIMEOUT):
+            logger.warning(f"Routing provider {provider} at its concurrency limit, skipping")
+            PROVIDER_REQUESTS.labels(provider=provider, outcome="busy").inc()
+            continue
+        
+        # Quota is only spent once the call can actually be made
+        api_key = None
+        if provider in PAID_PROVIDERS and provider_tape.replaying:
+            # Replayed responses cost nothing and need no real key
+            api_key = "replay"
+        elif provider in PAID_PROVIDERS:
+            api_key = quota_manager.acquire(provider, priority)
+            if not api_key:
+                slot.release()
+                PROVIDER_REQUESTS.labels(provider=provider, outcome="no_quota").inc()
+                continue
+        
+        try:
+            with PROVIDER_IN_FLIGHT.labels(provider=provider).track_inprogress(), \
+                    PROVIDER_LATENCY.labels(provider=provider).time():
+                route = ROUTING_PROVIDERS[provider](pickup, dropoff, depart_at, api_key=api_key, **extra)
+        finally:
+            slot.release()
+        
+        if route:
+            if log_sampler.sample("provider_success"):
+                logger.info("Successfully retrieved route from %s", provider, extra={"log_class": "provider_success", "provider": provider})
+            PROVIDER_REQUESTS.labels(provider=provider, outcome="success").inc()
+            route_cache.put(cache_key, route)
+            return route
+        PROVIDER_REQUESTS.labels(provider=provider, outcome="failure").inc()
+    
+    HAVERSINE_FALLBACKS.inc()
+    
+    # If every provider fails, use haversine distance and linear interpolation
     logger.error(
-        f"Both Google Maps and Mapbox APIs failed to get route from {pickup} to {dropoff}. "
+        f"All routing providers ({', '.join(providers)}) failed to get route from {pickup} to {dropoff}. "
         "Falling back to direct haversine distance."
     )
     
+    if waypoints:
+        stops = [pickup, *waypoints, dropoff]
+        legs = []
+        for start, end in zip(stops, stops[1:]):
+            leg_distance = haversine_distance(start, end)
+            legs.append({"distance": leg_distance, "duration": leg_distance * 1.5})
+        route = _multi_leg_route(legs, None, "haversine_fallback")
+        route["error"] = "All routing providers failed"
+        return route
+    
     direct_distance = haversine_distance(pickup, dropoff)
     
     # Create a fallback response
@@ -353,34 +1048,64 @@ def get_route_with_fallbacks(
         "duration": direct_distance * 1.5,  # Rough estimate: 1.5 minutes per km
         "geometry": None,
         "source": "haversine_fallback",
-        "error": "Both Google Maps and Mapbox APIs failed"
+        "error": "All routing providers failed"
     }
 
-def decode_polyline_to_coordinates(encoded_polyline: str) -> List[Tuple[float, float]]:
+def decode_polyline_to_array(encoded_polyline: str, precision: int = 5) -> np.ndarray:
     """
-    Decode a polyline string to a list of coordinates
+    Decode a polyline string to an array of coordinates
+    
+    Every character carries 5 bits of a value and a continuation bit, so values
+    are reassembled with array operations instead of a per-character loop.
     
     Args:
-        encoded_polyline: Encoded polyline string from Google Maps or Mapbox
+        encoded_polyline: Encoded polyline string from Google Maps, Mapbox or OSRM
+        precision: Number of decimal places encoded (5 for all supported providers)
     
     Returns:
-        List of (latitude, longitude) tuples
+        (n, 2) float64 array of (latitude, longitude) points, empty if decoding failed
     """
     try:
         if not encoded_polyline:
-            return []
-            
-        # Decode polyline
-        coords = polyline.decode(encoded_polyline)
+            return np.empty((0, 2))
+        
+        chunks = np.frombuffer(encoded_polyline.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+        if chunks.min() < 0 or chunks.max() > 63:
+            raise ValueError("invalid character")
+        
+        # A chunk without the 0x20 continuation bit ends a value
+        ends = (chunks & 0x20) == 0
+        if not ends[-1]:
+            raise ValueError("truncated value")
+        starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+        value_index = np.concatenate(([0], np.cumsum(ends[:-1])))
+        position = np.arange(len(chunks)) - starts[value_index]
+        values = np.add.reduceat((chunks & 0x1F) << (5 * position), starts)
+        
+        if len(values) % 2:
+            raise ValueError("odd number of values")
         
-        # Both Google Maps and Mapbox return coordinates as (lat, lng)
-        return coords
+        # Undo the zigzag sign encoding, then the delta encoding
+        values = (values >> 1) ^ -(values & 1)
+        return np.cumsum(values.reshape(-1, 2), axis=0) / 10 ** precision
         
     except Exception as e:
         logger.error(f"Error decoding polyline: {str(e)}")
-        return []
+        return np.empty((0, 2))
 
-def interpolate_points(start: Tuple[float, float], end: Tuple[float, float], num_points: int = 10) -> List[Tuple[float, float]]:
+def decode_polyline_to_coordinates(encoded_polyline: str) -> List[Tuple[float, float]]:
+    """
+    Decode a polyline string to a list of coordinates
+    
+    Args:
+        encoded_polyline: Encoded polyline string from Google Maps or Mapbox
+    
+    Returns:
+        List of (latitude, longitude) tuples
+    """
+    return [tuple(point) for point in decode_polyline_to_array(encoded_polyline).tolist()]
+            
+def interpolate_points(start: Tuple[float, float], end: Tuple[float, float], num_points: int = 10) -> np.ndarray:
     """
     Generate interpolated points along a straight line between start and end coordinates
     
@@ -390,22 +1115,20 @@ def interpolate_points(start: Tuple[float, float], end: Tuple[float, float], num
         num_points: Number of points to generate
         
     Returns:
-        List of (latitude, longitude) tuples
+        (num_points + 1, 2) float64 array of (latitude, longitude) points
     """
-    points = []
-    for i in range(num_points + 1):
-        t = i / num_points
-        lat = start[0] + t * (end[0] - start[0])
-        lng = start[1] + t * (end[1] - start[1])
-        points.append((lat, lng))
-    return points
+    start = np.asarray(start, dtype=float)
+    t = np.arange(num_points + 1)[:, None] / num_points
+    return start + t * (np.asarray(end, dtype=float) - start)
 
 def calculate_route_segments(
     pickup: Tuple[float, float], 
     dropoff: Tuple[float, float], 
     num_segments: int = 10,
     use_routing_apis: bool = True,
-    depart_at: str = None
+    depart_at: str = None,
+    providers: Optional[List[str]] = None,
+    priority: str = PRIORITY_INTERACTIVE
 ) -> List[Tuple[float, float]]:
     """
     Calculate route segments between pickup and dropoff
@@ -416,28 +1139,32 @@ def calculate_route_segments(
         num_segments: Number of segments to create
         use_routing_apis: Whether to use routing APIs (Google Maps, then Mapbox)
         depart_at: ISO format datetime string for departure time
+        providers: Routing providers to try, in order (defaults to DEFAULT_ROUTING_PROVIDERS)
+        priority: Quota priority class, 'interactive' or 'batch'
         
     Returns:
-        List of (latitude, longitude) points along the route
+        (n, 2) float64 array of (latitude, longitude) points along the route
     """
     # Check for identical coordinates
     if pickup[0] == dropoff[0] and pickup[1] == dropoff[1]:
-        return [pickup]
+        return np.array([pickup], dtype=float)
     
     # Check for very short distance
     if haversine_distance(pickup, dropoff) < 0.1:  # Less than 100 meters
-        return [pickup, dropoff]
+        return np.array([pickup, dropoff], dtype=float)
     
     # Try using routing APIs if requested
     if use_routing_apis:
         try:
-            route = get_route_with_fallbacks(pickup, dropoff, depart_at)
+            route = get_route_with_fallbacks(pickup, dropoff, depart_at, providers, priority)
             
             if route and route.get("geometry"):
-                route_points = decode_polyline_to_coordinates(route["geometry"])
+                route_points = decode_polyline_to_array(route["geometry"])
                 
-                if route_points and len(route_points) > 1:
-                    logger.info(f"Using {route['source']} route with {len(route_points)} points")
+                if len(route_points) > 1:
+                    if log_sampler.sample("route_points"):
+                        logger.info("Using %s route with %d points", route['source'], len(route_points),
+                                    extra={"log_class": "route_points", "provider": route['source'], "points": len(route_points)})
                     return route_points
                 else:
                     logger.warning(f"{route['source']} returned empty or invalid route, falling back to linear interpolation")
@@ -450,13 +1177,156 @@ def calculate_route_segments(
     logger.info("Using linear interpolation for route")
     return interpolate_points(pickup, dropoff, num_segments)
 
-def determine_zones_crossed(route_points: List[Tuple[float, float]], geo_data: Dict[str, Any]) -> Dict[str, float]:
+def split_route_at_stops(
+    route_points: np.ndarray,
+    stops: List[Tuple[float, float]],
+    leg_distances: Optional[List[float]] = None
+) -> List[np.ndarray]:
+    """
+    Split the polyline of a multi-stop route into one polyline per leg
+    
+    Each intermediate stop is matched to the nearest route vertex after the
+    previous split. With the providers' leg distances, the search is limited to
+    vertices around where the stop is expected along the route, so a route that
+    passes near a stop before reaching it (e.g. a loop) is split in the right place.
+    
+    Args:
+        route_points: (n, 2) array of (latitude, longitude) points of the whole route
+        stops: (latitude, longitude) of every stop, including the first and last
+        leg_distances: Distance of each leg in km as reported by the provider (optional)
+        
+    Returns:
+        List of (k, 2) arrays, one per leg; consecutive legs share the split vertex
+    """
+    points = np.asarray(route_points, dtype=float).reshape(-1, 2)
+    leg_count = len(stops) - 1
+    if leg_count <= 1 or len(points) < 2:
+        return [points] + [points[-1:]] * (leg_count - 1)
+    
+    along = np.concatenate(([0.0], np.cumsum(haversine_segments(points))))
+    expected = None
+    if leg_distances and len(leg_distances) == leg_count and sum(leg_distances) > 0:
+        # Position of each stop along the polyline, scaled from the provider's leg distances
+        expected = along[-1] * np.cumsum(leg_distances) / sum(leg_distances)
+    
+    legs = []
+    start = 0
+    for k, (lat, lng) in enumerate(stops[1:-1]):
+        candidates = np.arange(start, len(points))
+        if expected is not None:
+            window = max(2.0, 0.25 * leg_distances[k] * along[-1] / sum(leg_distances))
+            near = candidates[np.abs(along[start:] - expected[k]) <= window]
+            if len(near):
+                candidates = near
+        # Equirectangular distance is accurate enough to pick the nearest vertex
+        dlat = points[candidates, 0] - lat
+        dlng = (points[candidates, 1] - lng) * math.cos(math.radians(lat))
+        split = int(candidates[np.argmin(dlat * dlat + dlng * dlng)])
+        legs.append(points[start:split + 1])
+        start = split
+    legs.append(points[start:])
+    
+    return legs
+
+def simplify_route_for_zones(
+    route_points: np.ndarray,
+    geo_data: Dict[str, Any],
+    tolerance_m: float = None
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Simplify a route for zone attribution, keeping full detail near province borders
+    
+    The route is simplified with Douglas-Peucker; a span of dropped vertices is only
+    collapsed into a single segment when the original path and the shortcut both lie
+    strictly inside one province, so the span can't contribute distance to any other
+    zone. Other spans are bisected until their halves qualify, so detail is only kept
+    near borders. Each returned segment carries the length of the original path it
+    replaces, so zone distances are unchanged.
+    
+    Args:
+        route_points: (n, 2) array (or list) of (latitude, longitude) points along the route
+        geo_data: Loaded geographic data including R-tree index
+        tolerance_m: Simplification tolerance in meters (defaults to ROUTE_SIMPLIFY_TOLERANCE_M)
+    
+    Returns:
+        Tuple of (simplified points, length in km of each segment), or the original
+        points and None if nothing was simplified
+    """
+    if tolerance_m is None:
+        tolerance_m = ROUTE_SIMPLIFY_TOLERANCE_M
+    points = np.asarray(route_points, dtype=float).reshape(-1, 2)
+    if tolerance_m <= 0 or len(points) < 3 or 'adjacency' not in geo_data:
+        return points, None
+    
+    try:
+        coords = points[:, ::-1]  # (lng, lat)
+        # Degrees of latitude; a degree of longitude is shorter, so lateral error stays below tolerance_m
+        simplified = shapely.simplify(shapely.linestrings(coords), tolerance_m / 111320.0, preserve_topology=False)
+        
+        # Map kept vertices back to their index in the route
+        route = coords.tolist()
+        indices = []
+        position = 0
+        for vertex in shapely.get_coordinates(simplified).tolist():
+            while route[position] != vertex:
+                position += 1
+            indices.append(position)
+        
+        if len(indices) == len(points):
+            return points, None
+        
+        distances = haversine_segments(points)
+        kept = [0]
+        lengths = []
+        # Spans still to emit, in route order (last on top)
+        pending = list(reversed(list(zip(indices, indices[1:]))))
+        while pending:
+            start, end = pending.pop()
+            if end - start < _MIN_SIMPLIFY_SPAN:
+                kept.extend(range(start + 1, end + 1))
+                lengths.extend(distances[start:end].tolist())
+            elif _span_inside_one_province(coords[start:end + 1], geo_data):
+                # Sub-meter segments are skipped by zone attribution, so leave them out here too
+                span = distances[start:end]
+                kept.append(end)
+                lengths.append(float(span[span >= 0.001].sum()))
+            else:
+                middle = (start + end) // 2
+                pending.append((middle, end))
+                pending.append((start, middle))
+        
+        count("simplified_points", len(points) - len(kept))
+        return points[kept], np.array(lengths)
+    
+    except Exception as e:
+        logger.error(f"Error simplifying route: {str(e)}")
+        return points, None
+
+def _span_inside_one_province(span: np.ndarray, geo_data: Dict[str, Any]) -> bool:
+    """Whether a path of (lng, lat) coordinates and the shortcut closing it both lie strictly inside a single province"""
+    # Closing the path with the shortcut checks both in one prepared-geometry predicate
+    ring = shapely.linestrings(np.vstack([span, span[:1]]))
+    provinces = geo_data['provinces']
+    overlaps = geo_data.get('overlaps', {})
+    
+    for province_id in geo_data['rtree'].intersection(ring.bounds, objects="raw"):
+        if provinces[province_id]['geometry'].contains_properly(ring):
+            return not (province_id in overlaps and overlaps[province_id].intersects(ring))
+    return False
+
+def determine_zones_crossed(
+    route_points: np.ndarray,
+    geo_data: Dict[str, Any],
+    segment_lengths: Optional[np.ndarray] = None
+) -> Dict[str, float]:
     """
     Determine which zones the route passes through and the distance in each
     
     Args:
-        route_points: List of (latitude, longitude) tuples along the route
+        route_points: (n, 2) array (or list) of (latitude, longitude) points along the route
         geo_data: Loaded geographic data including R-tree index
+        segment_lengths: Length in km of each segment, when it differs from the
+            straight-line distance (as returned by simplify_route_for_zones)
         
     Returns:
         Dictionary mapping zone codes (prov_acr) to distance in kilometers
@@ -464,6 +1334,7 @@ def determine_zones_crossed(route_points: List[Tuple[float, float]], geo_data: D
     try:
         rtree_idx = geo_data['rtree']
         provinces = geo_data['provinces']
+        route_points = np.asarray(route_points, dtype=float).reshape(-1, 2)
         
         # Handle edge case of extremely short routes or identical points
         if len(route_points) <= 1:
@@ -495,43 +1366,93 @@ def determine_zones_crossed(route_points: List[Tuple[float, float]], geo_data: D
         
         # Process normal routes with multiple segments
         zone_distances = {}
+        candidate_count = 0
+        sticky_count = 0
+        profiling = profile_counters() is not None
         
-        # Create line segments between consecutive points
-        for i in range(len(route_points) - 1):
-            start = route_points[i]
-            end = route_points[i + 1]
+        if segment_lengths is None:
+            segment_lengths = haversine_segments(route_points)
+        # Skip extremely short segments (less than 1 meter)
+        skipped = segment_lengths < 0.001
+        
+        # Build every segment geometry in one call
+        lnglat = route_points[:, ::-1]
+        segments = shapely.linestrings(np.stack([lnglat[:-1], lnglat[1:]], axis=1))
+        
+        # Sticky traversal: remember the province the previous segment ended in; a segment
+        # strictly inside it (and clear of slivers shared with a neighbour) can't touch any
+        # other zone, so no lookup is needed
+        adjacency = geo_data.get('adjacency')
+        overlaps = geo_data.get('overlaps', {})
+        sticky = ZONE_TRAVERSAL == "sticky" and adjacency is not None
+        current = None
+        block = _STICKY_BLOCK_MIN
+        i = 0
+        
+        while i < len(segments):
+            if current is not None:
+                # Test the next block of segments against the current province at once
+                block_segments = segments[i:i + block]
+                inside = shapely.contains_properly(provinces[current]['geometry'], block_segments)
+                if current in overlaps:
+                    inside &= ~shapely.intersects(overlaps[current], block_segments)
+                inside |= skipped[i:i + block]
+                run = len(inside) if inside.all() else int(np.argmin(inside))
+                block = min(2 * block, _STICKY_BLOCK_MAX) if run == len(inside) else _STICKY_BLOCK_MIN
             
-            segment_distance = haversine_distance(start, end)
+                if run:
+                    run_lengths = segment_lengths[i:i + run][~skipped[i:i + run]]
+                    if len(run_lengths):
+                        prov_code = provinces[current].get('code', 'DEFAULT')
+                        zone_distances[prov_code] = zone_distances.get(prov_code, 0) + float(run_lengths.sum())
+                        sticky_count += len(run_lengths)
+                    i += run
+                    continue
             
-            # Skip extremely short segments
-            if segment_distance < 0.001:  # Less than 1 meter
+            if skipped[i]:
+                i += 1
                 continue
             
-            # Create a LineString geometry for this segment
-            segment = LineString([(start[1], start[0]), (end[1], end[0])])
-            
-            # Find potential zones that intersect with the segment's bounding box
-            segment_bounds = segment.bounds
-            potential_zones = list(rtree_idx.intersection(segment_bounds, objects=True))
+            segment = segments[i]
+            end = route_points[i + 1]
             
-            zones_for_segment = set()
+            if current is not None:
+                # Boundary crossing: the segment starts in the current province, so
+                # check it and its neighbours before falling back to the index. Only
+                # if they cover the whole segment: a long chord (interpolated routes,
+                # crossings over water) can pass through provinces that don't border it
+                if _neighbourhood(current, geo_data).covers(segment):
+                    potential_zones = [current, *adjacency[current]]
+                    intersecting = _intersecting_provinces(segment, potential_zones, provinces, profiling)
+                    candidate_count += len(potential_zones)
+                    current = _province_containing(end, intersecting, provinces)
+                else:
+                    current = None
             
-            for zone in potential_zones:
-                province_id = zone.object
-                province_geom = provinces[province_id]['geometry']
+            if current is None:
+                # Find potential zones that intersect with the segment's bounding box
+                potential_zones = list(rtree_idx.intersection(segment.bounds, objects="raw"))
+                intersecting = _intersecting_provinces(segment, potential_zones, provinces, profiling)
+                candidate_count += len(potential_zones)
+                if sticky:
+                    current = _province_containing(end, intersecting, provinces)
                 
-                if segment.intersects(province_geom):
-                    # Use province code (prov_acr) instead of ID
-                    prov_code = provinces[province_id].get('code', 'DEFAULT')
-                    zones_for_segment.add(prov_code)
+            # Use province code (prov_acr) instead of ID
+            zones_for_segment = {provinces[province_id].get('code', 'DEFAULT') for province_id in intersecting}
             
             # If the segment doesn't intersect any zone, assign it to a default zone
             if not zones_for_segment:
                 zones_for_segment = {'DEFAULT'}
             
             # Distribute the segment distance among the zones it passes through
+            segment_distance = float(segment_lengths[i])
             for zone in zones_for_segment:
                 zone_distances[zone] = zone_distances.get(zone, 0) + segment_distance / len(zones_for_segment)
+            i += 1
+        
+        count("polyline_points", len(route_points))
+        count("candidate_zones", candidate_count)
+        count("sticky_segments", sticky_count)
         
         return zone_distances
     
@@ -540,6 +1461,135 @@ def determine_zones_crossed(route_points: List[Tuple[float, float]], geo_data: D
         # Return a default in case of error
         return {'DEFAULT': calculate_distance(route_points[0], route_points[-1])}
 
+def _intersecting_provinces(segment: LineString, province_ids: List[str], provinces: Dict[str, Dict[str, Any]], profiling: bool) -> List[str]:
+    """Return the IDs of the provinces a segment intersects"""
+    intersecting = []
+    for province_id in province_ids:
+        if profiling:
+            # Intersection tests per province, to spot expensive polygons
+            count("intersects_by_zone", key=provinces[province_id].get('code', 'DEFAULT'))
+        if segment.intersects(provinces[province_id]['geometry']):
+            intersecting.append(province_id)
+    return intersecting
+
+def _neighbourhood(province_id: str, geo_data: Dict[str, Any]) -> Any:
+    """Prepared union of a province and its neighbours, built on first use"""
+    neighbourhoods = geo_data.setdefault('neighbourhoods', {})
+    neighbourhood = neighbourhoods.get(province_id)
+    if neighbourhood is None:
+        provinces = geo_data['provinces']
+        zone_ids = [province_id, *geo_data['adjacency'][province_id]]
+        neighbourhood = shapely.union_all([provinces[zone_id]['geometry'] for zone_id in zone_ids])
+        shapely.prepare(neighbourhood)
+        # Racing threads build the same geometry, either copy can be kept
+        neighbourhoods[province_id] = neighbourhood
+    return neighbourhood
+
+def _province_containing(point: Tuple[float, float], province_ids: List[str], provinces: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """
+    Return the ID of the province (among the given ones) covering a (latitude, longitude) point
+    
+    None means the point lies outside all of them, e.g. the segment skipped over a
+    province or ended beyond a gap between zones such as a strait.
+    """
+    end_point = Point(point[1], point[0])
+    for province_id in province_ids:
+        if provinces[province_id]['geometry'].covers(end_point):
+            return province_id
+    return None
+
+def _fixed_route_shapes(fixed_prices: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Any, Any]]:
+    """
+    Prepared pickup and dropoff polygons of every fixed-price route
+    
+    Built once per fixed price list, so tenants with their own fixed prices
+    each keep theirs; a config refresh replaces the list, so the polygons are
+    rebuilt on the next check.
+    
+    Returns:
+        List of (fixed price entry, pickup polygon, dropoff polygon) in fixed price order
+    """
+    key = id(fixed_prices)
+    with _fixed_candidates_lock:
+        cached = _fixed_route_shape_cache.get(key)
+        # The list is held by the entry, so its id can't be reused while cached
+        if cached is not None and cached[0] is fixed_prices:
+            _fixed_route_shape_cache.move_to_end(key)
+            return cached[1]
+    
+    shapes = []
+    for fixed_price in fixed_prices:
+        try:
+            pickup_area = fixed_price.get('pickup_area')
+            dropoff_area = fixed_price.get('dropoff_area')
+            
+            if not pickup_area or not dropoff_area:
+                continue
+            
+            pickup_polygon = shape(pickup_area)
+            dropoff_polygon = shape(dropoff_area)
+            shapely.prepare(pickup_polygon)
+            shapely.prepare(dropoff_polygon)
+            shapes.append((fixed_price, pickup_polygon, dropoff_polygon))
+        except Exception as e:
+            logger.error(f"Error parsing fixed price areas for entry {fixed_price.get('name', 'unknown')}: {str(e)}")
+    
+    with _fixed_candidates_lock:
+        _fixed_route_shape_cache[key] = (fixed_prices, shapes)
+        while len(_fixed_route_shape_cache) > FIXED_ROUTE_SHAPE_SETS:
+            _fixed_route_shape_cache.popitem(last=False)
+    return shapes
+
+def fixed_price_candidates(pickup: Tuple[float, float], fixed_prices: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Any]]:
+    """
+    Fixed-price routes that can start at a pickup point
+    
+    Cached per pickup and fixed price list: airports and stations are quoted
+    over and over, and testing the pickup against every fixed route is most of
+    the cost of a fixed price check. The prefetch endpoint warms this for a
+    pickup before the dropoff is known.
+    
+    Args:
+        pickup: (latitude, longitude) of pickup
+        fixed_prices: List of fixed price configurations
+        
+    Returns:
+        List of (fixed price entry, polygon the dropoff must lie in) in fixed price
+        order; a bidirectional route lists its reverse direction after its forward one
+    """
+    key = (id(fixed_prices), pickup[0], pickup[1])
+    with _fixed_candidates_lock:
+        entry = _fixed_candidates.get(key)
+        if entry is not None and entry[0] is fixed_prices:
+            _fixed_candidates.move_to_end(key)
+            return entry[1]
+    
+    shapes = _fixed_route_shapes(fixed_prices)
+    count("fixed_routes_scanned", len(shapes))
+    pickup_point = Point(pickup[1], pickup[0])
+    candidates = []
+    for fixed_price, pickup_polygon, dropoff_polygon in shapes:
+        if pickup_polygon.contains(pickup_point):
+            candidates.append((fixed_price, dropoff_polygon))
+        
+        # The reverse direction if bidirectional is True
+        if fixed_price.get('bidirectional', False) and dropoff_polygon.contains(pickup_point):
+            candidates.append((fixed_price, pickup_polygon))
+    
+    with _fixed_candidates_lock:
+        _fixed_candidates[key] = (fixed_prices, candidates)
+        while len(_fixed_candidates) > FIXED_CANDIDATE_CACHE_SIZE:
+            _fixed_candidates.popitem(last=False)
+    return candidates
+
+def evict_fixed_price_candidates(fraction: float) -> int:
+    """Drop the least recently used fraction of cached pickups, returning the number removed"""
+    with _fixed_candidates_lock:
+        count_removed = min(len(_fixed_candidates), max(1, int(len(_fixed_candidates) * fraction)))
+        for _ in range(count_removed):
+            _fixed_candidates.popitem(last=False)
+        return count_removed
+
 def check_fixed_price(
     pickup: Tuple[float, float], 
     dropoff: Tuple[float, float], 
@@ -564,42 +1614,21 @@ def check_fixed_price(
             logger.warning("Identical pickup and dropoff coordinates provided for fixed price check")
             return None
         
-        pickup_point = Point(pickup[1], pickup[0])
-        dropoff_point = Point(dropoff[1], dropoff[0])
+        count("fixed_price_checks")
+        category = vehicle_category.lower()
+        dropoff_point = None
         
-        for fixed_price in fixed_prices:
-            if fixed_price.get('vehicle_category', '').lower() != vehicle_category.lower():
+        # Only routes whose pickup side contains the pickup can match
+        for fixed_price, dropoff_polygon in fixed_price_candidates(pickup, fixed_prices):
+            if fixed_price.get('vehicle_category', '').lower() != category:
                 continue
             
-            try:
-                pickup_area = fixed_price.get('pickup_area')
-                dropoff_area = fixed_price.get('dropoff_area')
-                
-                if not pickup_area or not dropoff_area:
-                    continue
-                
-                pickup_polygon = shape(pickup_area)
-                dropoff_polygon = shape(dropoff_area)
-                
-                # Check if pickup and dropoff match the fixed price areas
-                pickup_match = pickup_polygon.contains(pickup_point)
-                dropoff_match = dropoff_polygon.contains(dropoff_point)
-                
-                if pickup_match and dropoff_match:
-                    return fixed_price.get('price', None)
-                
-                # Check the reverse direction if bidirectional is True
-                if fixed_price.get('bidirectional', False):
-                    reverse_pickup_match = dropoff_polygon.contains(pickup_point)
-                    reverse_dropoff_match = pickup_polygon.contains(dropoff_point)
-                    
-                    if reverse_pickup_match and reverse_dropoff_match:
-                        return fixed_price.get('price', None)
-            except Exception as e:
-                logger.error(f"Error checking fixed price for entry {fixed_price.get('name', 'unknown')}: {str(e)}")
-                continue
+            if dropoff_point is None:
+                dropoff_point = Point(dropoff[1], dropoff[0])
+            if dropoff_polygon.contains(dropoff_point):
+                return fixed_price.get('price', None)
         
         return None
     except Exception as e:
         logger.error(f"Error in fixed price check: {str(e)}")
-        return None
\ No newline at end of file
+        return None
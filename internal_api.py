@@ -0,0 +1,417 @@
+import os
+import json
+import math
+import socket
+import struct
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Callable, Awaitable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+from admission import AdmissionRejected
+from metrics import QUOTES_SHED, INTERNAL_API_CONNECTIONS, INTERNAL_API_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Binary protocol for internal services (little-endian, one request or response per frame):
+#
+#   frame          u32 payload length, payload
+#   price request  u8 type=1, u32 correlation id, f64 pickup lat, f64 pickup lng,
+#                  f64 dropoff lat, f64 dropoff lng, i64 pickup time, u8 trip type,
+#                  u16 timeout ms (0 = none), u8 category length, category (empty = all)
+#   price response u8 type=2, u32 correlation id, u8 status, then
+#                  status OK:    u8 flags, 8 byte request id, u8 currency length, currency,
+#                                u8 price count, per price: u8 category length, category,
+#                                f64 raw price, f64 price
+#                  other status: u16 message length, message
+#
+# The pickup time is the local wall-clock time in seconds since 1970-01-01T00:00, like the
+# naive ISO timestamps accepted by /check-price. Responses carry the correlation id of their
+# request and are sent as soon as each quote is ready, so a client may pipeline many requests
+# over one connection and match responses out of order.
+MSG_PRICE_REQUEST = 1
+MSG_PRICE_RESPONSE = 2
+
+STATUS_OK = 0
+STATUS_INVALID = 1
+STATUS_OVERLOADED = 2
+STATUS_ERROR = 3
+STATUS_NAMES = {STATUS_OK: "ok", STATUS_INVALID: "invalid", STATUS_OVERLOADED: "overloaded", STATUS_ERROR: "error"}
+
+FLAG_DEGRADED = 1
+
+_FRAME_LENGTH = struct.Struct("<I")
+_REQUEST_HEADER = struct.Struct("<BIddddqBHB")
+_RESPONSE_HEADER = struct.Struct("<BIB")
+_PRICE = struct.Struct("<dd")
+_MESSAGE_LENGTH = struct.Struct("<H")
+
+# Requests are a few dozen bytes; anything larger is not a client of this protocol
+MAX_REQUEST_FRAME = 512
+MAX_RESPONSE_FRAME = 1 << 20
+_EPOCH = datetime(1970, 1, 1)
+
+class InternalApiError(Exception):
+    """Error status returned by the internal API"""
+    
+    def __init__(self, status: int, message: str, correlation_id: int = 0):
+        super().__init__(message)
+        self.status = status
+        self.correlation_id = correlation_id
+
+def encode_price_request(
+    correlation_id: int,
+    pickup_lat: float,
+    pickup_lng: float,
+    dropoff_lat: float,
+    dropoff_lng: float,
+    pickup_time: datetime,
+    trip_type: str = "1",
+    vehicle_category: Optional[str] = None,
+    timeout_ms: int = 0
+) -> bytes:
+    """Encode a price request frame"""
+    category = vehicle_category.encode() if vehicle_category else b""
+    seconds = int((pickup_time.replace(tzinfo=None) - _EPOCH).total_seconds())
+    payload = _REQUEST_HEADER.pack(
+        MSG_PRICE_REQUEST, correlation_id, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
+        seconds, int(trip_type), min(timeout_ms, 0xFFFF), len(category)
+    ) + category
+    return _FRAME_LENGTH.pack(len(payload)) + payload
+
+def decode_price_request(payload: bytes) -> Tuple[int, Dict[str, Any], int]:
+    """
+    Decode and validate a price request payload
+    
+    Returns:
+        Tuple of (correlation id, PriceRequest fields, timeout in ms)
+    
+    Raises:
+        InternalApiError: If the payload is not a valid price request
+    """
+    if len(payload) < _REQUEST_HEADER.size or payload[0] != MSG_PRICE_REQUEST:
+        raise InternalApiError(STATUS_INVALID, "Malformed price request")
+    
+    (_, correlation_id, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
+     seconds, trip_type, timeout_ms, category_length) = _REQUEST_HEADER.unpack_from(payload)
+    
+    error = None
+    if len(payload) != _REQUEST_HEADER.size + category_length:
+        error = "Malformed price request"
+    elif not all(math.isfinite(value) for value in (pickup_lat, pickup_lng, dropoff_lat, dropoff_lng)):
+        error = "Coordinates must be finite"
+    elif not (-90 <= pickup_lat <= 90 and -90 <= dropoff_lat <= 90 and -180 <= pickup_lng <= 180 and -180 <= dropoff_lng <= 180):
+        error = "Coordinates out of range"
+    elif trip_type not in (1, 2):
+        error = "trip_type must be 1 (one-way) or 2 (round trip)"
+    if error:
+        raise InternalApiError(STATUS_INVALID, error, correlation_id)
+    
+    try:
+        category = payload[_REQUEST_HEADER.size:].decode().lower() or None
+        pickup_time = _EPOCH + timedelta(seconds=seconds)
+    except (UnicodeDecodeError, OverflowError):
+        raise InternalApiError(STATUS_INVALID, "Invalid vehicle category or pickup time", correlation_id)
+    
+    fields = {
+        "pickup_lat": pickup_lat,
+        "pickup_lng": pickup_lng,
+        "dropoff_lat": dropoff_lat,
+        "dropoff_lng": dropoff_lng,
+        "vehicle_category": category,
+        "pickup_time": pickup_time,
+        "trip_type": str(trip_type)
+    }
+    return correlation_id, fields, timeout_ms
+
+def encode_price_response(correlation_id: int, response: Dict[str, Any]) -> bytes:
+    """Encode a successful quote (a PriceResponse dictionary) as a response frame"""
+    details = response.get("details") or {}
+    prices = response["prices"]
+    currency = (prices[0]["currency"] if prices else "").encode()
+    flags = FLAG_DEGRADED if details.get("degraded") else 0
+    
+    parts = [
+        _RESPONSE_HEADER.pack(MSG_PRICE_RESPONSE, correlation_id, STATUS_OK),
+        bytes((flags,)),
+        bytes.fromhex(details.get("request_id", "0" * 16)),
+        bytes((len(currency),)),
+        currency,
+        bytes((len(prices),))
+    ]
+    for price in prices:
+        category = price["category"].encode()
+        parts.append(bytes((len(category),)))
+        parts.append(category)
+        parts.append(_PRICE.pack(price["raw_price"], price["price"]))
+    
+    payload = b"".join(parts)
+    return _FRAME_LENGTH.pack(len(payload)) + payload
+
+def encode_error_response(correlation_id: int, status: int, message: str) -> bytes:
+    """Encode an error status as a response frame"""
+    text = message.encode()[:0xFFFF]
+    payload = _RESPONSE_HEADER.pack(MSG_PRICE_RESPONSE, correlation_id, status) + _MESSAGE_LENGTH.pack(len(text)) + text
+    return _FRAME_LENGTH.pack(len(payload)) + payload
+
+def decode_price_response(payload: bytes) -> Tuple[int, Dict[str, Any]]:
+    """
+    Decode a response payload
+    
+    Returns:
+        Tuple of (correlation id, response dictionary shaped like PriceResponse)
+    
+    Raises:
+        InternalApiError: If the server returned an error status
+    """
+    _, correlation_id, status = _RESPONSE_HEADER.unpack_from(payload)
+    offset = _RESPONSE_HEADER.size
+    
+    if status != STATUS_OK:
+        (length,) = _MESSAGE_LENGTH.unpack_from(payload, offset)
+        offset += _MESSAGE_LENGTH.size
+        raise InternalApiError(status, payload[offset:offset + length].decode(), correlation_id)
+    
+    flags = payload[offset]
+    request_id = payload[offset + 1:offset + 9].hex()
+    offset += 9
+    currency_length = payload[offset]
+    currency = payload[offset + 1:offset + 1 + currency_length].decode()
+    offset += 1 + currency_length
+    count = payload[offset]
+    offset += 1
+    
+    prices = []
+    for _ in range(count):
+        category_length = payload[offset]
+        category = payload[offset + 1:offset + 1 + category_length].decode()
+        offset += 1 + category_length
+        raw_price, price = _PRICE.unpack_from(payload, offset)
+        offset += _PRICE.size
+        prices.append({"category": category, "raw_price": raw_price, "currency": currency, "price": price})
+    
+    details = {"request_id": request_id}
+    if flags & FLAG_DEGRADED:
+        details["degraded"] = True
+    return correlation_id, {"prices": prices, "details": details}
+
+def load_cached_response(body: bytes) -> Dict[str, Any]:
+    """Parse a quote cached as JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+# Called with the decoded PriceRequest fields and the timeout in ms, returns the PriceResponse dictionary
+QuoteHandler = Callable[[Dict[str, Any], int], Awaitable[Dict[str, Any]]]
+
+class InternalApiServer:
+    """
+    TCP server for the binary price protocol
+    
+    Each connection is read continuously and every request is quoted in its
+    own task, so callers can pipeline requests instead of waiting for each
+    response. At most `max_pipeline` requests per connection are in progress;
+    beyond that the server stops reading and TCP backpressure slows the
+    client down.
+    """
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_pipeline: int = 64):
+        """
+        Args:
+            host: Interface to listen on
+            port: TCP port, 0 to disable the server
+            max_pipeline: Requests in progress per connection
+        """
+        self.host = host
+        self.port = port
+        self.max_pipeline = max_pipeline
+        self._server = None
+        self._handler = None
+    
+    @classmethod
+    def from_env(cls) -> "InternalApiServer":
+        """Create a server configured from environment variables"""
+        return cls(
+            host=os.getenv("INTERNAL_API_HOST", "127.0.0.1"),
+            port=int(os.getenv("INTERNAL_API_PORT", "0")),
+            max_pipeline=int(os.getenv("INTERNAL_API_MAX_PIPELINE", "64"))
+        )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.port > 0
+    
+    async def start(self, handler: QuoteHandler) -> None:
+        """Start listening if a port is configured"""
+        if not self.enabled:
+            return
+        self._handler = handler
+        # reuse_port lets every uvicorn worker accept connections on the same port
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host, self.port, reuse_port=hasattr(socket, "SO_REUSEPORT")
+        )
+        logger.info(f"Internal binary API listening on {self.host}:{self.port}")
+    
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        INTERNAL_API_CONNECTIONS.inc()
+        pipeline = asyncio.Semaphore(self.max_pipeline)
+        tasks = set()
+        
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(_FRAME_LENGTH.size)
+                except asyncio.IncompleteReadError:
+                    break
+                (length,) = _FRAME_LENGTH.unpack(header)
+                if length > MAX_REQUEST_FRAME:
+                    logger.warning(f"Closing internal API connection: {length} byte frame exceeds the limit")
+                    break
+                payload = await reader.readexactly(length)
+                
+                await pipeline.acquire()
+                task = asyncio.ensure_future(self._answer(payload, writer))
+                tasks.add(task)
+                task.add_done_callback(lambda done: (tasks.discard(done), pipeline.release()))
+            
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.debug(f"Internal API connection closed: {str(e)}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            INTERNAL_API_CONNECTIONS.dec()
+            writer.close()
+    
+    async def _answer(self, payload: bytes, writer: asyncio.StreamWriter) -> None:
+        correlation_id = 0
+        try:
+            correlation_id, fields, timeout_ms = decode_price_request(payload)
+            response = await self._handler(fields, timeout_ms)
+            frame = encode_price_response(correlation_id, response)
+            status = STATUS_OK
+        except InternalApiError as e:
+            correlation_id = e.correlation_id
+            status = e.status
+            frame = encode_error_response(correlation_id, status, str(e))
+        except AdmissionRejected as e:
+            QUOTES_SHED.inc()
+            status = STATUS_OVERLOADED
+            frame = encode_error_response(correlation_id, status, str(e))
+        except ValueError as e:
+            status = STATUS_INVALID
+            frame = encode_error_response(correlation_id, status, str(e))
+        except Exception as e:
+            logger.error(f"Error in internal API price calculation: {str(e)}")
+            status = STATUS_ERROR
+            frame = encode_error_response(correlation_id, status, "Internal server error during price calculation")
+        
+        INTERNAL_API_REQUESTS.labels(status=STATUS_NAMES[status]).inc()
+        writer.write(frame)
+        await writer.drain()
+
+class InternalApiClient:
+    """
+    Client for the binary price protocol
+    
+    One connection serves any number of concurrent `quote` calls; requests
+    are written as they are made and responses matched by correlation id.
+    
+    Example:
+        client = InternalApiClient("pricing", 9090)
+        await client.connect()
+        quotes = await asyncio.gather(*(client.quote(**trip) for trip in trips))
+    """
+    
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = {}
+        self._next_id = 0
+    
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._receiver = asyncio.ensure_future(self._receive())
+    
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._receiver
+            self._writer = None
+    
+    async def quote(
+        self,
+        pickup_lat: float,
+        pickup_lng: float,
+        dropoff_lat: float,
+        dropoff_lng: float,
+        pickup_time: datetime,
+        trip_type: str = "1",
+        vehicle_category: Optional[str] = None,
+        timeout_ms: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Request a quote
+        
+        Returns:
+            Response dictionary with prices and details.request_id (and details.degraded)
+        
+        Raises:
+            InternalApiError: If the server returned an error status
+        """
+        self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+        correlation_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[correlation_id] = future
+        
+        self._writer.write(encode_price_request(
+            correlation_id, pickup_lat, pickup_lng, dropoff_lat, dropoff_lng,
+            pickup_time, trip_type, vehicle_category, timeout_ms
+        ))
+        await self._writer.drain()
+        return await future
+    
+    async def quote_many(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """Pipeline several quotes, returning responses (or InternalApiError) in request order"""
+        return await asyncio.gather(*(self.quote(**request) for request in requests), return_exceptions=True)
+    
+    async def _receive(self) -> None:
+        try:
+            while True:
+                (length,) = _FRAME_LENGTH.unpack(await self._reader.readexactly(_FRAME_LENGTH.size))
+                if length > MAX_RESPONSE_FRAME:
+                    raise ConnectionError(f"{length} byte response frame exceeds the limit")
+                payload = await self._reader.readexactly(length)
+                try:
+                    correlation_id, response = decode_price_response(payload)
+                    result, error = response, None
+                except InternalApiError as e:
+                    correlation_id, result, error = e.correlation_id, None, e
+                
+                future = self._pending.pop(correlation_id, None)
+                if future is None or future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Internal API connection lost: {str(e)}"))
+            self._pending.clear()
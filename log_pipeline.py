@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from metrics import LOG_RECORDS_SAMPLED_OUT, LOG_RECORDS_DROPPED
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Loggers configured by the uvicorn CLI with their own synchronous handlers
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else was passed in `extra` and goes into JSON records
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """
+    Parse per-class sampling rates
+    
+    Example: LOG_SAMPLING="quote_request=0.01,provider_success=0.1"
+    
+    Returns:
+        Dictionary mapping log class to the fraction (0-1) of records kept
+    """
+    rates = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        name, _, rate = entry.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"Ignoring invalid LOG_SAMPLING entry '{entry}', expected <class>=<rate>", file=sys.stderr)
+    return rates
+
+class LogSampler:
+    """
+    Keep a fraction of the log records of each class
+    
+    Hot-path log calls check their class before logging, so a dropped record
+    is never created or formatted:
+    
+        if log_sampler.sample("quote_request"):
+            logger.info("Price check request [id=%s] ...", request_id, extra={"log_class": "quote_request"})
+    
+    Records of other loggers are sampled by logger name (e.g. 'uvicorn.access')
+    when installed as a handler filter. Classes without a rate, and warnings or
+    worse, are always kept.
+    """
+    
+    def __init__(self, rates: Optional[Dict[str, float]] = None):
+        self.rates = rates or {}
+        self._sampled_out = {}
+    
+    def sample(self, log_class: str) -> bool:
+        """Whether to log a record of this class"""
+        rate = self.rates.get(log_class)
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        
+        counter = self._sampled_out.get(log_class)
+        if counter is None:
+            counter = self._sampled_out[log_class] = LOG_RECORDS_SAMPLED_OUT.labels(log_class=log_class)
+        counter.inc()
+        return False
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Tagged records were sampled at the call site
+        if record.levelno >= logging.WARNING or hasattr(record, "log_class"):
+            return True
+        return self.sample(record.name)
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including fields passed in `extra`"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that neither formats nor blocks in the logging thread
+    
+    The standard QueueHandler formats every record before enqueueing it; here
+    records are enqueued as they are and formatted by the listener thread. When
+    the queue is full the record is dropped and counted instead of blocking.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # Render the traceback now, the frames it references may change by the time it is written
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+class LogPipeline:
+    """
+    Logging setup for the service: optional JSON records, per-class sampling and
+    a background writer thread
+    
+    With `async_writes` the root logger only puts records on a bounded queue,
+    and a listener thread formats them and writes them to stderr, so request
+    threads and the event loop never wait for the log stream.
+    """
+    
+    def __init__(
+        self,
+        level: str = "INFO",
+        log_format: str = "text",
+        sampling: Optional[Dict[str, float]] = None,
+        async_writes: bool = True,
+        queue_size: int = 10000
+    ):
+        """
+        Args:
+            level: Root log level
+            log_format: 'text' or 'json'
+            sampling: Fraction of records kept per log class (see LogSampler)
+            async_writes: Write records from a background thread
+            queue_size: Records buffered for the writer thread before new ones are dropped
+        """
+        self.level = level.upper()
+        self.log_format = log_format
+        self.sampler = LogSampler(sampling)
+        self.async_writes = async_writes
+        self.queue_size = queue_size
+        self._listener = None
+        self._queue = None
+    
+    @classmethod
+    def from_env(cls) -> "LogPipeline":
+        """Create a pipeline configured from environment variables"""
+        return cls(
+            level=os.getenv("LOG_LEVEL", "INFO"),
+            log_format=os.getenv("LOG_FORMAT", "text").lower(),
+            sampling=parse_sampling(os.getenv("LOG_SAMPLING", "")),
+            async_writes=os.getenv("LOG_ASYNC", "1").lower() not in ("0", "false", "no"),
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        )
+    
+    def install(self) -> None:
+        """Replace the root logger's handlers with this pipeline and route the server's loggers through it"""
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JsonFormatter() if self.log_format == "json" else logging.Formatter(TEXT_FORMAT))
+        
+        if self.async_writes:
+            self._queue = queue.Queue(self.queue_size)
+            handler = NonBlockingQueueHandler(self._queue)
+            self._listener = logging.handlers.QueueListener(self._queue, stream_handler)
+            self._listener.start()
+            atexit.register(self.stop)
+        else:
+            handler = stream_handler
+        handler.addFilter(self.sampler)
+        
+        # Neither format prints thread or process names, skip looking them up for every record
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+        
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(self.level)
+        
+        for name in SERVER_LOGGERS:
+            server_logger = logging.getLogger(name)
+            for existing in list(server_logger.handlers):
+                server_logger.removeHandler(existing)
+            server_logger.propagate = True
+    
+    def stop(self) -> None:
+        """Write out queued records and stop the writer thread"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format": self.log_format,
+            "async": self.async_writes,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sampling": self.sampler.rates
+        }
+
+# Shared pipeline, installed by the API at import time
+log_pipeline = LogPipeline.from_env()
+log_sampler = log_pipeline.sampler
@@ -1,40 +1,136 @@
 import logging
 import os
+import asyncio
 import uvicorn
-from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError, validator
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Union
-from functools import lru_cache
+from typing import Dict, Any, Optional, List, Tuple, Union
 import math
 import hashlib
+import hmac
 import json
 from time import time
 
-from config import Config
-from pricing import calculate_price
-from geo_utils import load_geo_data
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+from config import Config, TenantConfigs
+from pricing import (
+    calculate_price,
+    calculate_itinerary_prices,
+    round_to_nearest_10,
+    enforce_price_hierarchy,
+    get_cached_price_calc,
+    estimate_route,
+    price_route
 )
+from geo_utils import load_geo_data, geo_data_memory_stats, route_cache, get_route_with_fallbacks, ROUTING_PROVIDERS
+from route_estimator import circuity_model, samples_from_route_cache, sample_to_dict
+from admission import AdmissionController, AdmissionRejected
+from quota import quota_manager, PRIORITIES
+from profiling import RequestProfiler
+from memory import memory_accountant
+from log_pipeline import log_pipeline, log_sampler
+from internal_api import InternalApiServer, load_cached_response
+from prefetch import RoutePrefetcher
+from cluster import route_cluster
+from calendar_index import compiled_calendar
+from metrics import (
+    render_metrics,
+    STAGE_LATENCY,
+    CACHE_REQUESTS,
+    CACHE_ENTRIES,
+    QUOTES_IN_FLIGHT,
+    QUOTE_LATENCY,
+    QUOTES_SHED,
+    ADMISSION_QUEUED,
+    PREFETCH_ROUTES
+)
+
+# Configure logging (LOG_FORMAT, LOG_SAMPLING, LOG_ASYNC)
+log_pipeline.install()
 logger = logging.getLogger(__name__)
 
 # Cache for expensive operations
 cache = {}
-# Request deduplication cache with expiry time
+# Request deduplication cache with expiry time (stores ready-to-send JSON bytes)
 request_cache = {}
+# Seconds a cached quote stays valid
+REQUEST_CACHE_TTL = 60
+# Degraded quotes are cached briefly so full quotes resume soon after load drops
+DEGRADED_CACHE_TTL = 10
+
+# Admission control for the pricing path
+admission = AdmissionController.from_env()
+# Routing providers used in degraded mode (no paid providers)
+DEGRADED_ROUTING_PROVIDERS = [p.strip() for p in os.getenv("DEGRADED_ROUTING_PROVIDERS", "local").split(",") if p.strip()]
+# Stops per itinerary (Mapbox Directions accepts at most 25 coordinates per request)
+MAX_ITINERARY_STOPS = int(os.getenv("MAX_ITINERARY_STOPS", "25"))
+# Opt-in request profiling (X-Profile-Token header or sampled traffic)
+profiler = RequestProfiler.from_env()
+# Binary quote protocol for internal services (disabled unless INTERNAL_API_PORT is set)
+internal_api = InternalApiServer.from_env()
+# Budgeted cache warming from partial booking input
+prefetcher = RoutePrefetcher.from_env()
+# Dropoff candidates accepted per prefetch request
+MAX_PREFETCH_CANDIDATES = 20
+# Secret for the /admin endpoints (disabled if unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+# Metrics bound once for the request path
+_quote_cache_hits = CACHE_REQUESTS.labels(cache="quote", result="hit")
+_quote_cache_misses = CACHE_REQUESTS.labels(cache="quote", result="miss")
+_calculate_price_stage = STAGE_LATENCY.labels(stage="calculate_price")
+_hierarchy_stage = STAGE_LATENCY.labels(stage="price_hierarchy")
+_serialize_stage = STAGE_LATENCY.labels(stage="serialize")
+CACHE_ENTRIES.labels(cache="quote").set_function(lambda: len(request_cache))
+ADMISSION_QUEUED.set_function(lambda: admission.queued)
 # Track in-flight requests to prevent duplicate processing
 active_requests = {}
 
 # Load configuration and geo data on startup - these will be refreshed periodically
 config = Config(use_supabase=True)
+tenants = TenantConfigs(config, os.getenv("TENANT_CONFIG_DIR", "config/tenants"))
 geo_data_path = os.getenv("GEOJSON_PATH", "data/editedITprov.geojson")
 geo_data = load_geo_data(geo_data_path)
 
+def request_cache_memory_stats() -> Dict[str, int]:
+    """Entry count and approximate size of the request cache"""
+    entries = list(request_cache.values())
+    return {"entries": len(entries), "bytes": sum(len(entry['body']) + 400 for entry in entries)}
+
+def evict_request_cache(fraction: float) -> int:
+    """Drop the oldest fraction of cached quotes, returning the number removed"""
+    oldest = sorted(request_cache.items(), key=lambda item: item[1]['timestamp'])
+    count = min(len(oldest), max(1, int(len(oldest) * fraction)))
+    for key, _ in oldest[:count]:
+        request_cache.pop(key, None)
+    return count
+
+def evict_lru_cache(cached_function) -> int:
+    """Clear an lru_cache, returning the number of entries removed"""
+    count = cached_function.cache_info().currsize
+    cached_function.cache_clear()
+    return count
+
+# Memory accounting for the caches owned by the API (geo_utils registers the route cache)
+_geo_data_memory = geo_data_memory_stats(geo_data)
+memory_accountant.register("quote", request_cache_memory_stats, evict_request_cache)
+memory_accountant.register("geo_data", lambda: _geo_data_memory)
+memory_accountant.register("profiles", profiler.memory_stats, profiler.evict)
+memory_accountant.register(
+    "price_calc_lru",
+    lambda: {"entries": get_cached_price_calc.cache_info().currsize, "bytes": get_cached_price_calc.cache_info().currsize * 600},
+    lambda fraction: evict_lru_cache(get_cached_price_calc)
+)
+
 app = FastAPI(
     title="Airport Transfer Pricing API",
     description="API for calculating transfer prices based on distance, zones, and time",
@@ -86,14 +182,99 @@ class PriceResponse(BaseModel):
     prices: List[VehiclePriceInfo]
     details: Optional[Dict[str, Any]] = None
 
-def round_to_nearest_10(price: float) -> float:
-    """Round the price to the nearest 10 euros for a premium look, ensuring .5 rounds up"""
-    # Use standard rounding function which will round .5 to the even number
-    # To ensure .5 always rounds up, add a tiny amount
-    return round(price / 10.0) * 10.0
+class Stop(BaseModel):
+    lat: float = Field(..., description="Latitude", ge=-90, le=90)
+    lng: float = Field(..., description="Longitude", ge=-180, le=180)
+
+class ItineraryRequest(BaseModel):
+    stops: List[Stop] = Field(..., description="Stops in visiting order, including the first pickup and the last dropoff")
+    vehicle_category: Optional[str] = Field(None, description="Optional vehicle category (e.g., 'standard_sedan', 'premium_sedan')")
+    pickup_time: datetime = Field(..., description="Pickup time at the first stop in ISO8601 format")
+    
+    @validator('stops')
+    def validate_stops(cls, v):
+        """Validate the number of stops and that consecutive stops differ"""
+        if not 2 <= len(v) <= MAX_ITINERARY_STOPS:
+            raise ValueError(f"An itinerary needs between 2 and {MAX_ITINERARY_STOPS} stops")
+        for previous, stop in zip(v, v[1:]):
+            if previous.lat == stop.lat and previous.lng == stop.lng:
+                raise ValueError("Consecutive stops must be different locations")
+        return v
+    
+    @validator('vehicle_category')
+    def validate_vehicle_category(cls, v):
+        """Validate vehicle category is lowercase if provided"""
+        if v is not None:
+            return v.lower()
+        return v
+
+class ItineraryPriceInfo(VehiclePriceInfo):
+    leg_prices: List[float]
+
+class ItineraryResponse(BaseModel):
+    prices: List[ItineraryPriceInfo]
+    legs: List[Dict[str, Any]]
+    details: Optional[Dict[str, Any]] = None
+
+class DropoffCandidate(BaseModel):
+    lat: float = Field(..., description="Latitude", ge=-90, le=90)
+    lng: float = Field(..., description="Longitude", ge=-180, le=180)
+    probability: float = Field(1.0, description="Likelihood that this dropoff is quoted next (0-1)", ge=0, le=1)
+
+class PrefetchRequest(BaseModel):
+    pickup_lat: float = Field(..., description="Pickup latitude", ge=-90, le=90)
+    pickup_lng: float = Field(..., description="Pickup longitude", ge=-180, le=180)
+    pickup_time: Optional[datetime] = Field(None, description="Pickup time in ISO8601 format, required with dropoff candidates")
+    dropoff_candidates: List[DropoffCandidate] = Field([], description="Dropoffs the user is likely to quote")
+    
+    @validator('dropoff_candidates')
+    def validate_dropoff_candidates(cls, v, values):
+        """Validate the number of candidates and that the pickup time is known for routing"""
+        if len(v) > MAX_PREFETCH_CANDIDATES:
+            raise ValueError(f"At most {MAX_PREFETCH_CANDIDATES} dropoff candidates are accepted")
+        if v and values.get('pickup_time') is None:
+            raise ValueError("pickup_time is required to prefetch routes to dropoff candidates")
+        return v
+
+class RouteLookupRequest(BaseModel):
+    pickup: List[float] = Field(..., description="Pickup (latitude, longitude)")
+    dropoff: List[float] = Field(..., description="Dropoff (latitude, longitude)")
+    depart_at: Optional[str] = Field(None, description="Departure time as formatted for the routing providers")
+    providers: List[str] = Field(..., description="Routing providers to try, in order")
+    priority: str = Field("interactive", description="Quota priority class")
+    waypoints: Optional[List[List[float]]] = Field(None, description="Intermediate (latitude, longitude) stops")
+    
+    @validator('pickup', 'dropoff')
+    def validate_point(cls, v):
+        """Validate a (latitude, longitude) pair"""
+        if len(v) != 2 or not -90 <= v[0] <= 90 or not -180 <= v[1] <= 180:
+            raise ValueError("Points must be [latitude, longitude]")
+        return v
+    
+    @validator('waypoints')
+    def validate_waypoints(cls, v):
+        """Validate every waypoint is a (latitude, longitude) pair"""
+        if v and any(len(point) != 2 for point in v):
+            raise ValueError("Waypoints must be [latitude, longitude] pairs")
+        return v
+    
+    @validator('providers')
+    def validate_providers(cls, v):
+        """Validate the routing providers are known"""
+        unknown = [provider for provider in v if provider not in ROUTING_PROVIDERS]
+        if unknown:
+            raise ValueError(f"Unknown routing providers: {', '.join(unknown)}")
+        return v
+    
+    @validator('priority')
+    def validate_priority(cls, v):
+        """Validate the quota priority class"""
+        if v not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        return v
 
-def generate_request_hash(request: PriceRequest) -> str:
-    """Generate exact hash for duplicate detection"""
+def generate_request_hash(request: PriceRequest, tenant_id: Optional[str] = None) -> str:
+    """Generate exact hash for duplicate detection (per tenant, if any)"""
     # Use higher precision (6 decimal places) to avoid false positives
     key_dict = {
         "pickup_lat": round(request.pickup_lat, 6),
@@ -101,83 +282,134 @@ def generate_request_hash(request: PriceRequest) -> str:
         "dropoff_lat": round(request.dropoff_lat, 6),
         "dropoff_lng": round(request.dropoff_lng, 6),
         "trip_type": str(request.trip_type),
-        "date": request.pickup_time.date().isoformat()  # Same day requests
+        # Same day requests, or same hour if the tenant has time-based pricing
+        "date": compiled_calendar(get_config(tenant_id).time_multipliers).period_key(request.pickup_time)
     }
     
     # Include vehicle category if specified
     if request.vehicle_category:
         key_dict["vehicle_category"] = request.vehicle_category
         
+    # Tenants price differently; the default tenant keeps the same IDs as before
+    if tenant_id:
+        key_dict["tenant"] = tenant_id
+        
     # Create hash
     return hashlib.sha256(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()[:16]
 
-@lru_cache(maxsize=100)
-def get_config():
-    """Return the current configuration (can be refreshed periodically)"""
-    return config
+def generate_itinerary_hash(request: ItineraryRequest, tenant_id: Optional[str] = None) -> str:
+    """Generate exact hash of an itinerary for duplicate detection (per tenant, if any)"""
+    key_dict = {
+        "stops": [[round(stop.lat, 6), round(stop.lng, 6)] for stop in request.stops],
+        # Later legs are priced at the time they start, so with time-based pricing the exact minute counts
+        "date": compiled_calendar(get_config(tenant_id).time_multipliers).period_key(request.pickup_time, exact=True)
+    }
+    
+    if request.vehicle_category:
+        key_dict["vehicle_category"] = request.vehicle_category
+    
+    if tenant_id:
+        key_dict["tenant"] = tenant_id
+    
+    return hashlib.sha256(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()[:16]
+
+def serialize_response(response: Dict[str, Any]) -> bytes:
+    """Serialize a response dictionary to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(response)
+    return json.dumps(response, separators=(",", ":")).encode()
+
+def make_cache_entry(response: Dict[str, Any], timestamp: float, ttl: float = REQUEST_CACHE_TTL) -> Dict[str, Any]:
+    """Pre-serialize a response for the request cache, with its ETag"""
+    with _serialize_stage.time():
+        body = serialize_response(response)
+    return {
+        'timestamp': timestamp,
+        'ttl': ttl,
+        'body': body,
+        'etag': '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+    }
+
+def cached_json_response(cache_entry: Dict[str, Any], if_none_match: Optional[str] = None) -> Response:
+    """
+    Build a raw response from a cache entry, bypassing pydantic serialization
+    
+    Returns 304 Not Modified if the client already holds the same quote.
+    """
+    max_age = max(0, int(cache_entry['ttl'] - (time() - cache_entry['timestamp'])))
+    headers = {
+        "ETag": cache_entry['etag'],
+        "Cache-Control": f"private, max-age={max_age}"
+    }
+    
+    if if_none_match and cache_entry['etag'] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=cache_entry['body'], media_type="application/json", headers=headers)
+
+def get_config(tenant_id: Optional[str] = None) -> Config:
+    """Return the current configuration of a tenant, or the default one (can be refreshed periodically)"""
+    return tenants.get(tenant_id)
+
+def resolve_tenant(tenant_id: Optional[str]) -> Optional[str]:
+    """
+    Validate the tenant of a request (X-Tenant-ID header)
+    
+    Returns:
+        The tenant ID, or None for the default tenant
+        
+    Raises:
+        HTTPException: 404 if the tenant is not configured
+    """
+    if not tenant_id:
+        return None
+    if tenant_id not in tenants.tenants:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant '{tenant_id}'")
+    return tenant_id
+
+# Tenants hold only their overrides; the default config shares the geo data with every tenant
+memory_accountant.register("tenant_configs", tenants.memory_stats)
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {"status": "healthy", "timestamp": datetime.now().isoformat(), "admission": admission.stats()}
 
 @app.get("/config")
-async def get_configuration():
-    """Get basic configuration information"""
-    conf = get_config()
+async def get_configuration(x_tenant_id: Optional[str] = Header(None)):
+    """Get basic configuration information (of the tenant in X-Tenant-ID, if given)"""
+    conf = get_config(resolve_tenant(x_tenant_id))
     return {
         "vehicle_categories": list(conf.vehicle_rates.keys()),
         "currency": conf.currency,
         "zones": list(conf.zone_multipliers.keys()),
     }
 
-@app.post("/check-price", response_model=PriceResponse)
-async def check_price(request: PriceRequest) -> Dict[str, Any]:
+def compute_quote(request: PriceRequest, request_id: str, degraded: bool = False, tenant_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    Calculate the price for all vehicle categories based on pickup/dropoff coordinates
-    """
-    # Generate a unique request ID for tracking and deduplication
-    request_id = generate_request_hash(request)
-    current_time = time()
+    Price all requested vehicle categories and build the response dictionary
     
-    # Log detailed request info for debugging
-    logger.info(f"Price check request [id={request_id}]: "
-                f"({request.pickup_lat}, {request.pickup_lng}) -> ({request.dropoff_lat}, {request.dropoff_lng}) "
-                f"vehicle={request.vehicle_category}, trip_type={request.trip_type}, time={request.pickup_time}")
+    Args:
+        request: Validated price request
+        request_id: Request hash used for tracking
+        degraded: Serve from caches and local/haversine routing only, without paid providers
+        tenant_id: Tenant whose pricing configuration applies (None for the default)
+        
+    Returns:
+        Response dictionary matching PriceResponse
+    """
+    # Get fresh config
+    conf = get_config(tenant_id)
+    routing_providers = DEGRADED_ROUTING_PROVIDERS if degraded else None
     
-    # Check if we have a cached response and it's still valid (60 second TTL)
-    if request_id in request_cache:
-        cache_entry = request_cache[request_id]
-        if current_time - cache_entry['timestamp'] < 60:  # 60 seconds cache TTL
-            logger.info(f"Cache hit for request [id={request_id}]")
-            return cache_entry['response']
+    # Calculate prices for all vehicle categories
+    prices_list = []
     
-    # Check if same request is already processing
-    if request_id in active_requests:
-        logger.warning(f"Duplicate request detected [id={request_id}] - waiting for result")
-        # Wait for the in-flight request to complete
-        # Simple implementation: check every 100ms for up to 5 seconds
-        for _ in range(50):  # 50 * 100ms = 5 seconds
-            import time as time_module
-            time_module.sleep(0.1)
-            if request_id in request_cache:
-                logger.info(f"Using result from concurrent request [id={request_id}]")
-                return request_cache[request_id]['response']
+    # Define vehicle categories to calculate prices for
+    categories = [request.vehicle_category] if request.vehicle_category else conf.vehicle_rates.keys()
     
-    # Mark this request as being processed
-    active_requests[request_id] = True
-    
-    try:
-        # Get fresh config
-        conf = get_config()
-        
-        # Calculate prices for all vehicle categories
-        prices_list = []
-        
-        # Define vehicle categories to calculate prices for
-        categories = [request.vehicle_category] if request.vehicle_category else conf.vehicle_rates.keys()
-        
-        for category in categories:
+    for category in categories:
+        with _calculate_price_stage.time():
             price, curr = calculate_price(
                 pickup_lat=request.pickup_lat,
                 pickup_lng=request.pickup_lng,
@@ -187,103 +419,583 @@ async def check_price(request: PriceRequest) -> Dict[str, Any]:
                 pickup_time=request.pickup_time,
                 config=conf,
                 geo_data=geo_data,
-                trip_type=request.trip_type
-            )
-            
-            # Round to the nearest 10 euros with improved rounding logic
-            rounded_price = round_to_nearest_10(price)
-            logger.debug(f"Category {category}: raw_price={price}, rounded_price={rounded_price}")
-            
-            prices_list.append(
-                VehiclePriceInfo(
-                    category=category,
-                    raw_price=price,
-                    currency=curr,
-                    price=rounded_price
-                )
+                trip_type=request.trip_type,
+                routing_providers=routing_providers
             )
         
-        # Validate logical price progression for vehicle categories
-        # This ensures standard < xl < vip pricing hierarchy
-        if len(prices_list) > 1:
-            # Sort by category to group similar vehicles
-            prices_list.sort(key=lambda x: x.category)
-            
-            # Check minivan pricing hierarchy
-            minivan_prices = [p for p in prices_list if 'minivan' in p.category]
-            if len(minivan_prices) > 1:
-                for i in range(len(minivan_prices) - 1):
-                    if 'standard_minivan' in minivan_prices[i].category and 'xl_minivan' in minivan_prices[i+1].category:
-                        if minivan_prices[i].price >= minivan_prices[i+1].price:
-                            logger.warning(f"Fixing illogical pricing: {minivan_prices[i].category}={minivan_prices[i].price} >= {minivan_prices[i+1].category}={minivan_prices[i+1].price}")
-                            # Ensure XL is at least €10 more than standard
-                            minivan_prices[i+1].price = max(minivan_prices[i+1].price, minivan_prices[i].price + 10)
-                    if 'xl_minivan' in minivan_prices[i].category and 'vip_minivan' in minivan_prices[i+1].category:
-                        if minivan_prices[i].price >= minivan_prices[i+1].price:
-                            logger.warning(f"Fixing illogical pricing: {minivan_prices[i].category}={minivan_prices[i].price} >= {minivan_prices[i+1].category}={minivan_prices[i+1].price}")
-                            # Ensure VIP is at least €10 more than XL
-                            minivan_prices[i+1].price = max(minivan_prices[i+1].price, minivan_prices[i].price + 10)
-            
-            # Similar checks for sedan categories
-            sedan_prices = [p for p in prices_list if 'sedan' in p.category]
-            if len(sedan_prices) > 1:
-                for i in range(len(sedan_prices) - 1):
-                    if 'standard_sedan' in sedan_prices[i].category and 'premium_sedan' in sedan_prices[i+1].category:
-                        if sedan_prices[i].price >= sedan_prices[i+1].price:
-                            logger.warning(f"Fixing illogical pricing: {sedan_prices[i].category}={sedan_prices[i].price} >= {sedan_prices[i+1].category}={sedan_prices[i+1].price}")
-                            # Ensure premium is at least €10 more than standard
-                            sedan_prices[i+1].price = max(sedan_prices[i+1].price, sedan_prices[i].price + 10)
-                    if 'premium_sedan' in sedan_prices[i].category and 'vip_sedan' in sedan_prices[i+1].category:
-                        if sedan_prices[i].price >= sedan_prices[i+1].price:
-                            logger.warning(f"Fixing illogical pricing: {sedan_prices[i].category}={sedan_prices[i].price} >= {sedan_prices[i+1].category}={sedan_prices[i+1].price}")
-                            # Ensure VIP is at least €20 more than premium
-                            sedan_prices[i+1].price = max(sedan_prices[i+1].price, sedan_prices[i].price + 20)
+        # Round to the nearest 10 euros with improved rounding logic
+        rounded_price = round_to_nearest_10(price)
+        logger.debug(f"Category {category}: raw_price={price}, rounded_price={rounded_price}")
         
-        # Build detailed response
-        response = {
-            "prices": prices_list,
-            "details": {
-                "pickup_time": request.pickup_time.isoformat(),
-                "pickup_location": {"lat": request.pickup_lat, "lng": request.pickup_lng},
-                "dropoff_location": {"lat": request.dropoff_lat, "lng": request.dropoff_lng},
-                "trip_type": "one-way" if request.trip_type == "1" else "round trip",
-                "request_id": request_id
-            }
+        prices_list.append({
+            "category": category,
+            "raw_price": price,
+            "currency": curr,
+            "price": rounded_price
+        })
+    
+    # Validate logical price progression for vehicle categories
+    with _hierarchy_stage.time():
+        prices_list = enforce_price_hierarchy(prices_list)
+    
+    # Build detailed response
+    response = {
+        "prices": prices_list,
+        "details": {
+            "pickup_time": request.pickup_time.isoformat(),
+            "pickup_location": {"lat": request.pickup_lat, "lng": request.pickup_lng},
+            "dropoff_location": {"lat": request.dropoff_lat, "lng": request.dropoff_lng},
+            "trip_type": "one-way" if request.trip_type == "1" else "round trip",
+            "request_id": request_id
         }
+    }
+    
+    if degraded:
+        response["details"]["degraded"] = True
+    
+    return response
+
+def estimate_quote(request: PriceRequest, request_id: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build a quote without calling a routing provider
+    
+    Fixed-price routes are priced exactly; other categories are priced from the
+    straight-line distance scaled by the circuity learned for the trip (see
+    estimate_route), with a price range from the bounds of the estimate.
+    
+    Args:
+        request: Validated price request
+        request_id: Request hash used for tracking
+        tenant_id: Tenant whose pricing configuration applies (None for the default)
         
-        # Cache the response
-        request_cache[request_id] = {
-            'timestamp': current_time,
-            'response': response
+    Returns:
+        Response dictionary matching PriceResponse, with a precision and a
+        price_low/price_high range per price
+    """
+    conf = get_config(tenant_id)
+    pickup = (request.pickup_lat, request.pickup_lng)
+    dropoff = (request.dropoff_lat, request.dropoff_lng)
+    estimate, zones_crossed = estimate_route(pickup, dropoff, geo_data)
+    one_way_distance = estimate["distance_km"]
+    
+    prices_list = []
+    categories = [request.vehicle_category] if request.vehicle_category else conf.vehicle_rates.keys()
+    for category in categories:
+        details = {}
+        price = price_route(pickup, dropoff, category, one_way_distance, zones_crossed, conf, geo_data, request.trip_type, details, request.pickup_time, estimate=True)
+        # A fixed price is final unless the minimum fare for the estimated distance raised it
+        exact = details.get("fixed_price_applied") and not details.get("min_fare_applied")
+        
+        bounds = []
+        for bound in ("distance_low_km", "distance_high_km"):
+            if exact or not one_way_distance:
+                bounds.append(price)
+                continue
+            scale = estimate[bound] / one_way_distance
+            bound_zones = {zone: km * scale for zone, km in zones_crossed.items()}
+            bounds.append(price_route(pickup, dropoff, category, estimate[bound], bound_zones, conf, geo_data, request.trip_type, pickup_time=request.pickup_time, estimate=True))
+        
+        prices_list.append({
+            "category": category,
+            "raw_price": price,
+            "currency": conf.currency,
+            "price": round_to_nearest_10(price),
+            "price_low": round_to_nearest_10(bounds[0]),
+            "price_high": round_to_nearest_10(bounds[1]),
+            "precision": "fixed" if exact else "estimate"
+        })
+    
+    prices_list = enforce_price_hierarchy(prices_list)
+    # The hierarchy may have raised a price above its range
+    for entry in prices_list:
+        entry["price_low"] = min(entry["price_low"], entry["price"])
+        entry["price_high"] = max(entry["price_high"], entry["price"])
+    
+    return {
+        "precision": "fixed" if all(entry["precision"] == "fixed" for entry in prices_list) else "estimate",
+        "prices": prices_list,
+        "details": {
+            "estimated_distance_km": round(one_way_distance, 1),
+            "distance_range_km": [round(estimate["distance_low_km"], 1), round(estimate["distance_high_km"], 1)],
+            "estimated_duration_min": round(estimate["duration_min"]),
+            "estimate_basis": estimate["basis"],
+            "trip_type": "one-way" if request.trip_type == "1" else "round trip",
+            "request_id": request_id
         }
+    }
+
+def compute_itinerary_quote(request: ItineraryRequest, request_id: str, degraded: bool = False, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Price all requested vehicle categories for a multi-stop itinerary
+    
+    Args:
+        request: Validated itinerary request
+        request_id: Request hash used for tracking
+        degraded: Use caches and local/haversine routing only, without paid providers
+        tenant_id: Tenant whose pricing configuration applies (None for the default)
+        
+    Returns:
+        Response dictionary matching ItineraryResponse
+    """
+    conf = get_config(tenant_id)
+    categories = [request.vehicle_category] if request.vehicle_category else list(conf.vehicle_rates.keys())
+    
+    with _calculate_price_stage.time():
+        itinerary = calculate_itinerary_prices(
+            stops=[(stop.lat, stop.lng) for stop in request.stops],
+            vehicle_categories=categories,
+            pickup_time=request.pickup_time,
+            config=conf,
+            geo_data=geo_data,
+            routing_providers=DEGRADED_ROUTING_PROVIDERS if degraded else None
+        )
+    
+    prices_list = [
+        {
+            "category": category,
+            "raw_price": quote["price"],
+            "currency": itinerary["currency"],
+            "price": round_to_nearest_10(quote["price"]),
+            "leg_prices": quote["legs"]
+        }
+        for category, quote in itinerary["prices"].items()
+    ]
+    
+    with _hierarchy_stage.time():
+        prices_list = enforce_price_hierarchy(prices_list)
+    
+    response = {
+        "prices": prices_list,
+        "legs": [
+            {
+                "pickup": {"lat": leg["pickup"][0], "lng": leg["pickup"][1]},
+                "dropoff": {"lat": leg["dropoff"][0], "lng": leg["dropoff"][1]},
+                "distance_km": round(leg["distance_km"], 3),
+                "duration_min": round(leg["duration_min"], 1),
+                "zones_crossed": {zone: round(distance, 3) for zone, distance in leg["zones_crossed"].items()}
+            }
+            for leg in itinerary["legs"]
+        ],
+        "details": {
+            "pickup_time": request.pickup_time.isoformat(),
+            "stops": len(request.stops),
+            "distance_km": round(itinerary["distance_km"], 3),
+            "duration_min": round(itinerary["duration_min"], 1),
+            "route_source": itinerary["route_source"],
+            "request_id": request_id
+        }
+    }
+    
+    if degraded:
+        response["details"]["degraded"] = True
+    
+    return response
+
+async def calculate_quote(
+    request: PriceRequest,
+    request_id: str,
+    deadline: Optional[float] = None,
+    profile_requested: bool = False,
+    tenant_id: Optional[str] = None
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], bool]:
+    """
+    Calculate a quote under admission control
+    
+    Under load, the calculation queues briefly (until the deadline if given) or
+    raises AdmissionRejected, and may be served in degraded mode without paid
+    routing providers.
+    
+    Returns:
+        Tuple of (response dictionary, profile or None, degraded)
+    """
+    async with admission.slot(deadline):
+        degraded = admission.is_degraded()
+        if degraded:
+            admission.degraded_count += 1
+            logger.warning(f"Serving degraded quote [id={request_id}] (in_flight={admission.in_flight}, queued={admission.queued})")
+        
+        # Run the blocking calculation off the event loop
+        with QUOTES_IN_FLIGHT.track_inprogress(), QUOTE_LATENCY.labels(degraded=str(degraded).lower()).time():
+            if profile_requested or profiler.should_sample():
+                response, profile = await run_in_threadpool(
+                    profiler.run, f"check-price {request_id}", compute_quote, request, request_id, degraded, tenant_id
+                )
+            else:
+                response = await run_in_threadpool(compute_quote, request, request_id, degraded, tenant_id)
+                profile = None
+    
+    return response, profile, degraded
+
+async def get_quote_entry(
+    request: PriceRequest,
+    request_id: str,
+    deadline: Optional[float] = None,
+    tenant_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Return the cache entry holding the quote for a request, calculating it if needed
+    
+    Shared by the REST endpoint and the internal binary API so both use the same
+    quote cache, in-flight deduplication and admission control.
+    
+    Returns:
+        Cache entry (see make_cache_entry)
+    """
+    current_time = time()
+    
+    # Check if we have a cached response and it's still valid
+    if request_id in request_cache:
+        cache_entry = request_cache[request_id]
+        if current_time - cache_entry['timestamp'] < cache_entry['ttl']:
+            if log_sampler.sample("quote_cache_hit"):
+                logger.info("Cache hit for request [id=%s]", request_id, extra={"log_class": "quote_cache_hit", "request_id": request_id})
+            _quote_cache_hits.inc()
+            return cache_entry
+    _quote_cache_misses.inc()
+    
+    # Check if same request is already processing
+    if request_id in active_requests:
+        logger.warning(f"Duplicate request detected [id={request_id}] - waiting for result")
+        # Wait for the in-flight request to complete
+        # Simple implementation: check every 100ms for up to 5 seconds
+        for _ in range(50):  # 50 * 100ms = 5 seconds
+            await asyncio.sleep(0.1)
+            if request_id in request_cache:
+                logger.info(f"Using result from concurrent request [id={request_id}]")
+                return request_cache[request_id]
+    
+    # Mark this request as being processed
+    active_requests[request_id] = True
+    try:
+        response, _, degraded = await calculate_quote(request, request_id, deadline, tenant_id=tenant_id)
+        
+        # Cache the response as ready-to-send bytes
+        cache_entry = make_cache_entry(response, current_time, DEGRADED_CACHE_TTL if degraded else REQUEST_CACHE_TTL)
+        request_cache[request_id] = cache_entry
         
         # Clean up old cache entries
         clean_expired_cache_entries()
         
+        return cache_entry
+    finally:
         # Remove from active requests
-        if request_id in active_requests:
-            del active_requests[request_id]
+        active_requests.pop(request_id, None)
+
+async def get_browse_entry(request: PriceRequest, request_id: str, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Return the cache entry holding the browse quote for a request, estimating it if needed
+    
+    Browse quotes never call a routing provider, so they skip admission control
+    and are cached apart from exact quotes.
+    
+    Returns:
+        Cache entry (see make_cache_entry)
+    """
+    cache_key = "browse:" + request_id
+    current_time = time()
+    cache_entry = request_cache.get(cache_key)
+    if cache_entry is not None and current_time - cache_entry['timestamp'] < cache_entry['ttl']:
+        _quote_cache_hits.inc()
+        return cache_entry
+    _quote_cache_misses.inc()
+    
+    response = await run_in_threadpool(estimate_quote, request, request_id, tenant_id)
+    response["details"]["mode"] = "browse"
+    cache_entry = make_cache_entry(response, current_time)
+    request_cache[cache_key] = cache_entry
+    clean_expired_cache_entries()
+    return cache_entry
+
+@app.post("/check-price", response_model=PriceResponse)
+async def check_price(
+    request: PriceRequest,
+    mode: str = "exact",
+    if_none_match: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[int] = Header(None),
+    x_profile_token: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+) -> Response:
+    """
+    Calculate the price for all vehicle categories based on pickup/dropoff coordinates
+    
+    Quotes are cached as serialized JSON and support conditional requests via ETag.
+    Calculations go through admission control: under load, requests queue briefly
+    (up to X-Request-Timeout-Ms if given) or are shed with 503, and quotes may be
+    served in degraded mode without paid routing providers.
+    
+    With mode=browse the quote is estimated without a routing provider, with a
+    price range per category (see estimate_quote).
+    
+    Requests with a valid X-Profile-Token header bypass the cache and are
+    calculated under the profiler; the profile is returned in details.profile.
+    
+    With an X-Tenant-ID header the quote is priced with that tenant's
+    configuration (404 if the tenant is unknown).
+    """
+    if mode not in ("exact", "browse"):
+        raise HTTPException(status_code=400, detail="mode must be 'exact' or 'browse'")
+    tenant_id = resolve_tenant(x_tenant_id)
+    
+    # Generate a unique request ID for tracking and deduplication
+    request_id = generate_request_hash(request, tenant_id)
+    current_time = time()
+    profile_requested = profiler.is_authorized(x_profile_token)
+    if x_profile_token and not profile_requested:
+        logger.warning(f"Ignoring invalid profile token [id={request_id}]")
+    
+    # Log detailed request info for debugging (hot path: sampled by LOG_SAMPLING)
+    if log_sampler.sample("quote_request"):
+        logger.info("Price check request [id=%s]: (%s, %s) -> (%s, %s) vehicle=%s, trip_type=%s, time=%s",
+                    request_id, request.pickup_lat, request.pickup_lng, request.dropoff_lat, request.dropoff_lng,
+                    request.vehicle_category, request.trip_type, request.pickup_time,
+                    extra={"log_class": "quote_request", "request_id": request_id})
+    
+    deadline = None
+    if x_request_timeout_ms:
+        deadline = current_time + min(x_request_timeout_ms / 1000.0, admission.queue_timeout)
+    
+    try:
+        if mode == "browse":
+            cache_entry = await get_browse_entry(request, request_id, tenant_id)
+            return cached_json_response(cache_entry, if_none_match)
         
-        return response
+        if profile_requested:
+            # Profiled requests bypass the cache and are never shared
+            response, profile, _ = await calculate_quote(request, request_id, deadline, profile_requested=True, tenant_id=tenant_id)
+            
+            # Return the profile inline and keep the response out of the cache
+            response["details"]["profile"] = profile or {"skipped": "another request is being profiled, retry shortly"}
+            headers = {"Cache-Control": "no-store"}
+            if profile:
+                headers["X-Profile-Id"] = profile["id"]
+            return Response(content=serialize_response(response), media_type="application/json", headers=headers)
         
+        cache_entry = await get_quote_entry(request, request_id, deadline, tenant_id)
+        return cached_json_response(cache_entry, if_none_match)
+    
+    except AdmissionRejected as e:
+        logger.warning(f"Request shed [id={request_id}]: {str(e)}")
+        QUOTES_SHED.inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
         logger.error(f"Value error in price calculation: {str(e)}")
-        # Remove from active requests
-        if request_id in active_requests:
-            del active_requests[request_id]
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error in price calculation: {str(e)}")
-        # Remove from active requests
-        if request_id in active_requests:
-            del active_requests[request_id]
+        raise HTTPException(status_code=500, detail="Internal server error during price calculation")
+
+async def internal_quote(fields: Dict[str, Any], timeout_ms: int) -> Dict[str, Any]:
+    """
+    Quote a request received over the internal binary API
+    
+    The fields were validated by the binary decoder, so the PriceRequest is
+    built without running pydantic validation again.
+    """
+    request = PriceRequest.construct(**fields)
+    request_id = generate_request_hash(request)
+    
+    if log_sampler.sample("quote_request"):
+        logger.info("Internal price check request [id=%s]: (%s, %s) -> (%s, %s) vehicle=%s, trip_type=%s, time=%s",
+                    request_id, request.pickup_lat, request.pickup_lng, request.dropoff_lat, request.dropoff_lng,
+                    request.vehicle_category, request.trip_type, request.pickup_time,
+                    extra={"log_class": "quote_request", "request_id": request_id})
+    
+    deadline = None
+    if timeout_ms:
+        deadline = time() + min(timeout_ms / 1000.0, admission.queue_timeout)
+    
+    cache_entry = await get_quote_entry(request, request_id, deadline)
+    return load_cached_response(cache_entry['body'])
+
+def sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    """Format a server-sent event"""
+    return b"event: " + event.encode() + b"\ndata: " + serialize_response(data) + b"\n\n"
+
+@app.get("/check-price/stream")
+async def check_price_stream(
+    pickup_lat: float,
+    pickup_lng: float,
+    dropoff_lat: float,
+    dropoff_lng: float,
+    pickup_time: datetime,
+    trip_type: str,
+    vehicle_category: Optional[str] = None,
+    x_request_timeout_ms: Optional[int] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """
+    Stream a quote in stages as server-sent events
+    
+    Unless the quote is cached, an instant `quote` event comes first with
+    fixed prices and estimates that need no routing provider (stage
+    'instant'), followed by the quote from the real route (stage 'final',
+    precision 'exact', or 'degraded' under load) and a `done` event. Takes
+    the /check-price fields as query parameters, so browsers can use
+    EventSource. Failures are sent as an `error` event with an HTTP status.
+    """
+    try:
+        request = PriceRequest(
+            pickup_lat=pickup_lat,
+            pickup_lng=pickup_lng,
+            dropoff_lat=dropoff_lat,
+            dropoff_lng=dropoff_lng,
+            pickup_time=pickup_time,
+            trip_type=trip_type,
+            vehicle_category=vehicle_category
+        )
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    tenant_id = resolve_tenant(x_tenant_id)
+    
+    request_id = generate_request_hash(request, tenant_id)
+    
+    if log_sampler.sample("quote_request"):
+        logger.info("Streaming price check request [id=%s]: (%s, %s) -> (%s, %s) vehicle=%s, trip_type=%s, time=%s",
+                    request_id, request.pickup_lat, request.pickup_lng, request.dropoff_lat, request.dropoff_lng,
+                    request.vehicle_category, request.trip_type, request.pickup_time,
+                    extra={"log_class": "quote_request", "request_id": request_id})
+    
+    deadline = None
+    if x_request_timeout_ms:
+        deadline = time() + min(x_request_timeout_ms / 1000.0, admission.queue_timeout)
+    
+    async def events():
+        # Cached quotes are exact already, skip the estimate
+        cache_entry = request_cache.get(request_id)
+        if cache_entry is None or time() - cache_entry['timestamp'] >= cache_entry['ttl']:
+            try:
+                yield sse_event("quote", {"stage": "instant", **await run_in_threadpool(estimate_quote, request, request_id, tenant_id)})
+            except Exception as e:
+                logger.error(f"Error estimating quote [id={request_id}]: {str(e)}")
+        
+        try:
+            cache_entry = await get_quote_entry(request, request_id, deadline, tenant_id)
+        except AdmissionRejected as e:
+            logger.warning(f"Streaming request shed [id={request_id}]: {str(e)}")
+            QUOTES_SHED.inc()
+            yield sse_event("error", {"status": 503, "detail": str(e)})
+            return
+        except ValueError as e:
+            logger.error(f"Value error in price calculation: {str(e)}")
+            yield sse_event("error", {"status": 400, "detail": str(e)})
+            return
+        except Exception as e:
+            logger.error(f"Error in price calculation: {str(e)}")
+            yield sse_event("error", {"status": 500, "detail": "Internal server error during price calculation"})
+            return
+        
+        response = load_cached_response(cache_entry['body'])
+        precision = "degraded" if response["details"].get("degraded") else "exact"
+        for entry in response["prices"]:
+            entry["precision"] = precision
+        yield sse_event("quote", {"stage": "final", "precision": precision, **response})
+        yield sse_event("done", {"request_id": request_id})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/prefetch", status_code=202)
+async def prefetch(request: PrefetchRequest, background_tasks: BackgroundTasks, x_tenant_id: Optional[str] = Header(None)):
+    """
+    Warm caches for a quote that is likely to follow
+    
+    Accepts a pickup, optionally with candidate dropoffs and their likelihood.
+    The fixed-price routes from the pickup are looked up and, for the most
+    likely candidates, provider routes are fetched into the route cache in the
+    background, within the prefetch budget (PREFETCH_*). Nothing is routed
+    while quotes are being degraded under load. Returns immediately with the
+    number of candidates that will be routed. Fixed-price routes are those of
+    the tenant in X-Tenant-ID, if given.
+    """
+    conf = get_config(resolve_tenant(x_tenant_id))
+    pickup = (request.pickup_lat, request.pickup_lng)
+    candidates = [(c.lat, c.lng, c.probability) for c in request.dropoff_candidates if (c.lat, c.lng) != pickup]
+    
+    if admission.is_degraded():
+        selected, skipped = [], len(candidates)
+        PREFETCH_ROUTES.labels(outcome="degraded").inc(skipped)
+    else:
+        selected, skipped = prefetcher.select(candidates)
+        PREFETCH_ROUTES.labels(outcome="low_probability").inc(skipped)
+    
+    # Same departure time format as calculate_price, so the quote finds the cached route
+    depart_at = request.pickup_time.strftime("%Y-%m-%dT%H:%M") if request.pickup_time else None
+    background_tasks.add_task(prefetcher.run, pickup, selected, depart_at, conf.fixed_prices)
+    
+    return {"status": "accepted", "routes_prefetched": len(selected), "candidates_skipped": skipped}
+
+@app.post("/check-itinerary-price", response_model=ItineraryResponse)
+async def check_itinerary_price(
+    request: ItineraryRequest,
+    if_none_match: Optional[str] = Header(None),
+    x_request_timeout_ms: Optional[int] = Header(None),
+    x_tenant_id: Optional[str] = Header(None)
+) -> Response:
+    """
+    Calculate the price of a multi-stop itinerary (A -> B -> C ...) for all vehicle categories
+    
+    The itinerary is routed with a single provider call through all stops and
+    every leg is priced like a single transfer; prices holds the total per
+    category with the price of each leg, legs the distance and zones of each
+    leg. Caching, ETags, admission control and tenants work as for /check-price.
+    """
+    tenant_id = resolve_tenant(x_tenant_id)
+    request_id = generate_itinerary_hash(request, tenant_id)
+    current_time = time()
+    
+    if log_sampler.sample("quote_request"):
+        logger.info("Itinerary price request [id=%s]: %d stops, vehicle=%s, time=%s",
+                    request_id, len(request.stops), request.vehicle_category, request.pickup_time,
+                    extra={"log_class": "quote_request", "request_id": request_id})
+    
+    if request_id in request_cache:
+        cache_entry = request_cache[request_id]
+        if current_time - cache_entry['timestamp'] < cache_entry['ttl']:
+            if log_sampler.sample("quote_cache_hit"):
+                logger.info("Cache hit for itinerary [id=%s]", request_id, extra={"log_class": "quote_cache_hit", "request_id": request_id})
+            _quote_cache_hits.inc()
+            return cached_json_response(cache_entry, if_none_match)
+    _quote_cache_misses.inc()
+    
+    deadline = None
+    if x_request_timeout_ms:
+        deadline = current_time + min(x_request_timeout_ms / 1000.0, admission.queue_timeout)
+    
+    try:
+        async with admission.slot(deadline):
+            degraded = admission.is_degraded()
+            if degraded:
+                admission.degraded_count += 1
+                logger.warning(f"Serving degraded itinerary quote [id={request_id}]")
+            
+            with QUOTES_IN_FLIGHT.track_inprogress(), QUOTE_LATENCY.labels(degraded=str(degraded).lower()).time():
+                response = await run_in_threadpool(compute_itinerary_quote, request, request_id, degraded, tenant_id)
+        
+        cache_entry = make_cache_entry(response, current_time, DEGRADED_CACHE_TTL if degraded else REQUEST_CACHE_TTL)
+        request_cache[request_id] = cache_entry
+        clean_expired_cache_entries()
+        
+        return cached_json_response(cache_entry, if_none_match)
+    
+    except AdmissionRejected as e:
+        logger.warning(f"Itinerary request shed [id={request_id}]: {str(e)}")
+        QUOTES_SHED.inc()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        logger.error(f"Value error in itinerary calculation: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in itinerary calculation: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error during price calculation")
 
 def clean_expired_cache_entries():
     """Remove expired entries from the request cache"""
     current_time = time()
-    # Find expired keys (older than 60 seconds)
-    expired_keys = [k for k, v in request_cache.items() if current_time - v['timestamp'] >= 60]
+    # Find expired keys (older than the cache TTL)
+    expired_keys = [k for k, v in request_cache.items() if current_time - v['timestamp'] >= v['ttl']]
     
     for key in expired_keys:
         del request_cache[key]
@@ -297,12 +1009,138 @@ def clean_expired_cache_entries():
     if expired_keys or expired_active:
         logger.debug(f"Cleaned {len(expired_keys)} expired cache entries and {len(expired_active)} abandoned requests")
 
+    # Trim caches if they exceed the memory budget (checked at most every MEMORY_CHECK_INTERVAL seconds)
+    memory_accountant.maybe_enforce()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in text exposition format"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/quota")
+async def get_quota(x_admin_token: Optional[str] = Header(None)):
+    """Remaining routing provider budget and spend per API key (requires X-Admin-Token)"""
+    require_admin_token(x_admin_token)
+    return quota_manager.stats()
+
+def require_profile_token(token: Optional[str]) -> None:
+    """Reject requests to the profiling endpoints without a valid token"""
+    if not profiler.token:
+        raise HTTPException(status_code=404, detail="Profiling is not enabled")
+    if not profiler.is_authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+@app.get("/profiles")
+async def list_profiles(x_profile_token: Optional[str] = Header(None)):
+    """Summaries of recently stored request profiles (requires X-Profile-Token)"""
+    require_profile_token(x_profile_token)
+    return {"sample_rate": profiler.sample_rate, "profiles": profiler.list_profiles()}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+    """A stored request profile (requires X-Profile-Token)"""
+    require_profile_token(x_profile_token)
+    profile = profiler.get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+def require_admin_token(token: Optional[str]) -> None:
+    """Reject requests to the admin endpoints without a valid token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are not enabled")
+    if not token or not hmac.compare_digest(ADMIN_TOKEN.encode(), token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/memory")
+async def get_memory(x_admin_token: Optional[str] = Header(None)):
+    """Process memory and per-cache entry counts and sizes (requires X-Admin-Token)"""
+    require_admin_token(x_admin_token)
+    return memory_accountant.report()
+
+@app.get("/admin/memory/snapshot")
+async def get_memory_snapshot(limit: int = 25, group_by: str = "lineno", x_admin_token: Optional[str] = Header(None)):
+    """
+    Top allocation sites from tracemalloc, and growth since the previous snapshot
+    
+    The first call starts tracing; call again after some traffic.
+    """
+    require_admin_token(x_admin_token)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    return await run_in_threadpool(memory_accountant.snapshot, limit, group_by)
+
+@app.delete("/admin/memory/snapshot")
+async def stop_memory_tracing(x_admin_token: Optional[str] = Header(None)):
+    """Stop allocation tracing"""
+    require_admin_token(x_admin_token)
+    memory_accountant.stop_tracing()
+    return {"tracing": False}
+
+@app.post("/admin/memory/evict")
+async def evict_memory(fraction: float = 0.5, x_admin_token: Optional[str] = Header(None)):
+    """Evict a fraction of every evictable cache"""
+    require_admin_token(x_admin_token)
+    if not 0 < fraction <= 1:
+        raise HTTPException(status_code=400, detail="fraction must be in (0, 1]")
+    removed = memory_accountant.enforce(force_fraction=fraction)
+    return {"evicted_entries": removed, "memory": memory_accountant.report()}
+
+@app.get("/admin/route-samples")
+async def get_route_samples(x_admin_token: Optional[str] = Header(None)):
+    """Export the cached provider routes as NDJSON samples for training the circuity model"""
+    require_admin_token(x_admin_token)
+    samples = await run_in_threadpool(samples_from_route_cache, route_cache)
+    body = "".join(json.dumps(sample_to_dict(sample)) + "\n" for sample in samples)
+    return Response(content=body, media_type="application/x-ndjson")
+
+@app.post("/admin/route-estimator/reload")
+async def reload_route_estimator(x_admin_token: Optional[str] = Header(None)):
+    """Reload the circuity model from CIRCUITY_MODEL_PATH, e.g. after retraining"""
+    require_admin_token(x_admin_token)
+    if not await run_in_threadpool(circuity_model.load, circuity_model.path):
+        raise HTTPException(status_code=500, detail=f"Could not load a circuity model from {circuity_model.path}")
+    return circuity_model.stats()
+
+@app.post("/internal/route")
+async def internal_route(request: RouteLookupRequest, x_cluster_token: Optional[str] = Header(None)) -> Response:
+    """
+    Look up a route owned by this instance for another cluster member (see cluster.py)
+    
+    The route comes from this instance's route cache or its providers and is
+    never forwarded again, so a membership disagreement can't loop.
+    """
+    if not route_cluster.enabled:
+        raise HTTPException(status_code=404, detail="Cluster mode is not enabled")
+    if not route_cluster.is_authorized(x_cluster_token):
+        raise HTTPException(status_code=403, detail="Invalid cluster token")
+    
+    waypoints = [tuple(point) for point in request.waypoints] if request.waypoints else None
+    route = await run_in_threadpool(
+        get_route_with_fallbacks, tuple(request.pickup), tuple(request.dropoff), request.depart_at,
+        request.providers, request.priority, waypoints, False
+    )
+    return Response(content=serialize_response(route), media_type="application/json")
+
+@app.get("/admin/cluster")
+async def get_cluster(x_admin_token: Optional[str] = Header(None)):
+    """Cluster members and the instances currently on the hash ring"""
+    require_admin_token(x_admin_token)
+    return route_cluster.stats()
+
+@app.put("/admin/cluster/members")
+async def set_cluster_members(members: List[str], x_admin_token: Optional[str] = Header(None)):
+    """Replace the cluster members of this instance (send the same list to every member)"""
+    require_admin_token(x_admin_token)
+    route_cluster.set_members(members)
+    return route_cluster.stats()
+
 @app.post("/refresh-config")
 async def refresh_configuration():
-    """Force refresh the configuration from Supabase"""
-    global config
+    """Force refresh the configuration from Supabase and reload the tenant configurations"""
     try:
-        config = Config(use_supabase=True)
+        # Refresh in place so every holder of the config sees the new values
+        tenants.refresh()
         logger.info("Configuration refreshed successfully")
         return {"status": "success", "message": "Configuration refreshed"}
     except Exception as e:
@@ -313,11 +1151,16 @@ async def refresh_configuration():
 async def startup_event():
     """Initialize resources on startup"""
     logger.info("Starting Airport Transfer Pricing API")
+    get_config().start_background_refresh()
+    await internal_api.start(internal_quote)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up resources on shutdown"""
     logger.info("Shutting down Airport Transfer Pricing API")
+    await internal_api.stop()
+    if config.supabase:
+        config.supabase.stop_background_sync()
 
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
@@ -0,0 +1,238 @@
+import os
+import sys
+import logging
+import threading
+import tracemalloc
+from time import time
+from typing import Dict, Any, Optional, Callable
+
+from metrics import CACHE_BYTES, MEMORY_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+def process_memory() -> Dict[str, Optional[float]]:
+    """Resident and peak memory of this process in MB"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        return {
+            "rss_mb": round(int(status["VmRSS"].split()[0]) / 1024, 1),
+            "peak_rss_mb": round(int(status["VmHWM"].split()[0]) / 1024, 1)
+        }
+    except (OSError, KeyError, ValueError):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            return {"rss_mb": None, "peak_rss_mb": round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)}
+        except Exception:
+            return {"rss_mb": None, "peak_rss_mb": None}
+
+class _TrackedCache:
+    __slots__ = ("name", "stats", "evict")
+    
+    def __init__(self, name: str, stats: Callable[[], Dict[str, int]], evict: Optional[Callable[[float], int]]):
+        self.name = name
+        self.stats = stats
+        self.evict = evict
+
+class MemoryAccountant:
+    """
+    Memory accounting and a global budget across in-process caches
+    
+    Caches register a stats function returning their entry count and
+    approximate size in bytes, and optionally an eviction function that drops
+    a fraction of their least valuable entries. When the total accounted size
+    exceeds the budget, every evictable cache is trimmed by the same fraction
+    until the total is back under `target_ratio` of the budget.
+    """
+    
+    def __init__(
+        self,
+        budget_bytes: int = 0,
+        check_interval: float = 5.0,
+        target_ratio: float = 0.8,
+        tracemalloc_frames: int = 1
+    ):
+        """
+        Args:
+            budget_bytes: Budget for all accounted caches, 0 for no budget
+            check_interval: Minimum seconds between budget checks on the request path
+            target_ratio: Fraction of the budget to trim down to when it is exceeded
+            tracemalloc_frames: Stack frames stored per allocation while tracing
+        """
+        self.budget_bytes = budget_bytes
+        self.check_interval = check_interval
+        self.target_ratio = target_ratio
+        self.tracemalloc_frames = tracemalloc_frames
+        self.evictions = 0
+        self.evicted_entries = 0
+        self._caches = {}
+        self._last_check = 0.0
+        self._last_snapshot = None
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls) -> "MemoryAccountant":
+        """
+        Create an accountant configured from environment variables
+        
+        MEMORY_BUDGET_MB sets the cache budget; MEMORY_TRACEMALLOC=N starts
+        allocation tracing at startup with N frames per allocation.
+        """
+        frames = int(os.getenv("MEMORY_TRACEMALLOC", "0"))
+        accountant = cls(
+            budget_bytes=int(float(os.getenv("MEMORY_BUDGET_MB", "0")) * 1024 * 1024),
+            check_interval=float(os.getenv("MEMORY_CHECK_INTERVAL", "5")),
+            target_ratio=float(os.getenv("MEMORY_TARGET_RATIO", "0.8")),
+            tracemalloc_frames=max(1, frames)
+        )
+        if frames > 0:
+            tracemalloc.start(frames)
+        return accountant
+    
+    def register(self, name: str, stats: Callable[[], Dict[str, int]], evict: Optional[Callable[[float], int]] = None) -> None:
+        """
+        Track a cache
+        
+        Args:
+            name: Cache name used in reports and metrics
+            stats: Returns {'entries': int, 'bytes': int}
+            evict: Drops the given fraction (0-1) of entries and returns the number removed;
+                None for memory that can't be evicted (e.g. geo data)
+        """
+        self._caches[name] = _TrackedCache(name, stats, evict)
+        CACHE_BYTES.labels(cache=name).set_function(lambda: self._safe_stats(name)["bytes"])
+    
+    def _safe_stats(self, name: str) -> Dict[str, int]:
+        try:
+            return self._caches[name].stats()
+        except Exception as e:
+            logger.error(f"Error collecting memory stats for {name}: {str(e)}")
+            return {"entries": 0, "bytes": 0}
+    
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Entry counts and approximate sizes of every tracked cache"""
+        return {
+            name: dict(self._safe_stats(name), evictable=tracked.evict is not None)
+            for name, tracked in list(self._caches.items())
+        }
+    
+    def report(self) -> Dict[str, Any]:
+        """Process memory, per-cache usage and budget state"""
+        caches = self.cache_stats()
+        total = sum(stats["bytes"] for stats in caches.values())
+        evictable = sum(stats["bytes"] for stats in caches.values() if stats["evictable"])
+        return {
+            "process": process_memory(),
+            "caches": caches,
+            "accounted_bytes": total,
+            "evictable_bytes": evictable,
+            "budget_bytes": self.budget_bytes or None,
+            "evictions": self.evictions,
+            "evicted_entries": self.evicted_entries,
+            "tracemalloc": tracemalloc.is_tracing()
+        }
+    
+    def maybe_enforce(self) -> None:
+        """Check the budget if the check interval has elapsed (cheap enough for the request path)"""
+        if not self.budget_bytes:
+            return
+        now = time()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        self.enforce()
+    
+    def enforce(self, force_fraction: Optional[float] = None) -> int:
+        """
+        Evict from all evictable caches if the budget is exceeded
+        
+        Args:
+            force_fraction: Evict this fraction regardless of the budget
+        
+        Returns:
+            Number of entries evicted
+        """
+        with self._lock:
+            caches = self.cache_stats()
+            evictable = sum(stats["bytes"] for stats in caches.values() if stats["evictable"])
+            total = sum(stats["bytes"] for stats in caches.values())
+            
+            if force_fraction is not None:
+                fraction = force_fraction
+            elif self.budget_bytes and total > self.budget_bytes and evictable > 0:
+                # Trim evictable caches so the total drops to the target
+                excess = total - self.budget_bytes * self.target_ratio
+                fraction = min(1.0, excess / evictable)
+            else:
+                return 0
+            
+            removed = 0
+            for name, tracked in list(self._caches.items()):
+                if tracked.evict is not None and caches[name]["entries"] > 0:
+                    try:
+                        removed += tracked.evict(fraction)
+                    except Exception as e:
+                        logger.error(f"Error evicting from {name}: {str(e)}")
+            
+            self.evictions += 1
+            self.evicted_entries += removed
+            MEMORY_EVICTIONS.inc()
+            logger.warning(f"Memory budget eviction: removed {removed} entries ({fraction:.0%} of each cache), "
+                           f"accounted {total / 1048576:.1f} MB, budget {self.budget_bytes / 1048576:.1f} MB")
+            return removed
+    
+    def snapshot(self, limit: int = 25, key_type: str = "lineno") -> Dict[str, Any]:
+        """
+        Top allocation sites from a tracemalloc snapshot, and growth since the previous one
+        
+        Starts tracing on the first call (allocations made before that are not
+        attributed), so call again after some traffic for useful results.
+        
+        Args:
+            limit: Number of allocation sites to return
+            key_type: Grouping, 'lineno', 'filename' or 'traceback'
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            return {"tracing": True, "message": "Allocation tracing started; request another snapshot after some traffic"}
+        
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        
+        def describe(stat) -> Dict[str, Any]:
+            frame = stat.traceback[0]
+            entry = {"location": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            if hasattr(stat, "size_diff"):
+                entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+                entry["count_diff"] = stat.count_diff
+            if key_type == "traceback":
+                entry["traceback"] = [f"{f.filename}:{f.lineno}" for f in stat.traceback]
+            return entry
+        
+        result = {
+            "tracing": True,
+            "traced_current_mb": round(current / 1048576, 2),
+            "traced_peak_mb": round(peak / 1048576, 2),
+            "top": [describe(stat) for stat in snapshot.statistics(key_type)[:limit]]
+        }
+        
+        with self._lock:
+            previous, self._last_snapshot = self._last_snapshot, snapshot
+        if previous is not None:
+            result["growth_since_last_snapshot"] = [describe(stat) for stat in snapshot.compare_to(previous, key_type)[:limit]]
+        
+        return result
+    
+    def stop_tracing(self) -> None:
+        """Stop allocation tracing and drop the stored snapshot"""
+        tracemalloc.stop()
+        self._last_snapshot = None
+
+# Shared accountant; caches register themselves with it
+memory_accountant = MemoryAccountant.from_env()
@@ -0,0 +1,322 @@
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Tuple, List, Callable, Optional, Sequence
+
+# Default latency buckets in seconds, from sub-millisecond geometry work to slow provider calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Format a Prometheus label set, e.g. {provider="mapbox",le="0.5"}"""
+    parts = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """Base class for metrics with optional labels"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+    
+    def labels(self, **labels):
+        """Return the child metric for a label set (cache it for hot paths)"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _default(self):
+        # Unlabelled metrics use a single child
+        return self.labels()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+    
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    
+    kind = "counter"
+    
+    def _new_child(self):
+        return _CounterChild()
+    
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+class _GaugeChild:
+    __slots__ = ("value", "function", "_lock")
+    
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+    
+    def set(self, value: float):
+        self.value = value
+    
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value lazily at scrape time"""
+        self.function = function
+    
+    @contextmanager
+    def track_inprogress(self):
+        """Increment the gauge for the duration of the block"""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+    
+    def render(self, name, labelnames, key):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float("nan")
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(float(value))}"]
+
+class Gauge(_Metric):
+    """Value that can go up and down, e.g. in-flight requests or cache sizes"""
+    
+    kind = "gauge"
+    
+    def _new_child(self):
+        return _GaugeChild()
+    
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+    
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+    
+    def set(self, value: float):
+        self._default().set(value)
+    
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+    
+    def track_inprogress(self):
+        return self._default().track_inprogress()
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+    
+    @contextmanager
+    def time(self):
+        """Observe the duration of the block in seconds"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+    
+    def render(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+class Histogram(_Metric):
+    """Latency histogram with cumulative buckets"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (), buckets: Optional[Sequence[float]] = None):
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+        super().__init__(name, description, labelnames)
+    
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    
+    def observe(self, value: float):
+        self._default().observe(value)
+    
+    def time(self):
+        return self._default().time()
+
+def render_metrics() -> str:
+    """Render all registered metrics in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Metrics shared across modules
+
+STAGE_LATENCY = Histogram(
+    "pricing_stage_duration_seconds",
+    "Duration of pricing stages",
+    ["stage"]
+)
+PROVIDER_LATENCY = Histogram(
+    "routing_provider_duration_seconds",
+    "Duration of routing provider calls",
+    ["provider"]
+)
+PROVIDER_REQUESTS = Counter(
+    "routing_provider_requests_total",
+    "Routing provider calls by outcome (success, failure, no_quota, busy)",
+    ["provider", "outcome"]
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    "routing_provider_in_flight",
+    "Routing provider calls currently in flight",
+    ["provider"]
+)
+HAVERSINE_FALLBACKS = Counter(
+    "routing_haversine_fallbacks_total",
+    "Routes that fell back to haversine distance because every provider failed"
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"]
+)
+CACHE_ENTRIES = Gauge(
+    "cache_entries",
+    "Number of entries per cache",
+    ["cache"]
+)
+FIXED_PRICE_HITS = Counter(
+    "pricing_fixed_price_hits_total",
+    "Prices served from a fixed route override"
+)
+MIN_FARE_APPLIED = Counter(
+    "pricing_min_fare_applied_total",
+    "Prices raised to the distance-based minimum fare"
+)
+QUOTES_IN_FLIGHT = Gauge(
+    "quotes_in_flight",
+    "Quote calculations currently in flight"
+)
+QUOTE_LATENCY = Histogram(
+    "quote_duration_seconds",
+    "Duration of /check-price calculations (cache misses)",
+    ["degraded"]
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Quote requests waiting for a calculation slot"
+)
+QUOTES_SHED = Counter(
+    "quotes_shed_total",
+    "Quote requests rejected by admission control"
+)
+CACHE_BYTES = Gauge(
+    "cache_bytes",
+    "Approximate memory used per cache in bytes",
+    ["cache"]
+)
+MEMORY_EVICTIONS = Counter(
+    "memory_budget_evictions_total",
+    "Evictions triggered by the cache memory budget"
+)
+CONFIG_SYNC_LATENCY = Histogram(
+    "config_sync_duration_seconds",
+    "Duration of Supabase config syncs"
+)
+LOG_RECORDS_SAMPLED_OUT = Counter(
+    "log_records_sampled_out_total",
+    "Log records dropped by per-class sampling",
+    ["log_class"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full"
+)
+INTERNAL_API_CONNECTIONS = Gauge(
+    "internal_api_connections",
+    "Open connections to the internal binary API"
+)
+INTERNAL_API_REQUESTS = Counter(
+    "internal_api_requests_total",
+    "Internal binary API quote requests by status (ok, invalid, overloaded, error)",
+    ["status"]
+)
+PREFETCH_ROUTES = Counter(
+    "prefetch_routes_total",
+    "Dropoff candidates handled by route prefetching by outcome",
+    ["outcome"]
+)
+CLUSTER_ROUTE_LOOKUPS = Counter(
+    "cluster_route_lookups_total",
+    "Route cache misses in cluster mode by outcome (local: owned by this instance, forwarded, unreachable, failed)",
+    ["outcome"]
+)
+ROUTE_ESTIMATES = Counter(
+    "route_estimates_total",
+    "Routes estimated without a routing provider by the statistics used ('pair', 'band' or 'default')",
+    ["basis"]
+)
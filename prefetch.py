@@ -0,0 +1,116 @@
+import os
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from quota import TokenBucket, PRIORITY_BATCH
+from geo_utils import route_cache, get_route_with_fallbacks, fixed_price_candidates
+from metrics import PREFETCH_ROUTES
+
+logger = logging.getLogger(__name__)
+
+class RoutePrefetcher:
+    """
+    Warm caches for a quote before the user has finished entering it
+    
+    For a pickup, the fixed-price routes starting there are looked up (see
+    fixed_price_candidates). For candidate dropoffs, provider routes are
+    fetched into the route cache, but only for the most likely candidates
+    and within a budget of provider calls per minute, using batch quota so
+    interactive quotes keep their reserve.
+    """
+    
+    def __init__(self, max_routes: int = 3, min_probability: float = 0.3, routes_per_minute: float = 60.0):
+        """
+        Args:
+            max_routes: Dropoff candidates routed per prefetch request
+            min_probability: Candidates less likely than this are never routed
+            routes_per_minute: Provider routes fetched by prefetching per minute, 0 to disable
+        """
+        self.max_routes = max_routes
+        self.min_probability = min_probability
+        self.routes_per_minute = routes_per_minute
+        self.budget = TokenBucket(routes_per_minute / 60.0, capacity=max(1.0, float(max_routes)))
+    
+    @classmethod
+    def from_env(cls) -> "RoutePrefetcher":
+        """Create a prefetcher configured from environment variables"""
+        return cls(
+            max_routes=int(os.getenv("PREFETCH_MAX_ROUTES", "3")),
+            min_probability=float(os.getenv("PREFETCH_MIN_PROBABILITY", "0.3")),
+            routes_per_minute=float(os.getenv("PREFETCH_ROUTES_PER_MINUTE", "60"))
+        )
+    
+    def select(self, candidates: List[Tuple[float, float, float]]) -> Tuple[List[Tuple[float, float, float]], int]:
+        """
+        Pick the dropoff candidates worth routing
+        
+        Args:
+            candidates: (latitude, longitude, probability) of each candidate dropoff
+        
+        Returns:
+            Tuple of (selected candidates, most likely first; number skipped as unlikely)
+        """
+        if self.routes_per_minute <= 0:
+            return [], len(candidates)
+        likely = sorted((c for c in candidates if c[2] >= self.min_probability), key=lambda c: -c[2])
+        selected = likely[:self.max_routes]
+        return selected, len(candidates) - len(selected)
+    
+    def warm_pickup(self, pickup: Tuple[float, float], fixed_prices: List[Dict[str, Any]]) -> int:
+        """Look up the fixed-price routes starting at a pickup, returning how many there are"""
+        return len(fixed_price_candidates(pickup, fixed_prices))
+    
+    def prefetch_route(
+        self,
+        pickup: Tuple[float, float],
+        dropoff: Tuple[float, float],
+        depart_at: str,
+        providers: Optional[List[str]] = None
+    ) -> str:
+        """
+        Fetch a route into the route cache if the budget allows
+        
+        Returns:
+            Outcome: 'cached', 'fetched', 'failed' or 'over_budget'
+        """
+        if route_cache.make_key(pickup, dropoff, depart_at) in route_cache:
+            outcome = "cached"
+        elif not self.budget.try_take():
+            outcome = "over_budget"
+        else:
+            route = get_route_with_fallbacks(pickup, dropoff, depart_at=depart_at, providers=providers, priority=PRIORITY_BATCH)
+            outcome = "failed" if route.get("source") == "haversine_fallback" else "fetched"
+        
+        PREFETCH_ROUTES.labels(outcome=outcome).inc()
+        return outcome
+    
+    def run(
+        self,
+        pickup: Tuple[float, float],
+        dropoffs: List[Tuple[float, float, float]],
+        depart_at: Optional[str],
+        fixed_prices: List[Dict[str, Any]],
+        providers: Optional[List[str]] = None
+    ) -> Dict[str, int]:
+        """
+        Warm the caches for a pickup and the selected dropoff candidates (blocking)
+        
+        Args:
+            pickup: (latitude, longitude) of pickup
+            dropoffs: (latitude, longitude, probability) of the selected candidates
+            depart_at: Departure time as formatted for the routing providers
+            fixed_prices: List of fixed price configurations
+            providers: Routing providers to try, in order (defaults to all configured)
+        
+        Returns:
+            Number of candidates per outcome
+        """
+        outcomes = {}
+        try:
+            self.warm_pickup(pickup, fixed_prices)
+            for lat, lng, _ in dropoffs:
+                outcome = self.prefetch_route(pickup, (lat, lng), depart_at, providers)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        except Exception as e:
+            logger.error(f"Error prefetching routes from {pickup}: {str(e)}")
+        return outcomes
@@ -1,19 +1,37 @@
 import logging
 from functools import lru_cache
-from datetime import datetime
+from datetime import datetime, timedelta
+from time import perf_counter
 from typing import Dict, Tuple, Any, List, Optional
 
 from config import Config
+from metrics import STAGE_LATENCY, FIXED_PRICE_HITS, MIN_FARE_APPLIED, CACHE_REQUESTS
+from log_pipeline import log_sampler
 from geo_utils import (
-    calculate_distance, 
     determine_zones_crossed, 
+    simplify_route_for_zones,
     calculate_route_segments,
     check_fixed_price,
-    get_route_with_fallbacks
+    get_route_with_fallbacks,
+    zone_lineage,
+    decode_polyline_to_array,
+    haversine_segments,
+    split_route_at_stops,
+    route_cache,
+    zones_cache
 )
+from route_estimator import circuity_model
+from calendar_index import compiled_calendar
 
 logger = logging.getLogger(__name__)
 
+# Stage timers, bound once to keep the hot path cheap
+_route_stage = STAGE_LATENCY.labels(stage="route")
+_zones_stage = STAGE_LATENCY.labels(stage="zones_crossed")
+_fixed_price_stage = STAGE_LATENCY.labels(stage="fixed_price")
+_zones_cache_hits = CACHE_REQUESTS.labels(cache="zones", result="hit")
+_zones_cache_misses = CACHE_REQUESTS.labels(cache="zones", result="miss")
+
 @lru_cache(maxsize=1000)
 def get_cached_price_calc(
     pickup_lat: float,
@@ -40,6 +58,23 @@ def get_cached_price_calc(
     # the complete parameters including config and geo_data (which are not part of the cache key)
     return {}
 
+def resolve_zone_multiplier(zone_code: str, zone_multipliers: Dict[str, float], geo_data: Dict[str, Any]) -> Tuple[float, str]:
+    """
+    Find the multiplier for a zone, walking up the zone hierarchy
+    
+    Args:
+        zone_code: Zone code, e.g. a municipality, province or country code
+        zone_multipliers: Configured multipliers by zone code
+        geo_data: Loaded geographic data including the zone hierarchy
+        
+    Returns:
+        Tuple of (multiplier, code of the zone it was configured for)
+    """
+    for code in zone_lineage(zone_code, geo_data):
+        if code in zone_multipliers:
+            return zone_multipliers[code], code
+    return zone_multipliers.get("DEFAULT", 1.0), "DEFAULT"
+
 def calculate_price(
     pickup_lat: float,
     pickup_lng: float,
@@ -49,7 +84,9 @@ def calculate_price(
     pickup_time: datetime,
     config: Config,
     geo_data: Dict[str, Any],
-    trip_type: str = "1"
+    trip_type: str = "1",
+    routing_providers: Optional[List[str]] = None,
+    priority: str = "interactive"
 ) -> Tuple[float, str]:
     """
     Calculate the price for a transfer based on the provided parameters.
@@ -64,6 +101,8 @@ def calculate_price(
         config: Configuration object containing pricing rules
         geo_data: Loaded geographic data including R-tree spatial index
         trip_type: "1" for one-way, "2" for round trip
+        routing_providers: Routing providers to try, in order (defaults to all configured)
+        priority: Quota priority class for paid routing providers ('interactive' or 'batch')
         
     Returns:
         Tuple containing (price, currency)
@@ -96,15 +135,21 @@ def calculate_price(
         depart_at = pickup_time.strftime("%Y-%m-%dT%H:%M")
         
         # 1. Get route information from Google Maps (with fallbacks to Mapbox and Haversine)
+        stage_start = perf_counter()
         route_info = get_route_with_fallbacks(
             (pickup_lat, pickup_lng),
             (dropoff_lat, dropoff_lng),
-            depart_at=depart_at
+            depart_at=depart_at,
+            providers=routing_providers,
+            priority=priority
         )
         
         # Initialize total distance
         total_distance = 0
         route_points = []
+        cached_zones = None
+        # Ratio of road to straight-line distance applied to interpolated zone distances
+        zone_scale = 1.0
         
         # If we got valid route info, use it
         if route_info:
@@ -112,23 +157,36 @@ def calculate_price(
             result["price_details"]["route_source"] = route_info.get('source', 'unknown')
             result["price_details"]["estimated_duration_min"] = route_info.get('duration', 0)
             
-            # Get route points for zone calculations
+            # Get route points for zone calculations, unless the zones crossed by this route are cached
             if route_info.get('geometry'):
-                route_points = calculate_route_segments(
-                    (pickup_lat, pickup_lng),
-                    (dropoff_lat, dropoff_lng),
-                    use_routing_apis=True,
-                    depart_at=depart_at
-                )
-                result["price_details"]["route_points_count"] = len(route_points)
+                zones_key = route_cache.make_key((pickup_lat, pickup_lng), (dropoff_lat, dropoff_lng), depart_at)
+                cached_zones = zones_cache.get(zones_key)
+                if cached_zones is not None and (cached_zones['route'] is not route_info or cached_zones['geo_data'] is not geo_data):
+                    cached_zones = None
+                
+                if cached_zones is not None:
+                    _zones_cache_hits.inc()
+                    result["price_details"]["route_points_count"] = cached_zones['route_points_count']
+                else:
+                    _zones_cache_misses.inc()
+                    route_points = calculate_route_segments(
+                        (pickup_lat, pickup_lng),
+                        (dropoff_lat, dropoff_lng),
+                        use_routing_apis=True,
+                        depart_at=depart_at,
+                        providers=routing_providers,
+                        priority=priority
+                    )
+                    result["price_details"]["route_points_count"] = len(route_points)
             else:
-                # Fallback to direct distance calculation and interpolation
+                # Fallback to estimated road distance and linear interpolation
                 logger.warning("No route geometry available, using linear interpolation")
-                total_distance = calculate_distance(
-                    (pickup_lat, pickup_lng),
-                    (dropoff_lat, dropoff_lng)
-                )
+                estimate = circuity_model.estimate((pickup_lat, pickup_lng), (dropoff_lat, dropoff_lng), geo_data)
+                total_distance = estimate["distance_km"]
+                zone_scale = estimate["circuity"]
                 result["price_details"]["direct_distance_used"] = True
+                result["price_details"]["estimated_duration_min"] = estimate["duration_min"]
+                result["price_details"]["circuity_applied"] = estimate["circuity"]
                 
                 # Get route points through interpolation
                 route_points = calculate_route_segments(
@@ -140,11 +198,12 @@ def calculate_price(
         else:
             # Complete fallback if no route info at all
             logger.error("No route information available, using direct distance")
-            total_distance = calculate_distance(
-                (pickup_lat, pickup_lng),
-                (dropoff_lat, dropoff_lng)
-            )
+            estimate = circuity_model.estimate((pickup_lat, pickup_lng), (dropoff_lat, dropoff_lng), geo_data)
+            total_distance = estimate["distance_km"]
+            zone_scale = estimate["circuity"]
             result["price_details"]["direct_distance_used"] = True
+            result["price_details"]["estimated_duration_min"] = estimate["duration_min"]
+            result["price_details"]["circuity_applied"] = estimate["circuity"]
             
             # Get route points through interpolation
             route_points = calculate_route_segments(
@@ -154,6 +213,8 @@ def calculate_price(
                 use_routing_apis=False
             )
         
+        _route_stage.observe(perf_counter() - stage_start)
+        
         # Store one-way distance for reference
         one_way_distance = total_distance
         result["price_details"]["one_way_distance_km"] = one_way_distance
@@ -161,7 +222,22 @@ def calculate_price(
         # 2. Determine which zones the route passes through (before applying round trip)
         try:
             # Use the route points we already obtained
-            zones_crossed = determine_zones_crossed(route_points, geo_data)
+            stage_start = perf_counter()
+            if cached_zones is not None:
+                zones_crossed = cached_zones['zones']
+            else:
+                zone_points, segment_lengths = simplify_route_for_zones(route_points, geo_data)
+                zones_crossed = determine_zones_crossed(zone_points, geo_data, segment_lengths)
+                if zone_scale != 1.0:
+                    zones_crossed = {zone: km * zone_scale for zone, km in zones_crossed.items()}
+                elif route_info and route_info.get('geometry'):
+                    zones_cache.put(zones_key, {
+                        'route': route_info,
+                        'geo_data': geo_data,
+                        'zones': zones_crossed,
+                        'route_points_count': len(route_points)
+                    })
+            _zones_stage.observe(perf_counter() - stage_start)
             result["price_details"]["zones_crossed"] = list(zones_crossed.keys())
         except Exception as e:
             logger.error(f"Error determining zones crossed: {str(e)}")
@@ -176,85 +252,19 @@ def calculate_price(
             
         result["price_details"]["total_distance_km"] = total_distance
         
-        # 3. Check for fixed price override
-        fixed_price = check_fixed_price(
+        # 3-6. Fixed price override, zone multipliers and minimum fare
+        price = price_route(
             (pickup_lat, pickup_lng),
             (dropoff_lat, dropoff_lng),
             vehicle_category,
-            config.fixed_prices
+            one_way_distance,
+            zones_crossed,
+            config,
+            geo_data,
+            trip_type,
+            result["price_details"],
+            pickup_time
         )
-        
-        if fixed_price is not None:
-            logger.info(f"Fixed price found: {fixed_price} {config.currency}")
-            price = fixed_price
-            
-            # Apply round trip doubling for fixed prices too
-            if trip_type == "2":
-                price *= 2
-                logger.info(f"Applied round trip doubling to fixed price: {price} {config.currency}")
-                
-            result["price_details"]["fixed_price_applied"] = True
-            
-            # Get distance-based minimum fare
-            distance_min_fare = get_distance_based_min_fare(one_way_distance, vehicle_category, config, trip_type)
-            
-            # Compare with distance-based minimum fare
-            if price < distance_min_fare:
-                price = distance_min_fare
-                result["price_details"]["min_fare_applied"] = True
-                result["price_details"]["min_fare_value"] = distance_min_fare
-                logger.info(f"Distance-based minimum fare applied: {distance_min_fare} {config.currency}")
-            
-            result["price"] = price
-            return price, result["currency"]
-        
-        # 4. Calculate base price based on vehicle category and distance
-        if vehicle_category not in config.vehicle_rates:
-            logger.warning(f"Unknown vehicle category: {vehicle_category}, using default")
-            vehicle_category = next(iter(config.vehicle_rates.keys()))
-        
-        base_rate = config.vehicle_rates[vehicle_category]
-        result["price_details"]["base_rate_per_km"] = base_rate
-        
-        # 5. Apply zone multipliers from the database
-        price = 0.0
-        
-        for zone_code, distance in zones_crossed.items():
-            # Get multiplier for this zone (falls back to DEFAULT if not found)
-            zone_multiplier = config.zone_multipliers.get(zone_code, 
-                               config.zone_multipliers.get("DEFAULT", 1.0))
-            
-            zone_price = base_rate * distance * zone_multiplier
-            
-            # Apply round trip doubling to each zone price if needed
-            if trip_type == "2":
-                zone_price *= 2
-                
-            price += zone_price
-            
-            # Record details for this zone
-            result["price_details"]["zone_adjustments"][zone_code] = {
-                "distance_km": distance,
-                "multiplier": zone_multiplier,
-                "contribution": zone_price,
-                "doubled_for_round_trip": trip_type == "2"
-            }
-        
-        result["price_details"]["base_price"] = price
-        
-        # Time-based multipliers removed as requested
-        
-        # 6. Apply distance-based minimum fare if needed
-        distance_min_fare = get_distance_based_min_fare(one_way_distance, vehicle_category, config, trip_type)
-        
-        if price < distance_min_fare:
-            logger.info(f"Applying distance-based minimum fare: {distance_min_fare} {config.currency}")
-            price = distance_min_fare
-            result["price_details"]["min_fare_applied"] = True
-            result["price_details"]["min_fare_value"] = distance_min_fare
-        
-        # Round to 2 decimal places
-        price = round(price, 2)
         result["price"] = price
         
         return price, result["currency"]
@@ -273,6 +283,304 @@ def calculate_price(
         
         return min_fare, result["currency"]
 
+def price_route(
+    pickup: Tuple[float, float],
+    dropoff: Tuple[float, float],
+    vehicle_category: str,
+    one_way_distance: float,
+    zones_crossed: Dict[str, float],
+    config: Config,
+    geo_data: Dict[str, Any],
+    trip_type: str = "1",
+    details: Optional[Dict[str, Any]] = None,
+    pickup_time: Optional[datetime] = None,
+    estimate: bool = False
+) -> float:
+    """
+    Price a routed trip from its distance and per-zone breakdown
+    
+    Applies the fixed price override, zone and time multipliers and the
+    distance-based minimum fare. Fixed prices and minimum fares are not
+    subject to time multipliers.
+    
+    Args:
+        pickup: (latitude, longitude) of pickup
+        dropoff: (latitude, longitude) of dropoff
+        vehicle_category: Type of vehicle requested
+        one_way_distance: Route distance in kilometers
+        zones_crossed: Distance in kilometers per zone code
+        config: Configuration object containing pricing rules
+        geo_data: Loaded geographic data including the zone hierarchy
+        trip_type: "1" for one-way, "2" for round trip
+        details: Dictionary to record the price breakdown in (optional)
+        pickup_time: Time of pickup for time multipliers (optional, none applied if not given)
+        estimate: Whether this prices an estimate (instant or browse quote), which is
+            kept out of the quote metrics and logs
+        
+    Returns:
+        Price in the configured currency
+    """
+    if details is None:
+        details = {}
+    
+    # 3. Check for fixed price override
+    stage_start = perf_counter()
+    fixed_price = check_fixed_price(pickup, dropoff, vehicle_category, config.fixed_prices)
+    if not estimate:
+        _fixed_price_stage.observe(perf_counter() - stage_start)
+    
+    if fixed_price is not None:
+        if not estimate and log_sampler.sample("fixed_price"):
+            logger.info("Fixed price found: %s %s", fixed_price, config.currency, extra={"log_class": "fixed_price"})
+        if not estimate:
+            FIXED_PRICE_HITS.inc()
+        price = fixed_price
+        
+        # Apply round trip doubling for fixed prices too
+        if trip_type == "2":
+            price *= 2
+            if not estimate and log_sampler.sample("fixed_price"):
+                logger.info("Applied round trip doubling to fixed price: %s %s", price, config.currency, extra={"log_class": "fixed_price"})
+            
+        details["fixed_price_applied"] = True
+        
+        # Get distance-based minimum fare
+        distance_min_fare = get_distance_based_min_fare(one_way_distance, vehicle_category, config, trip_type)
+        
+        # Compare with distance-based minimum fare
+        if price < distance_min_fare:
+            price = distance_min_fare
+            if not estimate:
+                MIN_FARE_APPLIED.inc()
+            details["min_fare_applied"] = True
+            details["min_fare_value"] = distance_min_fare
+            if not estimate and log_sampler.sample("min_fare"):
+                logger.info("Distance-based minimum fare applied: %s %s", distance_min_fare, config.currency, extra={"log_class": "min_fare"})
+        
+        return price
+    
+    # 4. Calculate base price based on vehicle category and distance
+    if vehicle_category not in config.vehicle_rates:
+        logger.warning(f"Unknown vehicle category: {vehicle_category}, using default")
+        vehicle_category = next(iter(config.vehicle_rates.keys()))
+    
+    base_rate = config.vehicle_rates[vehicle_category]
+    details["base_rate_per_km"] = base_rate
+    
+    # 5. Apply zone multipliers from the database and the time multipliers of each zone
+    price = 0.0
+    zone_adjustments = details.setdefault("zone_adjustments", {})
+    time_multipliers = {}
+    if pickup_time is not None:
+        calendar = compiled_calendar(config.time_multipliers)
+        if not calendar.flat:
+            time_multipliers = calendar.lookup_zones(pickup_time, zones_crossed, geo_data)
+    
+    for zone_code, distance in zones_crossed.items():
+        # Get multiplier for this zone, inherited from its province or country if
+        # not set (falls back to DEFAULT if none is found)
+        zone_multiplier, multiplier_zone = resolve_zone_multiplier(zone_code, config.zone_multipliers, geo_data)
+        time_multiplier, time_period = time_multipliers.get(zone_code, (1.0, ""))
+        
+        zone_price = base_rate * distance * zone_multiplier * time_multiplier
+        
+        # Apply round trip doubling to each zone price if needed
+        if trip_type == "2":
+            zone_price *= 2
+            
+        price += zone_price
+        
+        # Record details for this zone
+        zone_adjustments[zone_code] = {
+            "distance_km": distance,
+            "multiplier": zone_multiplier,
+            "multiplier_zone": multiplier_zone,
+            "time_multiplier": time_multiplier,
+            "time_period": time_period,
+            "contribution": zone_price,
+            "doubled_for_round_trip": trip_type == "2"
+        }
+    
+    details["base_price"] = price
+    
+    # 6. Apply distance-based minimum fare if needed
+    distance_min_fare = get_distance_based_min_fare(one_way_distance, vehicle_category, config, trip_type)
+    
+    if price < distance_min_fare:
+        if not estimate and log_sampler.sample("min_fare"):
+            logger.info("Applying distance-based minimum fare: %s %s", distance_min_fare, config.currency, extra={"log_class": "min_fare"})
+        price = distance_min_fare
+        if not estimate:
+            MIN_FARE_APPLIED.inc()
+        details["min_fare_applied"] = True
+        details["min_fare_value"] = distance_min_fare
+    
+    # Round to 2 decimal places
+    return round(price, 2)
+
+def estimate_route(
+    pickup: Tuple[float, float],
+    dropoff: Tuple[float, float],
+    geo_data: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Estimate the road distance of a trip without calling a routing provider
+    
+    The straight line between pickup and dropoff is attributed to zones and
+    scaled by the circuity learned for the trip's provinces and distance
+    (see route_estimator.py).
+    
+    Args:
+        pickup: (latitude, longitude) of pickup
+        dropoff: (latitude, longitude) of dropoff
+        geo_data: Loaded geographic data including R-tree spatial index
+        
+    Returns:
+        Tuple of (estimate from CircuityModel.estimate, estimated km per zone code)
+    """
+    estimate = circuity_model.estimate(pickup, dropoff, geo_data)
+    line_points = calculate_route_segments(pickup, dropoff, num_segments=20, use_routing_apis=False)
+    try:
+        zones_crossed = determine_zones_crossed(line_points, geo_data)
+    except Exception as e:
+        logger.error(f"Error determining zones crossed for estimate: {str(e)}")
+        zones_crossed = {"DEFAULT": estimate["straight_km"]}
+    
+    return estimate, {zone: km * estimate["circuity"] for zone, km in zones_crossed.items()}
+
+def calculate_itinerary_prices(
+    stops: List[Tuple[float, float]],
+    vehicle_categories: List[str],
+    pickup_time: datetime,
+    config: Config,
+    geo_data: Dict[str, Any],
+    routing_providers: Optional[List[str]] = None,
+    priority: str = "interactive"
+) -> Dict[str, Any]:
+    """
+    Price a multi-stop itinerary (A -> B -> C ...) for several vehicle categories at once
+    
+    The whole itinerary is routed with a single provider call through the
+    intermediate stops, and the route polyline is split per leg for zone
+    attribution. Each leg is then priced like a single transfer (fixed prices,
+    zone multipliers, minimum fares) and the itinerary price is the sum of its
+    legs. Routing and zone attribution are shared by all categories.
+    
+    Args:
+        stops: (latitude, longitude) of every stop, in order, at least two
+        vehicle_categories: Vehicle categories to price
+        pickup_time: Time of pickup at the first stop
+        config: Configuration object containing pricing rules
+        geo_data: Loaded geographic data including R-tree spatial index
+        routing_providers: Routing providers to try, in order (defaults to all configured)
+        priority: Quota priority class for paid routing providers ('interactive' or 'batch')
+        
+    Returns:
+        Dictionary with the currency, route source, total distance and duration,
+        'legs' (stops, distance, duration and zones crossed of each leg) and
+        'prices' (total and per-leg price of each category)
+    """
+    depart_at = pickup_time.strftime("%Y-%m-%dT%H:%M")
+    
+    # 1. Route the whole itinerary at once and split it per leg
+    stage_start = perf_counter()
+    route = get_route_with_fallbacks(
+        stops[0],
+        stops[-1],
+        depart_at=depart_at,
+        providers=routing_providers,
+        priority=priority,
+        waypoints=stops[1:-1]
+    )
+    
+    leg_info = route.get("legs") or [{"distance": route["distance"], "duration": route.get("duration", 0)}]
+    if len(leg_info) != len(stops) - 1:
+        logger.warning(f"Route from {route.get('source')} has {len(leg_info)} legs for {len(stops)} stops, "
+                       "splitting distance by polyline length")
+        leg_info = None
+    
+    route_points = decode_polyline_to_array(route["geometry"]) if route.get("geometry") else None
+    if route_points is not None and len(route_points) > 1:
+        leg_points = split_route_at_stops(route_points, stops, [leg["distance"] for leg in leg_info] if leg_info else None)
+    else:
+        logger.warning("No route geometry available, using linear interpolation for every leg")
+        leg_points = [
+            calculate_route_segments(start, end, num_segments=20, use_routing_apis=False)
+            for start, end in zip(stops, stops[1:])
+        ]
+    
+    if leg_info is None:
+        lengths = [float(haversine_segments(points).sum()) if len(points) > 1 else 0.0 for points in leg_points]
+        total_length = sum(lengths) or 1.0
+        leg_info = [
+            {"distance": route["distance"] * length / total_length, "duration": route.get("duration", 0) * length / total_length}
+            for length in lengths
+        ]
+    
+    # Without a provider route the legs are straight lines, use estimated road distances
+    leg_scales = [1.0] * len(leg_points)
+    if route.get("source") == "haversine_fallback":
+        estimates = [circuity_model.estimate(start, end, geo_data) for start, end in zip(stops, stops[1:])]
+        leg_info = [{"distance": e["distance_km"], "duration": e["duration_min"]} for e in estimates]
+        leg_scales = [e["circuity"] for e in estimates]
+    _route_stage.observe(perf_counter() - stage_start)
+    
+    # 2. Determine the zones crossed by each leg
+    stage_start = perf_counter()
+    legs = []
+    for k, points in enumerate(leg_points):
+        start, end = stops[k], stops[k + 1]
+        distance = leg_info[k]["distance"]
+        try:
+            if len(points) < 2:
+                # The stop matched the previous split vertex, e.g. a stop just off the road
+                points = calculate_route_segments(start, end, num_segments=20, use_routing_apis=False)
+            zone_points, segment_lengths = simplify_route_for_zones(points, geo_data)
+            zones_crossed = determine_zones_crossed(zone_points, geo_data, segment_lengths)
+            if leg_scales[k] != 1.0:
+                zones_crossed = {zone: km * leg_scales[k] for zone, km in zones_crossed.items()}
+        except Exception as e:
+            logger.error(f"Error determining zones crossed by leg {k + 1}: {str(e)}")
+            zones_crossed = {"DEFAULT": distance}
+        
+        legs.append({
+            "pickup": start,
+            "dropoff": end,
+            "distance_km": distance,
+            "duration_min": leg_info[k]["duration"],
+            "zones_crossed": zones_crossed
+        })
+    _zones_stage.observe(perf_counter() - stage_start)
+    
+    # 3. Price every leg for every category, each at the time it starts
+    leg_starts = [pickup_time]
+    for leg in legs[:-1]:
+        leg_starts.append(leg_starts[-1] + timedelta(minutes=leg["duration_min"] or 0))
+    
+    prices = {}
+    for category in vehicle_categories:
+        leg_prices = []
+        for leg, leg_start in zip(legs, leg_starts):
+            try:
+                leg_price = price_route(
+                    leg["pickup"], leg["dropoff"], category, leg["distance_km"], leg["zones_crossed"], config, geo_data,
+                    pickup_time=leg_start
+                )
+            except Exception as e:
+                logger.error(f"Error pricing itinerary leg for {category}: {str(e)}")
+                leg_price = config.min_fares.get(category, 15.0)
+            leg_prices.append(leg_price)
+        prices[category] = {"price": round(sum(leg_prices), 2), "legs": leg_prices}
+    
+    return {
+        "currency": config.currency,
+        "route_source": route.get("source", "unknown"),
+        "distance_km": sum(leg["distance_km"] for leg in legs),
+        "duration_min": sum(leg["duration_min"] for leg in legs),
+        "legs": legs,
+        "prices": prices
+    }
+
 def get_distance_based_min_fare(
     distance: float,
     vehicle_category: str,
@@ -315,4 +623,65 @@ def get_distance_based_min_fare(
     if trip_type == "2":
         min_fare *= 2
     
-    return min_fare
\ No newline at end of file
+    return min_fare
+
+def round_to_nearest_10(price: float) -> float:
+    """Round the price to the nearest 10 euros for a premium look, ensuring .5 rounds up"""
+    # Use standard rounding function which will round .5 to the even number
+    # To ensure .5 always rounds up, add a tiny amount
+    return round(price / 10.0) * 10.0
+
+# Minimum step between consecutive categories in the sorted price list:
+# (lower category, higher category) -> minimum difference in EUR
+PRICE_HIERARCHY_STEPS = {
+    ("standard_minivan", "xl_minivan"): 10,  # Ensure XL is at least €10 more than standard
+    ("xl_minivan", "vip_minivan"): 10,       # Ensure VIP is at least €10 more than XL
+    ("standard_sedan", "premium_sedan"): 10, # Ensure premium is at least €10 more than standard
+    ("premium_sedan", "vip_sedan"): 20,      # Ensure VIP is at least €20 more than premium
+}
+
+def _category_family(category: str) -> Optional[str]:
+    """Return the vehicle family whose hierarchy a category belongs to"""
+    if 'minivan' in category:
+        return 'minivan'
+    if 'sedan' in category:
+        return 'sedan'
+    return None
+
+def enforce_price_hierarchy(prices_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Validate logical price progression for vehicle categories.
+    This ensures standard < xl < vip pricing hierarchy.
+    
+    Each category is compared with the previous category of the same family
+    in the sorted list, in a single pass.
+    
+    Args:
+        prices_list: List of price dictionaries with 'category' and 'price' keys
+        
+    Returns:
+        The list sorted by category, with illogical prices raised in place
+    """
+    if len(prices_list) <= 1:
+        return prices_list
+    
+    # Sort by category to group similar vehicles
+    prices_list.sort(key=lambda x: x["category"])
+    
+    previous_in_family = {}
+    for entry in prices_list:
+        family = _category_family(entry["category"])
+        if family is None:
+            continue
+        
+        previous = previous_in_family.get(family)
+        previous_in_family[family] = entry
+        if previous is None:
+            continue
+        
+        step = PRICE_HIERARCHY_STEPS.get((previous["category"], entry["category"]))
+        if step is not None and previous["price"] >= entry["price"]:
+            logger.warning(f"Fixing illogical pricing: {previous['category']}={previous['price']} >= {entry['category']}={entry['price']}")
+            entry["price"] = max(entry["price"], previous["price"] + step)
+    
+    return prices_list
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import hmac
+import uuid
+import random
+import logging
+import cProfile
+import pstats
+import threading
+import contextvars
+from collections import OrderedDict
+from datetime import datetime
+from time import perf_counter, thread_time
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Counters of the request currently being profiled (None when profiling is off)
+_current_counters = contextvars.ContextVar("profile_counters", default=None)
+
+# Shapely 2 calls into GEOS through C functions that cProfile reports as e.g. '<intersects_scalar>'
+_GEOS_CALL = re.compile(r"^<(?:built-in method shapely\.lib\.)?(\w+?)(?:_scalar)?>$")
+# Shapely C functions that only validate input without calling GEOS
+_NON_GEOS_CALLS = {"is_valid_input"}
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_PREFIX = re.compile(r"^.*[/\\]python\d+\.\d+[/\\]")
+
+def profile_counters() -> Optional[Dict[str, Any]]:
+    """Counters of the profiled request in this context, or None if it is not being profiled"""
+    return _current_counters.get()
+
+def count(name: str, amount: int = 1, key: Optional[str] = None) -> None:
+    """
+    Add to a counter of the profiled request (no-op when not profiling)
+    
+    Args:
+        name: Counter name, e.g. 'polyline_points'
+        amount: Amount to add
+        key: Optional sub-key, e.g. a zone code, to count per item
+    """
+    counters = _current_counters.get()
+    if counters is None:
+        return
+    if key is None:
+        counters[name] = counters.get(name, 0) + amount
+    else:
+        per_key = counters.setdefault(name, {})
+        per_key[key] = per_key.get(key, 0) + amount
+
+class RequestProfiler:
+    """
+    Opt-in profiling of individual quote calculations
+    
+    A request is profiled when it carries a valid X-Profile-Token header, or
+    when it is picked by sampling (`sample_rate` of cache misses). The
+    calculation runs under cProfile; the resulting profile (top functions by
+    own CPU time, GEOS call counts and engine counters such as polyline points
+    and candidate zones) is kept in a bounded in-memory store and optionally
+    written to `profile_dir` together with the raw pstats dump.
+    """
+    
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        store_size: int = 50,
+        profile_dir: Optional[str] = None,
+        top_n: int = 25
+    ):
+        """
+        Args:
+            token: Secret enabling header-authorized profiling and the /profiles endpoints
+            sample_rate: Fraction (0-1) of calculated quotes profiled automatically
+            store_size: Number of recent profiles kept in memory
+            profile_dir: Directory to also write profiles to (optional)
+            top_n: Number of functions included in each profile
+        """
+        self.token = token
+        self.sample_rate = sample_rate
+        self.store_size = store_size
+        self.profile_dir = profile_dir
+        self.top_n = top_n
+        self._profiles = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        # Only one profiler may be active per process (enforced by Python 3.12+)
+        self._active = threading.Lock()
+        
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+    
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        """Create a profiler configured from environment variables"""
+        return cls(
+            token=os.getenv("PROFILE_TOKEN") or None,
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            store_size=int(os.getenv("PROFILE_STORE_SIZE", "50")),
+            profile_dir=os.getenv("PROFILE_DIR") or None,
+            top_n=int(os.getenv("PROFILE_TOP_N", "25"))
+        )
+    
+    def is_authorized(self, token: Optional[str]) -> bool:
+        """Whether a request token matches the configured profiling token"""
+        if not self.token or not token:
+            return False
+        return hmac.compare_digest(self.token.encode(), token.encode())
+    
+    def should_sample(self) -> bool:
+        """Randomly pick a request for profiling according to the sample rate"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+    
+    def run(self, label: str, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Call a function under the profiler and store the profile
+        
+        Must be called in the thread doing the work (cProfile only sees its own thread).
+        If another request is already being profiled, the function runs unprofiled.
+        
+        Args:
+            label: Description stored with the profile, e.g. the request ID
+            fn: Function to profile
+        
+        Returns:
+            Tuple of (function result, profile dictionary or None if skipped)
+        """
+        if not self._active.acquire(blocking=False):
+            logger.info(f"Skipping profile for {label}: another request is being profiled")
+            return fn(*args, **kwargs), None
+        
+        try:
+            return self._run_profiled(label, fn, *args, **kwargs)
+        finally:
+            self._active.release()
+    
+    def _run_profiled(self, label: str, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+        counters = {}
+        token = _current_counters.set(counters)
+        profiler = cProfile.Profile()
+        wall_start = perf_counter()
+        cpu_start = thread_time()
+        
+        try:
+            result = profiler.runcall(fn, *args, **kwargs)
+        finally:
+            cpu_time = thread_time() - cpu_start
+            wall_time = perf_counter() - wall_start
+            _current_counters.reset(token)
+        
+        profile = self._summarize(profiler, counters, label, wall_time, cpu_time)
+        self._store(profile, profiler)
+        return result, profile
+    
+    def _summarize(self, profiler: cProfile.Profile, counters: Dict[str, Any], label: str, wall_time: float, cpu_time: float) -> Dict[str, Any]:
+        stats = pstats.Stats(profiler).stats
+        
+        functions = []
+        geos_calls = {}
+        for (filename, line, name), (_, calls, own_time, cumulative_time, _) in stats.items():
+            if filename == "~":
+                match = _GEOS_CALL.match(name)
+                if match and match.group(1) not in _NON_GEOS_CALLS:
+                    geos_calls[match.group(1)] = geos_calls.get(match.group(1), 0) + calls
+                location = name
+            else:
+                location = f"{_short_path(filename)}:{line}({name})"
+            
+            functions.append({
+                "function": location,
+                "calls": calls,
+                "own_ms": round(own_time * 1000, 3),
+                "cumulative_ms": round(cumulative_time * 1000, 3)
+            })
+        
+        functions.sort(key=lambda f: f["own_ms"], reverse=True)
+        
+        return {
+            "id": uuid.uuid4().hex[:12],
+            "label": label,
+            "timestamp": datetime.now().isoformat(),
+            "wall_ms": round(wall_time * 1000, 3),
+            "cpu_ms": round(cpu_time * 1000, 3),
+            "geos_calls": dict(sorted(geos_calls.items(), key=lambda item: item[1], reverse=True)),
+            "counters": counters,
+            "top_functions": functions[:self.top_n]
+        }
+    
+    def _store(self, profile: Dict[str, Any], profiler: cProfile.Profile) -> None:
+        size = len(json.dumps(profile))
+        with self._lock:
+            self._profiles[profile["id"]] = profile
+            self._sizes[profile["id"]] = size
+            while len(self._profiles) > self.store_size:
+                self._sizes.pop(self._profiles.popitem(last=False)[0], None)
+        
+        logger.info(f"Stored profile {profile['id']} for {profile['label']}: "
+                    f"{profile['wall_ms']} ms wall, {profile['cpu_ms']} ms CPU, "
+                    f"{sum(profile['geos_calls'].values())} GEOS calls")
+        
+        if self.profile_dir:
+            try:
+                base = os.path.join(self.profile_dir, profile["id"])
+                with open(base + ".json", "w") as f:
+                    json.dump(profile, f, indent=2)
+                profiler.dump_stats(base + ".prof")
+            except Exception as e:
+                logger.error(f"Error writing profile {profile['id']}: {str(e)}")
+    
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Summaries of the stored profiles, newest first"""
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [
+            {
+                "id": p["id"],
+                "label": p["label"],
+                "timestamp": p["timestamp"],
+                "wall_ms": p["wall_ms"],
+                "cpu_ms": p["cpu_ms"],
+                "geos_calls": sum(p["geos_calls"].values())
+            }
+            for p in reversed(profiles)
+        ]
+    
+    def memory_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._profiles), "bytes": sum(self._sizes.values())}
+    
+    def evict(self, fraction: float) -> int:
+        """Drop the oldest fraction of stored profiles, returning the number removed"""
+        with self._lock:
+            count = min(len(self._profiles), max(1, int(len(self._profiles) * fraction)))
+            for _ in range(count):
+                self._sizes.pop(self._profiles.popitem(last=False)[0], None)
+            return count
+    
+    def get_profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored profile by ID"""
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+def _short_path(filename: str) -> str:
+    """Trim site-packages, standard library and repository prefixes from a source path"""
+    if "site-packages" + os.sep in filename:
+        return filename.split("site-packages" + os.sep, 1)[1]
+    if filename.startswith(_REPO_DIR + os.sep):
+        return filename[len(_REPO_DIR) + 1:]
+    return _STDLIB_PREFIX.sub("", filename)
@@ -0,0 +1,202 @@
+import os
+import glob
+import gzip
+import json
+import atexit
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from time import perf_counter, sleep
+from typing import Dict, Any, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Request parameters holding credentials, never written to an archive
+SECRET_PARAMS = {"key", "access_token"}
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+class ReplayedResponse:
+    """Minimal stand-in for requests.Response built from an archived entry"""
+    
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+    
+    def json(self) -> Any:
+        return json.loads(self.text)
+
+class ProviderTape:
+    """
+    Record/replay layer for routing provider HTTP calls
+    
+    In record mode every provider response is appended to a gzip-compressed
+    NDJSON archive together with its latency, keyed by provider, URL path and
+    request parameters with API keys stripped. In replay mode responses are
+    served from the archive without network access, either with their
+    recorded latency or immediately; requests missing from the archive are
+    treated as provider failures.
+    """
+    
+    def __init__(self, mode: str = MODE_OFF, path: Optional[str] = None, replay_latency: str = "original"):
+        """
+        Args:
+            mode: 'off', 'record' or 'replay'
+            path: Archive path; in record mode '{pid}' is replaced by the process ID
+                (one file per worker), in replay mode it may be a glob pattern
+            replay_latency: 'original' to sleep for the recorded latency, 'zero' to respond immediately
+        """
+        if mode not in (MODE_OFF, MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Invalid provider tape mode '{mode}', expected off, record or replay")
+        
+        self.mode = mode
+        self.path = path
+        self.replay_latency = replay_latency
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._entries = {}
+        self._bytes = 0
+        self._file = None
+        self._lock = threading.Lock()
+        
+        if mode == MODE_REPLAY:
+            self.load(path)
+    
+    @classmethod
+    def from_env(cls) -> "ProviderTape":
+        """Create the tape configured from environment variables"""
+        return cls(
+            mode=os.getenv("PROVIDER_TAPE_MODE", MODE_OFF).lower(),
+            path=os.getenv("PROVIDER_TAPE_PATH", "recordings/providers-{pid}.ndjson.gz"),
+            replay_latency=os.getenv("PROVIDER_REPLAY_LATENCY", "original").lower()
+        )
+    
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+    
+    @staticmethod
+    def make_key(provider: str, url: str, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Build the archive key for a provider request
+        
+        Returns:
+            Tuple of (key, parameters without secrets)
+        """
+        public_params = {name: value for name, value in params.items() if name not in SECRET_PARAMS}
+        raw = json.dumps([provider, urlsplit(url).path, sorted((k, str(v)) for k, v in public_params.items())])
+        return hashlib.sha1(raw.encode()).hexdigest(), public_params
+    
+    def load(self, pattern: str) -> None:
+        """Load archived responses from every file matching a path or glob pattern"""
+        paths = sorted(glob.glob(pattern.replace("{pid}", "*")))
+        if not paths:
+            logger.error(f"No provider recordings found at {pattern}")
+        
+        for path in paths:
+            count = 0
+            try:
+                with gzip.open(path, "rt") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+                        self._bytes += len(line) * 2  # Decoded strings and dict overhead
+                        count += 1
+            except EOFError:
+                # Processes that exit without closing the archive (e.g. pool workers) leave no
+                # gzip trailer; every entry up to the last flush is still readable
+                logger.info(f"Recording {path} has no gzip trailer, loaded the {count} complete entries")
+            except (gzip.BadGzipFile, json.JSONDecodeError) as e:
+                logger.warning(f"Recording {path} is corrupt after {count} entries: {str(e)}")
+            logger.info(f"Loaded {count} provider responses from {path}")
+    
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the loaded recorded responses (key, provider, path, params, status, body, latency_ms)"""
+        return iter(list(self._entries.values()))
+    
+    def _open_for_recording(self):
+        path = self.path.replace("{pid}", str(os.getpid()))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = gzip.open(path, "at")
+        atexit.register(self.close)
+        logger.info(f"Recording provider responses to {path}")
+    
+    def get(self, provider: str, url: str, params: Dict[str, Any], timeout: Optional[float] = None):
+        """
+        Perform (or replay) a provider GET request
+        
+        Args:
+            provider: Routing provider name
+            url: Request URL
+            params: Query parameters, including the API key
+            timeout: Request timeout in seconds
+        
+        Returns:
+            A requests.Response, a ReplayedResponse, or None on a replay miss
+        """
+        if self.mode == MODE_OFF:
+            return requests.get(url, params=params, timeout=timeout)
+        
+        key, public_params = self.make_key(provider, url, params)
+        
+        if self.mode == MODE_REPLAY:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                logger.warning(f"No recorded {provider} response for {urlsplit(url).path} {public_params}")
+                return None
+            self.replayed += 1
+            if self.replay_latency == "original":
+                sleep(entry["latency_ms"] / 1000)
+            return ReplayedResponse(entry["status"], entry["body"])
+        
+        start = perf_counter()
+        response = requests.get(url, params=params, timeout=timeout)
+        latency_ms = (perf_counter() - start) * 1000
+        
+        entry = {
+            "key": key,
+            "provider": provider,
+            "path": urlsplit(url).path,
+            "params": public_params,
+            "status": response.status_code,
+            "body": response.text,
+            "latency_ms": round(latency_ms, 2),
+            "recorded_at": datetime.now().isoformat(timespec="seconds")
+        }
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        
+        with self._lock:
+            if self._file is None:
+                self._open_for_recording()
+            self._file.write(line)
+            # Sync flush so the archive is readable up to here even if the process is killed
+            self._file.flush()
+            self.recorded += 1
+        
+        return response
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def memory_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "entries": len(self._entries),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses
+        }
@@ -0,0 +1,253 @@
+import os
+import logging
+import threading
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Paid routing providers and the environment variable holding their API key(s)
+PAID_PROVIDERS = {
+    "google_maps": "GOOGLE_MAPS_API_KEY",
+    "mapbox": "MAPBOX_API_KEY"
+}
+
+# Default per-key limits: requests per second, daily request budget (0 = unlimited)
+# and cost per request in the billing currency
+DEFAULT_QUOTAS = {
+    "google_maps": {"rps": 50.0, "daily": 0, "cost": 0.005},
+    "mapbox": {"rps": 5.0, "daily": 0, "cost": 0.002}
+}
+
+# Priority classes: interactive quotes get provider routing first, while batch work
+# (bulk re-pricing, matrices, prefetch) may only use capacity above the reserve
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = [PRIORITY_INTERACTIVE, PRIORITY_BATCH]
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (defaults to one second worth)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def try_take(self, tokens: float = 1.0, reserve: float = 0.0) -> bool:
+        """
+        Take tokens if available, leaving at least `reserve` tokens in the bucket
+        
+        Args:
+            tokens: Number of tokens to take
+            reserve: Tokens that must remain afterwards (held back for higher priorities)
+        
+        Returns:
+            True if the tokens were taken
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens - tokens < reserve:
+                return False
+            self.tokens -= tokens
+            return True
+    
+    def available(self) -> float:
+        """Number of tokens currently available"""
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+class ProviderKey:
+    """Usage tracking for a single API key of a routing provider"""
+    
+    def __init__(self, provider: str, key: str, index: int, rps: float, daily_budget: int, cost: float):
+        self.provider = provider
+        self.key = key
+        self.label = f"{provider}#{index}"  # Never expose the key itself
+        # Configured limits of the key, split between processes by QuotaManager.set_processes
+        self.rps_limit = rps
+        self.daily_limit = daily_budget
+        self.bucket = TokenBucket(rps)
+        self.daily_budget = daily_budget
+        self.cost = cost
+        self.day = None
+        self.used_today = 0
+        self.total_used = 0
+        self.throttled = {priority: 0 for priority in PRIORITIES}
+    
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).date()
+        if self.day != today:
+            self.day = today
+            self.used_today = 0
+    
+    def remaining_today(self) -> Optional[int]:
+        """Requests left in today's budget, or None if unlimited"""
+        self._roll_day()
+        if not self.daily_budget:
+            return None
+        return max(0, self.daily_budget - self.used_today)
+
+class QuotaManager:
+    """
+    Token-bucket quota scheduler for paid routing API keys
+    
+    Each key of each paid provider has a per-second token bucket and an
+    optional daily request budget. Interactive requests may use all of it;
+    batch requests may only use capacity above a reserved fraction.
+    
+    Buckets and budgets are kept in the memory of each process and restart
+    from zero with it. Processes using the same keys (uvicorn workers, every
+    instance, bulk pricing workers) each get their share of the configured
+    limits (see set_processes); the batch reserve only holds back capacity
+    from batch work in the same process.
+    """
+    
+    def __init__(self, keys: Dict[str, List[ProviderKey]], batch_reserve: float = 0.2):
+        """
+        Args:
+            keys: Provider name -> list of tracked API keys
+            batch_reserve: Fraction of each bucket and daily budget reserved for interactive traffic
+        """
+        self.keys = keys
+        self.batch_reserve = batch_reserve
+        self._lock = threading.Lock()
+        self._next_key = {provider: 0 for provider in keys}
+        self.processes = 1
+    
+    @classmethod
+    def from_env(cls) -> "QuotaManager":
+        """
+        Build the quota manager from environment variables
+        
+        API key variables may hold several comma-separated keys. Limits are set
+        per provider with QUOTA_<PROVIDER>_RPS, QUOTA_<PROVIDER>_DAILY and
+        QUOTA_<PROVIDER>_COST, e.g. QUOTA_GOOGLE_MAPS_DAILY=20000, and split
+        between the QUOTA_PROCESSES processes sharing the keys.
+        """
+        keys = {}
+        for provider, env_var in PAID_PROVIDERS.items():
+            defaults = DEFAULT_QUOTAS[provider]
+            prefix = f"QUOTA_{provider.upper()}"
+            rps = float(os.getenv(f"{prefix}_RPS", defaults["rps"]))
+            daily = int(os.getenv(f"{prefix}_DAILY", defaults["daily"]))
+            cost = float(os.getenv(f"{prefix}_COST", defaults["cost"]))
+            
+            raw_keys = [k.strip() for k in os.getenv(env_var, "").split(",") if k.strip()]
+            keys[provider] = [ProviderKey(provider, key, i, rps, daily, cost) for i, key in enumerate(raw_keys)]
+        
+        manager = cls(keys, batch_reserve=float(os.getenv("QUOTA_BATCH_RESERVE", "0.2")))
+        manager.set_processes(int(os.getenv("QUOTA_PROCESSES", "1")))
+        return manager
+    
+    def set_processes(self, processes: int) -> None:
+        """
+        Split the configured limits of every key between processes using the same keys
+        
+        Each process gets 1/processes of the rate and of the daily budget, so
+        together they stay within the configured limits.
+        """
+        processes = max(1, processes)
+        with self._lock:
+            self.processes = processes
+            for provider_keys in self.keys.values():
+                for pk in provider_keys:
+                    pk.bucket = TokenBucket(pk.rps_limit / processes)
+                    # At least one request a day: a budget of 0 would mean unlimited
+                    pk.daily_budget = max(1, pk.daily_limit // processes) if pk.daily_limit else 0
+        if processes > 1:
+            logger.info(f"Provider quotas split between {processes} processes")
+    
+    def acquire(self, provider: str, priority: str = PRIORITY_INTERACTIVE) -> Optional[str]:
+        """
+        Reserve one request against a provider's quota
+        
+        Keys are tried round-robin; the first key with capacity for this
+        priority is charged.
+        
+        Args:
+            provider: Routing provider name
+            priority: 'interactive' or 'batch'
+        
+        Returns:
+            API key to use, or None if no key has capacity (the caller should
+            skip the provider)
+        """
+        provider_keys = self.keys.get(provider)
+        if not provider_keys:
+            return None
+        
+        is_batch = priority != PRIORITY_INTERACTIVE
+        
+        with self._lock:
+            start = self._next_key[provider]
+            self._next_key[provider] = (start + 1) % len(provider_keys)
+            
+            for offset in range(len(provider_keys)):
+                pk = provider_keys[(start + offset) % len(provider_keys)]
+                remaining = pk.remaining_today()
+                
+                if remaining is not None:
+                    reserve_requests = pk.daily_budget * self.batch_reserve if is_batch else 0
+                    if remaining - 1 < reserve_requests:
+                        pk.throttled[priority] = pk.throttled.get(priority, 0) + 1
+                        continue
+                
+                bucket_reserve = pk.bucket.capacity * self.batch_reserve if is_batch else 0.0
+                if not pk.bucket.try_take(1.0, reserve=bucket_reserve):
+                    pk.throttled[priority] = pk.throttled.get(priority, 0) + 1
+                    continue
+                
+                pk.used_today += 1
+                pk.total_used += 1
+                return pk.key
+        
+        logger.warning(f"No {provider} quota available for {priority} request")
+        return None
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Remaining budget and spend per provider and key
+        
+        Returns:
+            Dictionary keyed by provider with per-key usage and totals
+        """
+        result = {}
+        with self._lock:
+            for provider, provider_keys in self.keys.items():
+                key_stats = []
+                for pk in provider_keys:
+                    remaining = pk.remaining_today()
+                    key_stats.append({
+                        "key": pk.label,
+                        "requests_today": pk.used_today,
+                        "remaining_today": remaining,
+                        "daily_budget": pk.daily_budget or None,
+                        "tokens_available": round(pk.bucket.available(), 2),
+                        "rate_per_second": pk.bucket.rate,
+                        "spend_today": round(pk.used_today * pk.cost, 4),
+                        "spend_total": round(pk.total_used * pk.cost, 4),
+                        "throttled": dict(pk.throttled)
+                    })
+                result[provider] = {
+                    "keys": key_stats,
+                    "spend_today": round(sum(k["spend_today"] for k in key_stats), 4),
+                    "spend_total": round(sum(k["spend_total"] for k in key_stats), 4)
+                }
+        return result
+
+# Shared quota manager for all paid provider calls
+quota_manager = QuotaManager.from_env()
@@ -0,0 +1,465 @@
+"""
+Route estimates without a routing provider
+
+Road distance is estimated as the great-circle distance times a circuity
+factor (road km / straight-line km), and duration from a typical road speed.
+Both are learned offline from provider routes, per pair of provinces and
+straight-line distance band, with quantiles giving error bounds:
+    
+    python route_estimator.py train recordings/*.ndjson.gz -o config/circuity_model.json
+    python route_estimator.py evaluate config/circuity_model.json recordings/*.ndjson.gz
+
+Training data is either provider recordings (see provider_tape.py) or route
+samples exported from a running service's route cache (GET /admin/route-samples).
+"""
+import os
+import sys
+import glob
+import gzip
+import json
+import random
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+import numpy as np
+
+from geo_utils import RouteCache, haversine_distance, zone_at, zone_lineage, load_geo_data, ROUTING_PROVIDERS
+from metrics import ROUTE_ESTIMATES
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = 1
+
+# Upper bounds in km of the straight-line distance bands; longer trips fall in the last band
+DEFAULT_BANDS_KM = (5.0, 20.0, 50.0, 150.0)
+
+# Statistics used when the model has too few samples: circuity (p10, median, p90)
+# and typical road speed in km/h per distance band
+DEFAULT_CIRCUITY = (1.15, 1.3, 1.6)
+DEFAULT_SPEEDS_KMH = (25.0, 40.0, 60.0, 75.0, 90.0)
+# Relative spread of the default speeds used for duration bounds
+DEFAULT_SPEED_SPREAD = 0.3
+
+# Trips shorter than this are dominated by pickup/dropoff snapping and teach nothing about circuity
+MIN_TRAINING_DISTANCE_KM = 0.5
+# Samples outside this range are treated as bad data (e.g. a ferry or a geocoding error)
+CIRCUITY_RANGE = (1.0, 4.0)
+
+# Key of the statistics over all pairs, per band
+ALL_PAIRS = "*"
+
+# Route sample: (pickup, dropoff, road distance in km, duration in minutes)
+RouteSample = Tuple[Tuple[float, float], Tuple[float, float], float, float]
+
+def region_of(point: Tuple[float, float], geo_data: Dict[str, Any]) -> str:
+    """
+    Return the region a point belongs to for the model: its province, or the
+    finest zone where there is no province (e.g. a country abroad)
+    """
+    code = zone_at(point, geo_data)
+    if code is None:
+        return "DEFAULT"
+    zones = geo_data.get('zones', {})
+    for ancestor in zone_lineage(code, geo_data):
+        if zones.get(ancestor, {}).get('level') == "province":
+            return ancestor
+    return code
+
+def pair_key(origin: str, destination: str) -> str:
+    """Key of a region pair; circuity is close to symmetric, so both directions share statistics"""
+    return "|".join(sorted((origin, destination)))
+
+class CircuityModel:
+    """
+    Circuity and speed statistics per region pair and distance band
+    
+    Estimates use the statistics of the trip's region pair and band when they
+    have enough samples, else those of all pairs in the band, else built-in
+    defaults. Each estimate reports which one it used ('basis') and bounds from
+    the 10th and 90th percentiles of the samples.
+    """
+    
+    def __init__(
+        self,
+        cells: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None,
+        bands_km: Tuple[float, ...] = DEFAULT_BANDS_KM,
+        min_samples: int = 20,
+        trained_at: Optional[str] = None
+    ):
+        """
+        Args:
+            cells: Statistics by pair key (or ALL_PAIRS), then by band index
+            bands_km: Upper bounds of the distance bands in km
+            min_samples: Samples a cell needs to be used
+            trained_at: When the model was trained (ISO format)
+        """
+        self.cells = cells or {}
+        self.bands_km = tuple(bands_km)
+        self.min_samples = min_samples
+        self.trained_at = trained_at
+        self.path = None
+    
+    @classmethod
+    def from_env(cls) -> "CircuityModel":
+        """Load the model from CIRCUITY_MODEL_PATH, or use the defaults if there is none"""
+        model = cls()
+        model.load(os.getenv("CIRCUITY_MODEL_PATH", "config/circuity_model.json"))
+        return model
+    
+    def band_of(self, straight_km: float) -> int:
+        """Index of the distance band a straight-line distance falls in"""
+        for i, upper in enumerate(self.bands_km):
+            if straight_km < upper:
+                return i
+        return len(self.bands_km)
+    
+    def default_cell(self, band: int) -> Dict[str, float]:
+        """Built-in statistics for a band"""
+        speed = DEFAULT_SPEEDS_KMH[min(band, len(DEFAULT_SPEEDS_KMH) - 1)]
+        return {
+            "n": 0,
+            "circuity_low": DEFAULT_CIRCUITY[0],
+            "circuity": DEFAULT_CIRCUITY[1],
+            "circuity_high": DEFAULT_CIRCUITY[2],
+            "speed_low_kmh": speed * (1 - DEFAULT_SPEED_SPREAD),
+            "speed_kmh": speed,
+            "speed_high_kmh": speed * (1 + DEFAULT_SPEED_SPREAD)
+        }
+    
+    def lookup(self, origin: str, destination: str, band: int) -> Tuple[Dict[str, float], str]:
+        """
+        Find the statistics for a trip
+        
+        Returns:
+            Tuple of (statistics, basis: 'pair', 'band' or 'default')
+        """
+        cells = self.cells
+        for key, basis in ((pair_key(origin, destination), "pair"), (ALL_PAIRS, "band")):
+            cell = cells.get(key, {}).get(str(band))
+            if cell is not None and cell["n"] >= self.min_samples:
+                return cell, basis
+        return self.default_cell(band), "default"
+    
+    def estimate(self, pickup: Tuple[float, float], dropoff: Tuple[float, float], geo_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Estimate the road distance and duration of a trip
+        
+        Args:
+            pickup: (latitude, longitude) of pickup
+            dropoff: (latitude, longitude) of dropoff
+            geo_data: Loaded geographic data including R-tree spatial index
+        
+        Returns:
+            Dictionary with 'distance_km' and 'duration_min' and their '_low' and
+            '_high' bounds, the 'circuity' applied, 'straight_km', the 'basis' of
+            the statistics and their number of 'samples'
+        """
+        straight_km = haversine_distance(pickup, dropoff)
+        band = self.band_of(straight_km)
+        cell, basis = self.lookup(region_of(pickup, geo_data), region_of(dropoff, geo_data), band)
+        ROUTE_ESTIMATES.labels(basis=basis).inc()
+        
+        distance = straight_km * cell["circuity"]
+        distance_low = straight_km * cell["circuity_low"]
+        distance_high = straight_km * cell["circuity_high"]
+        return {
+            "distance_km": distance,
+            "distance_low_km": distance_low,
+            "distance_high_km": distance_high,
+            "duration_min": distance / cell["speed_kmh"] * 60,
+            "duration_low_min": distance_low / cell["speed_high_kmh"] * 60,
+            "duration_high_min": distance_high / cell["speed_low_kmh"] * 60,
+            "circuity": cell["circuity"],
+            "straight_km": straight_km,
+            "basis": basis,
+            "samples": cell["n"]
+        }
+    
+    @classmethod
+    def train(
+        cls,
+        samples: List[RouteSample],
+        geo_data: Dict[str, Any],
+        bands_km: Tuple[float, ...] = DEFAULT_BANDS_KM,
+        min_samples: int = 20
+    ) -> "CircuityModel":
+        """
+        Fit the statistics to provider routes
+        
+        Args:
+            samples: Routes as (pickup, dropoff, road km, minutes)
+            geo_data: Loaded geographic data including R-tree spatial index
+            bands_km: Upper bounds of the distance bands in km
+            min_samples: Samples a cell needs to be used
+        
+        Returns:
+            The trained model
+        """
+        model = cls(bands_km=bands_km, min_samples=min_samples, trained_at=datetime.now().isoformat(timespec="seconds"))
+        groups = {}
+        skipped = 0
+        for pickup, dropoff, distance_km, duration_min in samples:
+            straight_km = haversine_distance(pickup, dropoff)
+            if straight_km < MIN_TRAINING_DISTANCE_KM or duration_min <= 0:
+                skipped += 1
+                continue
+            circuity = distance_km / straight_km
+            if not CIRCUITY_RANGE[0] <= circuity <= CIRCUITY_RANGE[1]:
+                skipped += 1
+                continue
+            
+            band = str(model.band_of(straight_km))
+            speed = distance_km / (duration_min / 60)
+            pair = pair_key(region_of(pickup, geo_data), region_of(dropoff, geo_data))
+            for key in (pair, ALL_PAIRS):
+                groups.setdefault(key, {}).setdefault(band, []).append((circuity, speed))
+        
+        for key, bands in groups.items():
+            for band, values in bands.items():
+                circuity, speed = np.array(values).T
+                model.cells.setdefault(key, {})[band] = {
+                    "n": len(values),
+                    "circuity_low": round(float(np.percentile(circuity, 10)), 4),
+                    "circuity": round(float(np.median(circuity)), 4),
+                    "circuity_high": round(float(np.percentile(circuity, 90)), 4),
+                    "speed_low_kmh": round(float(np.percentile(speed, 10)), 2),
+                    "speed_kmh": round(float(np.median(speed)), 2),
+                    "speed_high_kmh": round(float(np.percentile(speed, 90)), 2)
+                }
+        
+        if skipped:
+            logger.info(f"Skipped {skipped} samples that were too short or implausible")
+        return model
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": MODEL_VERSION,
+            "trained_at": self.trained_at,
+            "bands_km": list(self.bands_km),
+            "min_samples": self.min_samples,
+            "cells": self.cells
+        }
+    
+    def save(self, path: str) -> None:
+        """Write the model as JSON"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+    
+    def load(self, path: str) -> bool:
+        """
+        Replace the statistics with those of a saved model, keeping the current
+        ones if the file is missing or invalid
+        
+        Returns:
+            True if the model was loaded
+        """
+        self.path = path
+        if not os.path.exists(path):
+            logger.info(f"No circuity model at {path}, using default circuity {DEFAULT_CIRCUITY[1]}")
+            return False
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != MODEL_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            self.bands_km = tuple(data["bands_km"])
+            self.min_samples = data.get("min_samples", self.min_samples)
+            self.trained_at = data.get("trained_at")
+            self.cells = data["cells"]
+            logger.info(f"Loaded circuity model from {path} ({len(self.cells) - 1} region pairs, trained {self.trained_at})")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading circuity model from {path}: {str(e)}")
+            return False
+    
+    def stats(self) -> Dict[str, Any]:
+        all_pairs = self.cells.get(ALL_PAIRS, {})
+        return {
+            "path": self.path,
+            "trained_at": self.trained_at,
+            "samples": sum(cell["n"] for cell in all_pairs.values()),
+            "pairs": sum(1 for key in self.cells if key != ALL_PAIRS),
+            "min_samples": self.min_samples
+        }
+
+def evaluate(model: CircuityModel, samples: List[RouteSample], geo_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare estimates with provider routes
+    
+    Returns:
+        Number of samples, median and 90th percentile absolute relative error of
+        distance and duration, the fraction of distances within the bounds, and
+        the number of estimates per basis
+    """
+    distance_errors, duration_errors, within, bases = [], [], 0, {}
+    for pickup, dropoff, distance_km, duration_min in samples:
+        if haversine_distance(pickup, dropoff) < MIN_TRAINING_DISTANCE_KM or duration_min <= 0:
+            continue
+        estimate = model.estimate(pickup, dropoff, geo_data)
+        distance_errors.append(abs(estimate["distance_km"] - distance_km) / distance_km)
+        duration_errors.append(abs(estimate["duration_min"] - duration_min) / duration_min)
+        within += estimate["distance_low_km"] <= distance_km <= estimate["distance_high_km"]
+        bases[estimate["basis"]] = bases.get(estimate["basis"], 0) + 1
+    
+    if not distance_errors:
+        return {"samples": 0}
+    return {
+        "samples": len(distance_errors),
+        "distance_error_median": round(float(np.median(distance_errors)), 4),
+        "distance_error_p90": round(float(np.percentile(distance_errors, 90)), 4),
+        "duration_error_median": round(float(np.median(duration_errors)), 4),
+        "duration_error_p90": round(float(np.percentile(duration_errors, 90)), 4),
+        "within_bounds": round(within / len(distance_errors), 4),
+        "basis": bases
+    }
+
+def _parse_coordinates(path: str) -> Optional[List[Tuple[float, float]]]:
+    """(latitude, longitude) stops from a Mapbox/OSRM URL path ending in 'lng,lat;lng,lat'"""
+    try:
+        return [(float(lat), float(lng)) for lng, lat in (pair.split(",") for pair in path.rsplit("/", 1)[-1].split(";"))]
+    except ValueError:
+        return None
+
+def sample_from_recording(entry: Dict[str, Any]) -> Optional[RouteSample]:
+    """
+    Extract a route sample from a recorded provider response (see provider_tape.py)
+    
+    Returns:
+        The sample, or None for failed requests and routes through waypoints
+    """
+    try:
+        if entry["status"] != 200:
+            return None
+        params = entry.get("params", {})
+        route = json.loads(entry["body"])["routes"][0]
+        
+        if entry["provider"] == "google_maps":
+            if params.get("waypoints"):
+                return None
+            pickup = tuple(float(v) for v in params["origin"].split(","))
+            dropoff = tuple(float(v) for v in params["destination"].split(","))
+            leg = route["legs"][0]
+            return pickup, dropoff, leg["distance"]["value"] / 1000, leg["duration"]["value"] / 60
+        
+        stops = _parse_coordinates(entry["path"])
+        if not stops or len(stops) != 2:
+            return None
+        return stops[0], stops[1], route["distance"] / 1000, route["duration"] / 60
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+def samples_from_route_cache(cache: RouteCache) -> List[RouteSample]:
+    """Route samples from the provider routes in a route cache (single-leg routes only)"""
+    samples = []
+    for key, route in cache.items():
+        # (pickup lat, lng, dropoff lat, lng, depart_at), longer keys have waypoints
+        if len(key) != 5 or route.get("source") not in ROUTING_PROVIDERS:
+            continue
+        samples.append(((key[0], key[1]), (key[2], key[3]), route["distance"], route["duration"]))
+    return samples
+
+def sample_to_dict(sample: RouteSample) -> Dict[str, Any]:
+    pickup, dropoff, distance_km, duration_min = sample
+    return {"pickup": list(pickup), "dropoff": list(dropoff), "distance_km": distance_km, "duration_min": duration_min}
+
+def _iter_ndjson(path: str) -> Iterator[Dict[str, Any]]:
+    """Entries of a plain or gzip-compressed NDJSON file, tolerating a missing gzip trailer"""
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    except EOFError:
+        # Recordings of processes that exit without closing the archive have no trailer
+        logger.info(f"{path} has no gzip trailer, read the complete entries")
+    except (gzip.BadGzipFile, json.JSONDecodeError) as e:
+        logger.warning(f"{path} is corrupt: {str(e)}")
+
+def load_samples(patterns: List[str]) -> List[RouteSample]:
+    """
+    Read route samples from provider recordings and exported samples
+    
+    Args:
+        patterns: Paths or glob patterns of NDJSON files (optionally .gz), each line
+            a recorded provider response or an exported sample
+    
+    Returns:
+        Route samples, one per distinct route
+    """
+    samples = {}
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            logger.warning(f"No files match {pattern}")
+        for path in paths:
+            count = 0
+            for entry in _iter_ndjson(path):
+                if "distance_km" in entry:
+                    sample = (tuple(entry["pickup"]), tuple(entry["dropoff"]), entry["distance_km"], entry["duration_min"])
+                else:
+                    sample = sample_from_recording(entry)
+                if sample is not None:
+                    # A route in several recordings counts once
+                    samples[sample] = sample
+                    count += 1
+            logger.info(f"Read {count} route samples from {path}")
+    return list(samples.values())
+
+# Shared model, loaded from CIRCUITY_MODEL_PATH
+circuity_model = CircuityModel.from_env()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Train and evaluate the circuity model for route estimates")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    train_parser = subparsers.add_parser("train", help="Train a model from provider recordings or exported route samples")
+    train_parser.add_argument("inputs", nargs="+", help="NDJSON files or glob patterns (.ndjson or .ndjson.gz)")
+    train_parser.add_argument("-o", "--output", default=os.getenv("CIRCUITY_MODEL_PATH", "config/circuity_model.json"),
+                              help="Where to write the model")
+    train_parser.add_argument("--min-samples", type=int, default=20, help="Samples a region pair and band needs to be used")
+    train_parser.add_argument("--holdout", type=float, default=0.2,
+                              help="Fraction of samples held out to report the error before training on all of them")
+    train_parser.add_argument("--seed", type=int, default=42, help="Seed for the holdout split")
+    
+    evaluate_parser = subparsers.add_parser("evaluate", help="Report the error of a model on provider routes")
+    evaluate_parser.add_argument("model", help="Model JSON")
+    evaluate_parser.add_argument("inputs", nargs="+", help="NDJSON files or glob patterns (.ndjson or .ndjson.gz)")
+    
+    for sub in (train_parser, evaluate_parser):
+        sub.add_argument("--geojson", default=os.getenv("GEOJSON_PATH", "data/editedITprov.geojson"), help="Provinces GeoJSON")
+    
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    
+    samples = load_samples(args.inputs)
+    if not samples:
+        print("No route samples found", file=sys.stderr)
+        return 1
+    geo_data = load_geo_data(args.geojson)
+    
+    if args.command == "evaluate":
+        model = CircuityModel()
+        if not model.load(args.model):
+            return 1
+        print(json.dumps(evaluate(model, samples, geo_data), indent=2))
+        return 0
+    
+    if 0 < args.holdout < 1 and len(samples) >= 10:
+        shuffled = samples[:]
+        random.Random(args.seed).shuffle(shuffled)
+        split = int(len(shuffled) * (1 - args.holdout))
+        trial = CircuityModel.train(shuffled[:split], geo_data, min_samples=args.min_samples)
+        print(f"Held-out error ({len(shuffled) - split} samples):")
+        print(json.dumps(evaluate(trial, shuffled[split:], geo_data), indent=2))
+    
+    model = CircuityModel.train(samples, geo_data, min_samples=args.min_samples)
+    model.save(args.output)
+    print(f"Wrote {args.output}: {model.stats()['pairs']} region pairs from {len(samples)} samples")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
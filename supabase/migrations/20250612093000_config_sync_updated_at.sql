@@ -0,0 +1,43 @@
+-- Track row changes so the pricing engine can sync configuration incrementally
+ALTER TABLE IF EXISTS vehicle_base_prices
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+ALTER TABLE IF EXISTS zone_multipliers
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+ALTER TABLE IF EXISTS zones
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+ALTER TABLE IF EXISTS fixed_routes
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- Bump updated_at on every update
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS vehicle_base_prices_set_updated_at ON vehicle_base_prices;
+CREATE TRIGGER vehicle_base_prices_set_updated_at
+BEFORE UPDATE ON vehicle_base_prices
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS zone_multipliers_set_updated_at ON zone_multipliers;
+CREATE TRIGGER zone_multipliers_set_updated_at
+BEFORE UPDATE ON zone_multipliers
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS zones_set_updated_at ON zones;
+CREATE TRIGGER zones_set_updated_at
+BEFORE UPDATE ON zones
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS fixed_routes_set_updated_at ON fixed_routes;
+CREATE TRIGGER fixed_routes_set_updated_at
+BEFORE UPDATE ON fixed_routes
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
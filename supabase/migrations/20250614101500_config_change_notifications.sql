@@ -0,0 +1,6 @@
+-- Publish pricing table changes over Supabase Realtime so every instance
+-- can apply them without polling
+ALTER PUBLICATION supabase_realtime ADD TABLE vehicle_base_prices;
+ALTER PUBLICATION supabase_realtime ADD TABLE zone_multipliers;
+ALTER PUBLICATION supabase_realtime ADD TABLE zones;
+ALTER PUBLICATION supabase_realtime ADD TABLE fixed_routes;
@@ -1,10 +1,37 @@
 import os
+import json
+import time
+import asyncio
+import random
+import hashlib
 import logging
-from typing import Dict, Optional, Any, List
-from supabase import create_client, Client
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Any, List, Callable, Set
+from supabase import create_client, Client, ClientOptions
+
+from metrics import CONFIG_SYNC_LATENCY
 
 logger = logging.getLogger(__name__)
 
+# Tables that make up the pricing configuration, synced incrementally
+SYNC_TABLES = ['vehicle_base_prices', 'zone_multipliers', 'zones', 'fixed_routes']
+
+# Derived configurations that depend on each table
+TABLE_CONFIGS = {
+    'vehicle_base_prices': 'vehicle_rates',
+    'zone_multipliers': 'zone_multipliers',
+    'zones': 'zone_multipliers',
+    'fixed_routes': 'fixed_prices',
+}
+
+# Maximum number of ids per "in" filter when fetching changed rows
+SYNC_FETCH_CHUNK = 100
+
+# Supabase Realtime channel used for config change notifications
+REALTIME_TOPIC = "realtime:pricing-config"
+REALTIME_HEARTBEAT_SECONDS = 25
+
 class SupabaseManager:
     _instance = None
     
@@ -18,14 +45,50 @@ class SupabaseManager:
         """Initialize Supabase client with environment variables"""
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_SERVICE_KEY")
+        # Optional direct PostgREST endpoint (e.g. a local stand-in for testing)
+        self.rest_url = os.getenv("SUPABASE_REST_URL")
+        self.sync_timeout = float(os.getenv("SUPABASE_SYNC_TIMEOUT", "10"))
         self.client = None
         
-        if not self.supabase_url or not self.supabase_key:
+        # Incremental sync state: raw rows and row versions per table
+        self._rows: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._row_versions: Dict[str, Dict[str, str]] = {}
+        self._has_updated_at: Dict[str, bool] = {}
+        self._fixed_route_cache: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._snapshot: Dict[str, Any] = {}
+        self._sync_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(SYNC_TABLES), thread_name_prefix="supabase-sync")
+        # Latest query per table, so a query still hanging is not submitted again
+        self._in_flight: Dict[str, Future] = {}
+        self._refresh_thread = None
+        self._refresh_stop = threading.Event()
+        self._subscription_thread = None
+        self._subscription_stop = threading.Event()
+        self.realtime_url = os.getenv("SUPABASE_REALTIME_URL")
+        if not self.realtime_url and self.supabase_url and not self.rest_url:
+            self.realtime_url = self.supabase_url.replace("http", "ws", 1).rstrip("/") + "/realtime/v1/websocket"
+        
+        if self.rest_url:
+            try:
+                from postgrest import SyncPostgrestClient
+                headers = {"Accept": "application/json", "Content-Type": "application/json"}
+                if self.supabase_key:
+                    headers["apikey"] = self.supabase_key
+                    headers["Authorization"] = f"Bearer {self.supabase_key}"
+                self.client = SyncPostgrestClient(self.rest_url, headers=headers, timeout=self.sync_timeout)
+                logger.info(f"PostgREST client initialized for {self.rest_url}")
+            except Exception as e:
+                logger.error(f"Failed to initialize PostgREST client: {e}")
+        elif not self.supabase_url or not self.supabase_key:
             logger.warning("Supabase credentials not found in environment variables. "
                          "Using fallback configuration instead.")
         else:
             try:
-                self.client = create_client(self.supabase_url, self.supabase_key)
+                # Bound every query: a timed out sync can't cancel a request already running
+                self.client = create_client(
+                    self.supabase_url, self.supabase_key,
+                    options=ClientOptions(postgrest_client_timeout=self.sync_timeout)
+                )
                 logger.info("Supabase client initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Supabase client: {e}")
@@ -141,35 +204,9 @@ class SupabaseManager:
             # Transform the data to match the expected format
             transformed_routes = []
             for route in response.data:
-                try:
-                    # Create a properly formatted fixed route entry
-                    fixed_route = {
-                        "name": route.get('origin_name', '') + ' to ' + route.get('destination_name', ''),
-                        "vehicle_category": route.get('vehicle_type', ''),
-                        "price": float(route.get('fixed_price', 0)),
-                        "bidirectional": True  # Default to bidirectional
-                    }
-                    
-                    # Add pickup_area and dropoff_area if they exist
-                    if 'pickup_area' in route and route['pickup_area']:
-                        fixed_route['pickup_area'] = route['pickup_area']
-                    elif 'origin_polygon' in route and route['origin_polygon']:
-                        fixed_route['pickup_area'] = route['origin_polygon']
-                    
-                    if 'dropoff_area' in route and route['dropoff_area']:
-                        fixed_route['dropoff_area'] = route['dropoff_area']
-                    elif 'destination_polygon' in route and route['destination_polygon']:
-                        fixed_route['dropoff_area'] = route['destination_polygon']
-                    
-                    # Only add routes that have both pickup and dropoff areas
-                    if 'pickup_area' in fixed_route and 'dropoff_area' in fixed_route:
-                        transformed_routes.append(fixed_route)
-                    else:
-                        logger.warning(f"Fixed route {fixed_route['name']} missing required area polygons, skipping")
-                
-                except Exception as e:
-                    logger.error(f"Error processing fixed route: {e}")
-                    continue
+                fixed_route = self._transform_fixed_route(route)
+                if fixed_route:
+                    transformed_routes.append(fixed_route)
             
             logger.info(f"Loaded {len(transformed_routes)} fixed routes from Supabase")
             return transformed_routes
@@ -178,6 +215,447 @@ class SupabaseManager:
             logger.error(f"Error fetching fixed routes from Supabase: {e}")
             return []
 
+    def _transform_fixed_route(self, route: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Transform a fixed_routes row into the format expected by the pricing engine
+        
+        Args:
+            route: Raw row from the fixed_routes table
+            
+        Returns:
+            Fixed route configuration, or None if the row is unusable
+        """
+        try:
+            # Create a properly formatted fixed route entry
+            fixed_route = {
+                "name": (route.get('origin_name') or '') + ' to ' + (route.get('destination_name') or ''),
+                "vehicle_category": route.get('vehicle_type', ''),
+                "price": float(route.get('fixed_price', 0)),
+                "bidirectional": True  # Default to bidirectional
+            }
+            
+            # Add pickup_area and dropoff_area if they exist
+            if 'pickup_area' in route and route['pickup_area']:
+                fixed_route['pickup_area'] = route['pickup_area']
+            elif 'origin_polygon' in route and route['origin_polygon']:
+                fixed_route['pickup_area'] = route['origin_polygon']
+            
+            if 'dropoff_area' in route and route['dropoff_area']:
+                fixed_route['dropoff_area'] = route['dropoff_area']
+            elif 'destination_polygon' in route and route['destination_polygon']:
+                fixed_route['dropoff_area'] = route['destination_polygon']
+            
+            # Only keep routes that have both pickup and dropoff areas
+            if 'pickup_area' in fixed_route and 'dropoff_area' in fixed_route:
+                return fixed_route
+            
+            logger.warning(f"Fixed route {fixed_route['name']} missing required area polygons, skipping")
+            return None
+        
+        except Exception as e:
+            logger.error(f"Error processing fixed route: {e}")
+            return None
+    
+    def _run_with_timeout(self, tasks: Dict[str, Callable[[], Any]], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run several Supabase queries concurrently, bounded by one overall timeout
+        
+        Args:
+            tasks: Mapping of task name to a zero-argument callable
+            timeout: Overall timeout in seconds (defaults to SUPABASE_SYNC_TIMEOUT)
+            
+        Returns:
+            Mapping of task name to result; failed or timed out tasks are omitted
+        """
+        timeout = self.sync_timeout if timeout is None else timeout
+        futures = {}
+        for name, fn in tasks.items():
+            previous = self._in_flight.get(name)
+            if previous is not None and not previous.done():
+                logger.error(f"Supabase query '{name}' from a previous sync is still running, skipping it")
+                continue
+            futures[name] = self._in_flight[name] = self._executor.submit(fn)
+        wait(futures.values(), timeout=timeout)
+        results = {}
+        
+        for name, future in futures.items():
+            if not future.done():
+                logger.error(f"Supabase query '{name}' timed out after {timeout}s")
+                future.cancel()
+                continue
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"Supabase query '{name}' failed: {e}")
+        
+        return results
+    
+    def _row_version(self, row: Dict[str, Any], has_updated_at: Optional[bool]) -> str:
+        """Version of a row: its updated_at timestamp if the table has one, otherwise a content hash"""
+        if has_updated_at and row.get('updated_at'):
+            return str(row['updated_at'])
+        return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def _execute(self, query) -> List[Dict[str, Any]]:
+        """Execute a PostgREST query and return its rows, raising on errors"""
+        response = query.execute()
+        if hasattr(response, 'error') and response.error is not None:
+            raise RuntimeError(response.error)
+        return response.data or []
+    
+    def _fetch_table_changes(self, table: str) -> Optional[Dict[str, Any]]:
+        """
+        Fetch the rows of a table that changed since the previous sync
+        
+        Tables with an updated_at column are diffed on (id, updated_at) first
+        and only the changed rows are downloaded. Tables without one are
+        downloaded in full and diffed on row hashes.
+        
+        Args:
+            table: Name of the table
+            
+        Returns:
+            Dictionary with 'changed' rows by id, 'deleted' ids, the row 'versions'
+            and whether the table 'has_updated_at' (stored by sync under its
+            lock), or None if nothing changed
+        """
+        known = self._row_versions.get(table)
+        has_updated_at = self._has_updated_at.get(table)
+        
+        if known is None or has_updated_at is False:
+            # First sync (or no updated_at column): full download
+            rows = self._execute(self.client.table(table).select('*'))
+            if rows:
+                has_updated_at = 'updated_at' in rows[0]
+            else:
+                # Nothing tells whether an empty table has the column: keep downloading in full until it has rows
+                has_updated_at = False
+            rows_by_id = {str(row.get('id', i)): row for i, row in enumerate(rows)}
+            versions = {row_id: self._row_version(row, has_updated_at) for row_id, row in rows_by_id.items()}
+            known = known or {}
+            changed = {row_id: rows_by_id[row_id] for row_id, v in versions.items() if known.get(row_id) != v}
+        else:
+            # Cheap version listing, then fetch only changed rows
+            listing = self._execute(self.client.table(table).select('id, updated_at'))
+            versions = {str(row['id']): str(row.get('updated_at')) for row in listing}
+            changed_ids = [row_id for row_id, v in versions.items() if known.get(row_id) != v]
+            changed = {}
+            for i in range(0, len(changed_ids), SYNC_FETCH_CHUNK):
+                chunk = changed_ids[i:i + SYNC_FETCH_CHUNK]
+                for row in self._execute(self.client.table(table).select('*').in_('id', chunk)):
+                    changed[str(row['id'])] = row
+        
+        deleted = [row_id for row_id in known if row_id not in versions]
+        
+        if not changed and not deleted and table in self._rows:
+            return None
+        
+        return {'changed': changed, 'deleted': deleted, 'versions': versions, 'has_updated_at': has_updated_at}
+    
+    def _build_vehicle_rates(self) -> Dict[str, float]:
+        """Build vehicle base prices from the synced rows"""
+        vehicle_prices = {}
+        for item in self._rows.get('vehicle_base_prices', {}).values():
+            vehicle_prices[item['vehicle_type']] = float(item['base_price_per_km'])
+        return vehicle_prices
+    
+    def _build_zone_multipliers(self) -> Dict[str, float]:
+        """Join synced zone_multipliers and zones rows, like get_zone_multipliers_with_codes()"""
+        zones = self._rows.get('zones', {})
+        zone_multipliers = {}
+        for item in self._rows.get('zone_multipliers', {}).values():
+            zone = zones.get(str(item.get('zone_id')), {})
+            if zone.get('prov_acr'):
+                zone_multipliers[zone['prov_acr']] = float(item['multiplier'])
+            else:
+                zone_multipliers[str(item['zone_id'])] = float(item['multiplier'])
+        
+        if zone_multipliers and 'DEFAULT' not in zone_multipliers:
+            zone_multipliers['DEFAULT'] = 1.0
+        return zone_multipliers
+    
+    def _build_fixed_prices(self, changed_ids: Set[str], deleted_ids: List[str]) -> List[Dict[str, Any]]:
+        """Rebuild the fixed routes list, transforming only rows that changed"""
+        for row_id in deleted_ids:
+            self._fixed_route_cache.pop(row_id, None)
+        for row_id in changed_ids:
+            self._fixed_route_cache[row_id] = self._transform_fixed_route(self._rows['fixed_routes'][row_id])
+        
+        return [route for row_id, route in sorted(self._fixed_route_cache.items()) if route]
+    
+    def sync(self, timeout: Optional[float] = None) -> Set[str]:
+        """
+        Incrementally sync the pricing tables from Supabase
+        
+        All tables are queried concurrently. Only rows that changed since the
+        previous sync are downloaded and only the affected configurations are
+        rebuilt. A table that fails or times out keeps its previous rows.
+        
+        Args:
+            timeout: Timeout in seconds for the table queries
+            
+        Returns:
+            Set of configuration names ('vehicle_rates', 'zone_multipliers',
+            'fixed_prices') that changed
+        """
+        if not self.client:
+            logger.warning("Supabase client not initialized. Nothing to sync.")
+            return set()
+        
+        with self._sync_lock, CONFIG_SYNC_LATENCY.time():
+            results = self._run_with_timeout(
+                {table: (lambda t=table: self._fetch_table_changes(t)) for table in SYNC_TABLES},
+                timeout
+            )
+            
+            changed_configs = set()
+            changed_fixed_ids = set()
+            deleted_fixed_ids = []
+            
+            for table, delta in results.items():
+                if delta is None:
+                    continue
+                
+                rows = self._rows.setdefault(table, {})
+                for row_id in delta['deleted']:
+                    rows.pop(row_id, None)
+                rows.update(delta['changed'])
+                self._row_versions[table] = delta['versions']
+                self._has_updated_at[table] = delta['has_updated_at']
+                changed_configs.add(TABLE_CONFIGS[table])
+                
+                if table == 'fixed_routes':
+                    changed_fixed_ids = set(delta['changed'])
+                    deleted_fixed_ids = delta['deleted']
+                
+                logger.info(f"Synced {table}: {len(delta['changed'])} changed, {len(delta['deleted'])} deleted")
+            
+            if 'vehicle_rates' in changed_configs:
+                self._snapshot['vehicle_rates'] = self._build_vehicle_rates()
+            if 'zone_multipliers' in changed_configs:
+                self._snapshot['zone_multipliers'] = self._build_zone_multipliers()
+            if 'fixed_prices' in changed_configs:
+                self._snapshot['fixed_prices'] = self._build_fixed_prices(changed_fixed_ids, deleted_fixed_ids)
+            
+            return changed_configs
+    
+    def get_synced_configs(self) -> Dict[str, Any]:
+        """
+        Return the configurations built by the last sync
+        
+        Returns:
+            Dictionary with 'vehicle_rates', 'zone_multipliers' and 'fixed_prices'
+            (missing if never synced successfully)
+        """
+        return dict(self._snapshot)
+    
+    def start_background_sync(
+        self,
+        on_change: Callable[[Set[str]], None],
+        interval: Optional[float] = None,
+        jitter: Optional[float] = None
+    ) -> bool:
+        """
+        Start a daemon thread that periodically syncs the pricing tables
+        
+        Args:
+            on_change: Called with the set of changed configuration names after each sync
+            interval: Seconds between syncs (defaults to SUPABASE_REFRESH_INTERVAL)
+            jitter: Fraction of the interval to randomize by (defaults to SUPABASE_REFRESH_JITTER)
+            
+        Returns:
+            True if the refresher was started
+        """
+        interval = float(os.getenv("SUPABASE_REFRESH_INTERVAL", "300")) if interval is None else interval
+        jitter = float(os.getenv("SUPABASE_REFRESH_JITTER", "0.2")) if jitter is None else jitter
+        
+        if not self.client or interval <= 0:
+            return False
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return True
+        
+        def run():
+            while True:
+                # Spread instances out so they don't all hit the database at once
+                delay = interval * (1 + random.uniform(-jitter, jitter))
+                if self._refresh_stop.wait(delay):
+                    break
+                try:
+                    changed = self.sync()
+                    if changed:
+                        on_change(changed)
+                except Exception as e:
+                    logger.error(f"Background config sync failed: {e}")
+        
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=run, name="supabase-refresh", daemon=True)
+        self._refresh_thread.start()
+        logger.info(f"Started background config sync every {interval}s (jitter {jitter:.0%})")
+        return True
+    
+    def stop_background_sync(self):
+        """Stop the background sync and subscription threads if they are running"""
+        self._refresh_stop.set()
+        self._subscription_stop.set()
+    
+    def apply_change(self, table: str, change_type: str, record: Optional[Dict[str, Any]], old_record: Optional[Dict[str, Any]] = None) -> Set[str]:
+        """
+        Apply a single row change notification to the synced snapshot
+        
+        Args:
+            table: Name of the changed table
+            change_type: 'INSERT', 'UPDATE' or 'DELETE'
+            record: New row (empty for deletes)
+            old_record: Previous row, or at least its primary key
+            
+        Returns:
+            Set of configuration names that changed
+        """
+        if table not in TABLE_CONFIGS:
+            return set()
+        
+        with self._sync_lock:
+            if table in self._rows:
+                return self._apply_row_change(table, change_type, record, old_record)
+        
+        # The table never synced (e.g. its first sync failed): a configuration built from
+        # this one row would replace all the others, so sync the tables in full instead
+        logger.warning(f"Change notification on {table}, which has not been synced yet; running a full sync")
+        return self.sync()
+    
+    def _apply_row_change(self, table: str, change_type: str, record: Optional[Dict[str, Any]], old_record: Optional[Dict[str, Any]]) -> Set[str]:
+        """Apply a row change to a synced table and rebuild its configuration (caller holds the sync lock)"""
+        rows = self._rows[table]
+        versions = self._row_versions.setdefault(table, {})
+        
+        if change_type == 'DELETE':
+            row_id = str((old_record or {}).get('id'))
+            if rows.pop(row_id, None) is None:
+                return set()
+            versions.pop(row_id, None)
+            changed_ids, deleted_ids = set(), [row_id]
+        else:
+            if not record or 'id' not in record:
+                return set()
+            row_id = str(record['id'])
+            if self._has_updated_at.get(table) is None:
+                self._has_updated_at[table] = 'updated_at' in record
+            rows[row_id] = record
+            versions[row_id] = self._row_version(record, self._has_updated_at.get(table))
+            changed_ids, deleted_ids = {row_id}, []
+        
+        config_name = TABLE_CONFIGS[table]
+        if config_name == 'vehicle_rates':
+            self._snapshot['vehicle_rates'] = self._build_vehicle_rates()
+        elif config_name == 'zone_multipliers':
+            self._snapshot['zone_multipliers'] = self._build_zone_multipliers()
+        else:
+            self._snapshot['fixed_prices'] = self._build_fixed_prices(changed_ids, deleted_ids)
+        
+        logger.info(f"Applied {change_type} on {table} (id={row_id}) from change notification")
+        return {config_name}
+    
+    async def _listen_for_changes(self, on_change: Callable[[Set[str]], None]):
+        """Listen on the Supabase Realtime websocket for changes to the pricing tables"""
+        import aiohttp
+        
+        url = f"{self.realtime_url}?apikey={self.supabase_key or ''}&vsn=1.0.0"
+        join = {
+            "topic": REALTIME_TOPIC,
+            "event": "phx_join",
+            "payload": {
+                "config": {
+                    "broadcast": {"self": False},
+                    "presence": {"key": ""},
+                    "postgres_changes": [
+                        {"event": "*", "schema": "public", "table": table} for table in SYNC_TABLES
+                    ]
+                },
+                "access_token": self.supabase_key
+            },
+            "ref": "1",
+            "join_ref": "1"
+        }
+        backoff = 1.0
+        
+        while not self._subscription_stop.is_set():
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.ws_connect(url, heartbeat=None) as ws:
+                        await ws.send_json(join)
+                        logger.info(f"Subscribed to config changes on {self.realtime_url}")
+                        
+                        # Catch up on anything missed while disconnected
+                        changed = await asyncio.get_running_loop().run_in_executor(None, self.sync)
+                        if changed:
+                            on_change(changed)
+                        
+                        backoff = 1.0
+                        ref = 1
+                        last_heartbeat = time.monotonic()
+                        
+                        while not self._subscription_stop.is_set():
+                            if time.monotonic() - last_heartbeat >= REALTIME_HEARTBEAT_SECONDS:
+                                ref += 1
+                                await ws.send_json({"topic": "phoenix", "event": "heartbeat", "payload": {}, "ref": str(ref)})
+                                last_heartbeat = time.monotonic()
+                            
+                            try:
+                                msg = await ws.receive(timeout=1.0)
+                            except asyncio.TimeoutError:
+                                continue
+                            
+                            if msg.type != aiohttp.WSMsgType.TEXT:
+                                if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                                    break
+                                continue
+                            
+                            message = json.loads(msg.data)
+                            if message.get("event") != "postgres_changes":
+                                continue
+                            
+                            data = message.get("payload", {}).get("data", {})
+                            # Off the event loop: a change to a table not synced yet runs a full sync
+                            changed = await asyncio.get_running_loop().run_in_executor(
+                                None, self.apply_change,
+                                data.get("table", ""), data.get("type", ""), data.get("record"), data.get("old_record")
+                            )
+                            if changed:
+                                on_change(changed)
+                
+                if not self._subscription_stop.is_set():
+                    logger.warning("Config change subscription closed, reconnecting")
+            except Exception as e:
+                logger.error(f"Config change subscription failed: {e}. Reconnecting in {backoff:.0f}s")
+            
+            await asyncio.sleep(backoff * (1 + random.uniform(0, 0.5)))
+            backoff = min(backoff * 2, 60.0)
+    
+    def start_change_subscription(self, on_change: Callable[[Set[str]], None]) -> bool:
+        """
+        Start a daemon thread that applies pushed change notifications to the snapshot
+        
+        Args:
+            on_change: Called with the set of changed configuration names after each change
+            
+        Returns:
+            True if the subscription was started
+        """
+        if not self.client or not self.realtime_url:
+            logger.warning("Realtime URL not available. Cannot subscribe to config changes.")
+            return False
+        if self._subscription_thread and self._subscription_thread.is_alive():
+            return True
+        
+        self._subscription_stop.clear()
+        self._subscription_thread = threading.Thread(
+            target=lambda: asyncio.run(self._listen_for_changes(on_change)),
+            name="supabase-subscription",
+            daemon=True
+        )
+        self._subscription_thread.start()
+        return True
+    
     def create_supabase_functions(self):
         """
         Create necessary SQL functions in the Supabase database
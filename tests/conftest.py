@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Missing config files are created under ./config on import; keep them out of the tree
+os.chdir(tempfile.mkdtemp(prefix="pricing-tests-"))
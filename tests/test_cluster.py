@@ -0,0 +1,16 @@
+from cluster import RouteCluster
+
+PEERS = ["http://10.0.0.1:8000", "http://10.0.0.2:8000"]
+
+def test_cluster_mode_requires_a_token():
+    cluster = RouteCluster(self_url=PEERS[0], peers=PEERS)
+    assert not cluster.enabled
+    assert not cluster.is_authorized(None)
+    assert not cluster.is_authorized("anything")
+
+def test_forwarded_lookups_need_the_cluster_token():
+    cluster = RouteCluster(self_url=PEERS[0], peers=PEERS, token="secret")
+    assert cluster.enabled
+    assert cluster.is_authorized("secret")
+    assert not cluster.is_authorized("wrong")
+    assert not cluster.is_authorized(None)
@@ -0,0 +1,15 @@
+from metrics import MIN_FARE_APPLIED
+
+import main
+
+def test_estimates_are_kept_out_of_quote_metrics():
+    # A short trip, priced at the minimum fare
+    request = main.PriceRequest(
+        pickup_lat=41.9028, pickup_lng=12.4964, dropoff_lat=41.91, dropoff_lng=12.5,
+        pickup_time="2026-10-20T14:00:00", trip_type="1"
+    )
+    before = MIN_FARE_APPLIED.labels().value
+    response = main.estimate_quote(request, main.generate_request_hash(request))
+    
+    assert response["prices"]
+    assert MIN_FARE_APPLIED.labels().value == before
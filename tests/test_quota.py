@@ -0,0 +1,21 @@
+from quota import QuotaManager, ProviderKey
+
+def make_manager(rps=10.0, daily=100):
+    return QuotaManager({"google_maps": [ProviderKey("google_maps", "key", 0, rps, daily, 0.005)]})
+
+def test_limits_are_split_between_processes():
+    manager = make_manager()
+    manager.set_processes(4)
+    key = manager.keys["google_maps"][0]
+    assert key.bucket.rate == 2.5
+    assert key.daily_budget == 25
+    
+    # Splitting again starts from the configured limits
+    manager.set_processes(2)
+    assert key.bucket.rate == 5.0
+    assert key.daily_budget == 50
+
+def test_split_daily_budget_is_never_unlimited():
+    manager = make_manager(daily=3)
+    manager.set_processes(8)
+    assert manager.keys["google_maps"][0].daily_budget == 1
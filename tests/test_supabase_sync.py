@@ -0,0 +1,118 @@
+import queue
+import time
+
+import pytest
+
+from benchmarks.supabase_simulator import SupabaseSimulator
+from supabase_client import SupabaseManager
+
+ROWS = {
+    "vehicle_base_prices": [
+        {"id": 1, "vehicle_type": "standard_sedan", "base_price_per_km": 2.0, "updated_at": "2025-01-01T00:00:00+00:00"},
+        {"id": 2, "vehicle_type": "premium_sedan", "base_price_per_km": 2.5, "updated_at": "2025-01-01T00:00:00+00:00"},
+        {"id": 3, "vehicle_type": "vip_sedan", "base_price_per_km": 4.0, "updated_at": "2025-01-01T00:00:00+00:00"}
+    ],
+    "zones": [{"id": "z1", "prov_acr": "RM", "updated_at": "2025-01-01T00:00:00+00:00"}],
+    "zone_multipliers": [{"id": 1, "zone_id": "z1", "multiplier": 1.2, "updated_at": "2025-01-01T00:00:00+00:00"}],
+    "fixed_routes": []
+}
+
+@pytest.fixture
+def simulator():
+    simulator = SupabaseSimulator(rows=ROWS, columns={"fixed_routes": ["id", "vehicle_type", "fixed_price", "updated_at"]}).start()
+    yield simulator
+    simulator.stop()
+
+@pytest.fixture
+def manager(simulator, monkeypatch):
+    monkeypatch.setenv("SUPABASE_REST_URL", simulator.rest_url)
+    monkeypatch.setenv("SUPABASE_REALTIME_URL", simulator.realtime_url)
+    monkeypatch.setenv("SUPABASE_SERVICE_KEY", "test-key")
+    monkeypatch.setenv("SUPABASE_SYNC_TIMEOUT", "2")
+    # A fresh manager per test instead of the process-wide singleton
+    manager = object.__new__(SupabaseManager)
+    manager._initialize()
+    yield manager
+    manager.stop_background_sync()
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_change_on_a_table_that_never_synced_runs_a_full_sync(simulator, manager):
+    simulator.failing.add("vehicle_base_prices")
+    manager.sync()
+    assert "vehicle_rates" not in manager.get_synced_configs()
+    
+    simulator.failing.clear()
+    changed = manager.apply_change(
+        "vehicle_base_prices", "UPDATE",
+        {"id": 1, "vehicle_type": "standard_sedan", "base_price_per_km": 2.2, "updated_at": "2025-02-01T00:00:00+00:00"}
+    )
+    
+    # Every category comes from the full sync, not just the pushed row
+    assert "vehicle_rates" in changed
+    assert set(manager.get_synced_configs()["vehicle_rates"]) == {"standard_sedan", "premium_sedan", "vip_sedan"}
+
+def test_change_on_a_synced_table_is_applied_to_the_snapshot(manager):
+    manager.sync()
+    changed = manager.apply_change(
+        "vehicle_base_prices", "UPDATE",
+        {"id": 2, "vehicle_type": "premium_sedan", "base_price_per_km": 3.0, "updated_at": "2025-02-01T00:00:00+00:00"}
+    )
+    assert changed == {"vehicle_rates"}
+    assert manager.get_synced_configs()["vehicle_rates"] == {"standard_sedan": 2.0, "premium_sedan": 3.0, "vip_sedan": 4.0}
+    
+    assert manager.apply_change("vehicle_base_prices", "DELETE", {}, {"id": 3}) == {"vehicle_rates"}
+    assert "vip_sedan" not in manager.get_synced_configs()["vehicle_rates"]
+
+def test_subscription_applies_pushed_changes(simulator, manager):
+    manager.sync()
+    changes = queue.Queue()
+    assert manager.start_change_subscription(changes.put)
+    assert wait_for(lambda: simulator._subscribers)
+    
+    simulator.upsert("zone_multipliers", {"id": 1, "zone_id": "z1", "multiplier": 1.5})
+    assert changes.get(timeout=10) == {"zone_multipliers"}
+    assert manager.get_synced_configs()["zone_multipliers"]["RM"] == 1.5
+    
+    simulator.delete("vehicle_base_prices", 3)
+    assert changes.get(timeout=10) == {"vehicle_rates"}
+    assert "vip_sedan" not in manager.get_synced_configs()["vehicle_rates"]
+
+def test_hanging_table_query_is_not_submitted_again(simulator, manager):
+    simulator.delays["fixed_routes"] = 1.0
+    manager.sync(timeout=0.3)
+    assert "fixed_prices" not in manager.get_synced_configs()
+    assert "vehicle_rates" in manager.get_synced_configs()
+    
+    # The first query of the table still holds its executor thread
+    manager.sync(timeout=0.3)
+    assert simulator.requests["fixed_routes"] == 1
+    
+    assert wait_for(lambda: manager._in_flight["fixed_routes"].done())
+    simulator.delays.clear()
+    manager.sync(timeout=2)
+    assert simulator.requests["fixed_routes"] == 2
+
+def test_table_without_updated_at_that_starts_empty_picks_up_new_rows(manager, monkeypatch):
+    simulator = SupabaseSimulator(columns={
+        "vehicle_base_prices": ["id", "vehicle_type", "base_price_per_km"],
+        "zones": ["id", "prov_acr"],
+        "zone_multipliers": ["id", "zone_id", "multiplier"],
+        "fixed_routes": ["id"]
+    }).start()
+    try:
+        monkeypatch.setenv("SUPABASE_REST_URL", simulator.rest_url)
+        manager._initialize()
+        manager.sync()
+        
+        simulator.upsert("vehicle_base_prices", {"id": 1, "vehicle_type": "standard_sedan", "base_price_per_km": 2.0})
+        assert "vehicle_rates" in manager.sync()
+        assert manager.get_synced_configs()["vehicle_rates"] == {"standard_sedan": 2.0}
+    finally:
+        simulator.stop()
@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+
+import main
+
+# Rome to Milan, long enough for the minimum fare not to apply
+TRIP = {
+    "pickup_lat": 41.9028,
+    "pickup_lng": 12.4964,
+    "dropoff_lat": 45.4642,
+    "dropoff_lng": 9.19,
+    "trip_type": "1"
+}
+
+def test_same_day_quotes_in_different_time_bands(monkeypatch):
+    conf = main.get_config()
+    monkeypatch.setattr(conf, "time_multipliers", {"night": 1.5, "night_hours": [22, 6]})
+    category = next(iter(conf.vehicle_rates))
+    client = TestClient(main.app)
+    
+    day = client.post("/check-price", json={**TRIP, "vehicle_category": category, "pickup_time": "2026-10-20T14:00:00"})
+    night = client.post("/check-price", json={**TRIP, "vehicle_category": category, "pickup_time": "2026-10-20T23:30:00"})
+    assert day.status_code == 200 and night.status_code == 200
+    
+    day_price = day.json()["prices"][0]["raw_price"]
+    night_price = night.json()["prices"][0]["raw_price"]
+    assert day.json()["details"]["request_id"] != night.json()["details"]["request_id"]
+    assert night_price == round(day_price * 1.5, 2)
+
+def test_quotes_in_the_same_hour_share_a_cache_key(monkeypatch):
+    conf = main.get_config()
+    monkeypatch.setattr(conf, "time_multipliers", {"night": 1.5})
+    request = main.PriceRequest(**TRIP, pickup_time="2026-10-20T23:05:00")
+    same_hour = main.PriceRequest(**TRIP, pickup_time="2026-10-20T23:55:00")
+    assert main.generate_request_hash(request) == main.generate_request_hash(same_hour)
+    
+    # Without time-based pricing quotes are still shared over the whole day
+    monkeypatch.setattr(conf, "time_multipliers", {})
+    earlier = main.PriceRequest(**TRIP, pickup_time="2026-10-20T09:00:00")
+    assert main.generate_request_hash(request) == main.generate_request_hash(earlier)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from rtree import index
+from shapely.geometry import box
+
+import geo_utils
+
+def make_geo_data(zones):
+    provinces = {code: {'geometry': geometry, 'code': code} for code, geometry in zones.items()}
+    rtree_idx = index.Index((i, zone['geometry'].bounds, zone_id) for i, (zone_id, zone) in enumerate(provinces.items()))
+    adjacency, overlaps = geo_utils.build_zone_adjacency(provinces, rtree_idx)
+    return {'provinces': provinces, 'rtree': rtree_idx, 'adjacency': adjacency, 'overlaps': overlaps}
+
+@pytest.fixture
+def chord_geo_data():
+    # A and D share a border; X touches neither, and lies on the chord from A to D
+    return make_geo_data({
+        'A': box(12.0, 42.0, 12.1, 42.3),
+        'D': box(12.1, 42.0, 12.3, 42.1),
+        'X': box(12.15, 42.15, 12.25, 42.25)
+    })
+
+# (latitude, longitude) points: a short segment inside A, then a long chord to D through X
+CHORD = np.array([[42.295, 12.045], [42.29, 12.05], [42.01, 12.29]])
+
+def test_sticky_traversal_finds_provinces_not_adjacent_to_the_current_one(chord_geo_data, monkeypatch):
+    monkeypatch.setattr(geo_utils, "ZONE_TRAVERSAL", "index")
+    expected = geo_utils.determine_zones_crossed(CHORD, chord_geo_data)
+    monkeypatch.setattr(geo_utils, "ZONE_TRAVERSAL", "sticky")
+    zones = geo_utils.determine_zones_crossed(CHORD, chord_geo_data)
+    
+    assert set(zones) == {'A', 'X', 'D'}
+    assert zones == pytest.approx(expected)